@@ -0,0 +1,292 @@
+"""
+Append-only activity log of the dashboard (the audit trail behind Recent Activity)
+
+Every write made through storage becomes one compact event: a lead created,
+edited, assigned or deleted, a batch imported or reassigned, a user created,
+edited or deleted, plus logins and logouts recorded by auth. An event is a line
+of JSON with the time, the acting user (set per script run with set_actor), the
+action, the record id and a few details.
+
+The log is partitioned by time into one file per day (or hour, with
+ACTIVITY_PARTITION=hour) under ACTIVITY_LOG_DIR. Partitions older than
+ACTIVITY_RETENTION_DAYS are deleted when a new partition is started, so the log
+stays bounded. recent_activity reads the newest partitions backwards block by
+block, so the last N events cost O(N) regardless of the log's size.
+
+Lead and user events are worked out by shared_cache views, which see each record
+before and after the write; writes made while the collections aren't cached are
+logged from what was stored alone.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import storage
+import shared_cache
+
+ACTIVITY_LOG_DIR = os.environ.get("ACTIVITY_LOG_DIR", os.path.join("data", "activity"))
+ACTIVITY_PARTITION = os.environ.get("ACTIVITY_PARTITION", "day")
+ACTIVITY_RETENTION_DAYS = int(os.environ.get("ACTIVITY_RETENTION_DAYS", "90"))
+
+# Partition -> strftime pattern of its file names (which sort in time order)
+PARTITIONS = {
+    "day": "%Y-%m-%d",
+    "hour": "%Y-%m-%dT%H",
+}
+
+# Bytes read at a time when reading a partition backwards
+_BLOCK_SIZE = 64 * 1024
+
+_write_lock = threading.Lock()
+_current_partition = None
+_local = threading.local()  # actor, and the lead changes of the write being applied
+_users_by_id = None         # the cached users, to tell a new user from an edited one
+
+def set_actor(username):
+    """Set the user the events of the current thread (a script run) are recorded for"""
+    _local.actor = username
+
+def get_actor():
+    """Get the user events of the current thread are recorded for (system if not set)"""
+    return getattr(_local, "actor", None) or "system"
+
+def _partition_name(when):
+    return when.strftime(PARTITIONS.get(ACTIVITY_PARTITION, PARTITIONS["day"]))
+
+def _partitions():
+    """Get the partition file names, oldest first"""
+    try:
+        names = os.listdir(ACTIVITY_LOG_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if name.endswith(".jsonl"))
+
+def prune(now=None):
+    """Delete the partitions older than ACTIVITY_RETENTION_DAYS"""
+    cutoff = _partition_name((now or datetime.now()) - timedelta(days=ACTIVITY_RETENTION_DAYS))
+    for name in _partitions():
+        if name[:-len(".jsonl")] >= cutoff:
+            break
+        try:
+            os.remove(os.path.join(ACTIVITY_LOG_DIR, name))
+        except FileNotFoundError:
+            pass
+
+def record(action, target=None, user=None, when=None, **details):
+    """
+    Append an event to the activity log
+
+    Args:
+        action (str): What happened, e.g. "lead_created" or "login"
+        target: Id of the record it happened to, if any
+        user (str): Who did it (default: the current thread's actor)
+        when (datetime): When it happened (default: now)
+        **details: Further fields of the event (None values are left out)
+    """
+    global _current_partition
+
+    when = when or datetime.now()
+    event = {"time": when.strftime("%Y-%m-%d %H:%M:%S"), "user": user or get_actor(), "action": action}
+    if target is not None:
+        event["id"] = target
+    event.update((key, value) for key, value in details.items() if value is not None)
+    line = json.dumps(event, separators=(",", ":"), default=str) + "\n"
+
+    partition = _partition_name(when)
+    with _write_lock:
+        if partition != _current_partition:
+            # A new partition was started: this is when old ones expire
+            os.makedirs(ACTIVITY_LOG_DIR, exist_ok=True)
+            prune(when)
+            _current_partition = partition
+        with open(os.path.join(ACTIVITY_LOG_DIR, partition + ".jsonl"), "a", encoding="utf-8") as f:
+            f.write(line)
+
+def _read_backwards(path):
+    """Yield the lines of a file from the last to the first, reading it a block at a time"""
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        rest = b""
+        while position > 0:
+            size = min(_BLOCK_SIZE, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + rest).split(b"\n")
+            # The first line may continue in the previous block
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if rest.strip():
+            yield rest
+
+def recent_activity(limit=20, user=None):
+    """
+    Get the latest events, newest first
+
+    Args:
+        limit (int): Number of events to return
+        user (str): Only events of this user (default: all)
+
+    Returns:
+        list: Event dicts with time, user, action and the event's details
+    """
+    events = []
+    for name in reversed(_partitions()):
+        try:
+            lines = _read_backwards(os.path.join(ACTIVITY_LOG_DIR, name))
+            for line in lines:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+                if user is None or event.get("user") == user:
+                    events.append(event)
+                    if len(events) == limit:
+                        return events
+        except FileNotFoundError:
+            # Pruned while being read
+            continue
+    return events
+
+def describe(event):
+    """Get a one-line description of an event for the activity feed"""
+    action = event.get("action", "")
+    target = event.get("id")
+    name = f" ({event['name']})" if event.get("name") else ""
+    if action == "lead_created":
+        assigned = event.get("to") not in (None, "Unassigned")
+        return f"Created lead #{target}{name}" + (f", assigned to {event['to']}" if assigned else "")
+    if action == "lead_assigned":
+        return f"Assigned lead #{target}{name} to {event.get('to')}" + (
+            f" (was {event['from']})" if event.get("from") else "")
+    fields = f": {', '.join(event['fields'])}" if event.get("fields") else ""
+    if action == "lead_updated":
+        return f"Updated lead #{target}{name}{fields}"
+    if action == "lead_deleted":
+        return f"Deleted lead #{target}{name}"
+    if action == "leads_imported":
+        return f"Imported {event.get('count', 0):,} leads (#{event.get('first')} to #{event.get('last')})"
+    if action == "leads_assigned":
+        return f"Assigned {event.get('count', 0):,} leads to {event.get('to')}"
+    if action == "leads_updated":
+        return f"Updated {event.get('count', 0):,} leads"
+    if action == "leads_replaced":
+        return f"Replaced all leads ({event.get('count', 0):,})"
+    if action == "user_created":
+        return f"Created user {event.get('username')}"
+    if action == "user_updated":
+        return f"Updated user {event.get('username')}{fields}"
+    if action == "user_deleted":
+        return f"Deleted user #{target}"
+    if action == "users_replaced":
+        return f"Replaced all users ({event.get('count', 0):,})"
+    if action == "login":
+        return "Logged in"
+    if action == "logout":
+        return "Logged out"
+    return action.replace("_", " ").capitalize()
+
+def _changed_fields(old, new):
+    return sorted(
+        field for field in set(old) | set(new)
+        if field != "version" and field not in storage.LEAD_LIFECYCLE_FIELDS and old.get(field) != new.get(field)
+    )
+
+def _lead_change(old, new):
+    """Classify the change of one lead as an event (action, id, details), or None if nothing changed"""
+    if old is None:
+        return "lead_created", new["id"], {"name": new.get("name"), "to": new.get("assigned_to")}
+    if new is None:
+        return "lead_deleted", old["id"], {"name": old.get("name")}
+    fields = _changed_fields(old, new)
+    if not fields:
+        return None
+    if "assigned_to" in fields:
+        others = [field for field in fields if field != "assigned_to"]
+        return "lead_assigned", new["id"], {
+            "name": new.get("name"), "from": old.get("assigned_to"), "to": new.get("assigned_to"),
+            "fields": others or None,
+        }
+    return "lead_updated", new["id"], {"name": new.get("name"), "fields": fields}
+
+def _pending_changes():
+    changes = getattr(_local, "changes", None)
+    if changes is None:
+        changes = _local.changes = []
+    return changes
+
+def _on_lead_change(old, new):
+    """shared_cache view: note the lead's change for the write being applied"""
+    _pending_changes().append((old, new))
+
+def _ignore_reload(leads):
+    # A reload isn't a change of ours; leads changed by other processes are logged there
+    pass
+
+def _on_users_change(users):
+    """shared_cache user view: keep the users by id, and the ones before this change"""
+    global _users_by_id
+    _local.previous_users = _users_by_id
+    _users_by_id = {user["id"]: user for user in users}
+
+def _log_batch(event, leads, changes):
+    """Log a batch write (insert_leads/update_leads) as one event"""
+    if not leads:
+        return
+    ids = [lead["id"] for lead in leads]
+    span = {"count": len(leads), "first": min(ids), "last": max(ids)}
+    if event == "insert_leads":
+        record("leads_imported", **span)
+        return
+    owners = {lead.get("assigned_to") for lead in leads}
+    moved = [change for change in changes if change[0] is not None and change[1] is not None
+             and change[0].get("assigned_to") != change[1].get("assigned_to")]
+    if len(owners) == 1 and (moved or not changes):
+        record("leads_assigned", to=owners.pop(), **span)
+    else:
+        record("leads_updated", **span)
+
+def _on_storage_write(event, payload):
+    """Turn a write made through storage into an event (runs after shared_cache applied it)"""
+    changes = getattr(_local, "changes", None) or []
+    _local.changes = []
+
+    if event == "upsert_lead":
+        if changes:
+            change = _lead_change(*changes[-1])
+        elif (payload.get("version") or 1) <= 1:
+            change = _lead_change(None, payload)
+        else:
+            change = "lead_updated", payload["id"], {"name": payload.get("name")}
+        if change is not None:
+            action, target, details = change
+            record(action, target, **details)
+    elif event in ("insert_leads", "update_leads"):
+        _log_batch(event, payload, changes)
+    elif event == "delete_lead":
+        old = changes[-1][0] if changes else None
+        record("lead_deleted", payload, name=old.get("name") if old else None)
+    elif event == "save_leads":
+        record("leads_replaced", count=len(payload))
+    elif event == "upsert_user":
+        previous = getattr(_local, "previous_users", None)
+        _local.previous_users = None
+        old = previous.get(payload["id"]) if previous is not None else None
+        if old is None and (previous is not None or (payload.get("version") or 1) <= 1):
+            record("user_created", payload["id"], username=payload.get("username"))
+        else:
+            fields = _changed_fields(old, payload) if old is not None else None
+            if fields != []:
+                record("user_updated", payload["id"], username=payload.get("username"), fields=fields)
+    elif event == "delete_user":
+        record("user_deleted", payload)
+    elif event == "save_users":
+        record("users_replaced", count=len(payload))
+    # update_users_last_login is the deferred write of logins auth already recorded
+
+shared_cache.register_view(_ignore_reload, _on_lead_change)
+shared_cache.register_user_view(_on_users_change)
+storage.add_listener(_on_storage_write)
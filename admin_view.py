@@ -1,24 +1,51 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime, timedelta
 import os
 import json
 from pathlib import Path
-import local_db as db
-import random
+import storage as db
+import shared_cache
+import credentials
+import lead_index
+import lead_export
+import lead_import
+import lead_router
+import lead_analytics
+import kpi
+import activity_log
+import search_index
+import charts
+import chart_cache
 from auth import logout_user, get_user_info
-from data import load_data, get_filtered_data
+from views import edit_base_version, forget_edit_base, conflict_notification, lead_pager, lead_picker, LEAD_PICKER_BATCH
+
+# Number of search results shown on the Leads page
+SEARCH_RESULTS_LIMIT = 100
+
+# "Assigned To" option that routes a new lead with lead_router
+AUTO_ASSIGN = "Auto-assign"
+
+# Widgets of the edit forms, reset after a save so they show the stored record again
+QUICK_EDIT_WIDGETS = [
+    "quick_edit_name", "quick_edit_phone", "quick_edit_sector", "quick_edit_city",
+    "quick_edit_monthly_bill", "quick_edit_required_system", "quick_edit_source",
+    "quick_edit_system_type", "quick_edit_status", "quick_edit_assigned_to",
+    "quick_edit_customer_code", "quick_edit_remarks",
+]
+EDIT_LEAD_WIDGETS = [
+    "edit_lead_name", "edit_phone", "edit_sector", "edit_city", "edit_monthly_bill",
+    "edit_required_system", "edit_source", "edit_system_type", "edit_status",
+    "edit_assigned_to", "edit_customer_code", "edit_remarks",
+]
+EDIT_USER_WIDGETS = [
+    "edit_user_username", "edit_user_name", "edit_user_email", "edit_user_role",
+    "edit_user_status", "edit_user_password",
+]
 
 # Initialize session state for leads if it doesn't exist
 if 'leads' not in st.session_state:
-    st.session_state.leads = db.load_leads()
-    
-# Initialize next lead ID if it doesn't exist
-if 'next_lead_id' not in st.session_state:
-    st.session_state.next_lead_id = db.get_next_lead_id()
+    st.session_state.leads = shared_cache.get_leads()
     
 # Initialize form_submit_success flag if it doesn't exist
 if 'form_submit_success' not in st.session_state:
@@ -26,7 +53,7 @@ if 'form_submit_success' not in st.session_state:
 
 # Initialize users list if it doesn't exist
 if 'users' not in st.session_state:
-    st.session_state.users = db.load_users()
+    st.session_state.users = shared_cache.get_users()
 
 def admin_view():
     """Admin dashboard view with full access to all data and analytics"""
@@ -64,6 +91,13 @@ def admin_view():
         logout_user()
         st.rerun()
     
+    # Shared data cache statistics (misses are full reloads from storage or re-rendered charts)
+    with st.sidebar.expander("Cache Statistics"):
+        st.caption("Leads and users")
+        st.json(shared_cache.get_stats())
+        st.caption("Chart images")
+        st.json(chart_cache.get_stats())
+    
     # Dashboard Overview page
     if page == "Dashboard Overview":
         show_dashboard_overview()
@@ -84,18 +118,16 @@ def show_dashboard_overview():
     """Show dashboard overview with key metrics and charts"""
     st.header("Dashboard Overview")
     
-    # Get actual leads data from session state
-    leads = st.session_state.leads
-    leads_df = pd.DataFrame(leads) if leads else pd.DataFrame()
+    # KPI counters kept up to date lead by lead (kpi), not recounted on every rerun
+    kpis = kpi.get_kpis()
     
     # Create top-level metrics
     st.subheader("Key Performance Indicators")
     col1, col2, col3 = st.columns(3)
     
-    # Calculate KPIs
-    total_leads = len(leads) if leads else 0
-    won_leads = len([lead for lead in leads if lead.get("status") == "Won"]) if leads else 0
-    conversion_rate = (won_leads / total_leads * 100) if total_leads > 0 else 0
+    total_leads = kpis["total"]
+    won_leads = kpis["won"]
+    conversion_rate = kpis["conversion_rate"]
     
     # Display KPIs
     col1.metric(
@@ -120,136 +152,106 @@ def show_dashboard_overview():
     
     with chart1:
         st.markdown("### Lead Status Distribution")
-        if leads:
+        if total_leads:
             # Create status distribution
-            status_counts = pd.DataFrame(leads).groupby('status').size().reset_index()
-            status_counts.columns = ['Status', 'Count']
-            
-            # Create a bar chart
-            fig = plt.figure(figsize=(10, 6))
-            plt.barh(status_counts['Status'], status_counts['Count'])
-            plt.title('Lead Status Distribution')
-            plt.xlabel('Number of Leads')
+            status_counts = pd.DataFrame(sorted(kpis["status"].items()), columns=['Status', 'Count'])
             
-            # Customize colors based on status
+            # Create a bar chart, with colors based on status
             colors = ['#FFA500', '#FFD700', '#32CD32', '#FF6B6B', '#4169E1']
-            plt.barh(status_counts['Status'], status_counts['Count'], color=colors[:len(status_counts)])
-            
-            st.pyplot(fig)
-            plt.close()
+            charts.barh_chart(
+                status_counts, 'Status', 'Count', 'Lead Status Distribution', 'Number of Leads',
+                colors=colors[:len(status_counts)]
+            )
+    
+    # Leads assigned and won per rep (Unassigned included), from the counters
+    sales_metrics = pd.DataFrame(
+        [(rep, counts["assigned"], counts["won"]) for rep, counts in sorted(kpis["reps"].items())],
+        columns=['Sales Rep', 'Assigned', 'Closed']
+    )
+    sales_metrics['Conversion Rate'] = (sales_metrics['Closed'] / sales_metrics['Assigned'] * 100).round(1)
     
     with chart2:
         st.markdown("### Sales Team Performance")
-        if leads:
-            sales_performance = pd.DataFrame(leads)
-            if 'assigned_to' in sales_performance.columns:
-                sales_stats = sales_performance.groupby('assigned_to').agg({
-                    'id': 'count',
-                    'status': lambda x: sum(x == 'Won')
-                }).reset_index()
-                
-                sales_stats.columns = ['Sales Rep', 'Total Leads', 'Won Deals']
-                sales_stats['Success Rate'] = (sales_stats['Won Deals'] / sales_stats['Total Leads'] * 100).round(1)
-                st.dataframe(sales_stats.style.highlight_max(axis=0, color='#90EE90'))
+        if not sales_metrics.empty:
+            sales_stats = sales_metrics.rename(
+                columns={'Assigned': 'Total Leads', 'Closed': 'Won Deals', 'Conversion Rate': 'Success Rate'}
+            )
+            st.dataframe(sales_stats.style.highlight_max(axis=0, color='#90EE90'))
     
     # Sales Performance Analysis
     st.subheader("Sales Team Performance Analysis")
-    if leads:
-        sales_df = pd.DataFrame(leads)
-        if 'assigned_to' in sales_df.columns:
+    if total_leads:
+        if not sales_metrics.empty:
             # Create three columns for different metrics
             metric_col1, metric_col2 = st.columns(2)
             
             with metric_col1:
                 st.markdown("### Lead Assignment vs Closure Rate")
-                # Calculate leads assigned and closed for each sales rep
-                sales_metrics = sales_df.groupby('assigned_to').agg({
-                    'id': 'count',  # Total leads assigned
-                    'status': lambda x: sum(x == 'Won')  # Leads closed/won
-                }).reset_index()
-                
-                sales_metrics.columns = ['Sales Rep', 'Assigned', 'Closed']
-                sales_metrics['Conversion Rate'] = (sales_metrics['Closed'] / sales_metrics['Assigned'] * 100).round(1)
                 
                 # Create a bar chart comparing assigned vs closed leads
-                fig = plt.figure(figsize=(10, 6))
-                x = range(len(sales_metrics['Sales Rep']))
-                width = 0.35
-                
-                plt.bar(x, sales_metrics['Assigned'], width, label='Assigned', color='#FFA500')
-                plt.bar([i + width for i in x], sales_metrics['Closed'], width, label='Closed', color='#32CD32')
-                
-                plt.xlabel('Sales Representatives')
-                plt.ylabel('Number of Leads')
-                plt.title('Lead Assignment vs Closure by Sales Rep')
-                plt.xticks([i + width/2 for i in x], sales_metrics['Sales Rep'], rotation=45)
-                plt.legend()
-                
-                st.pyplot(fig)
-                plt.close()
+                charts.grouped_bar_chart(
+                    sales_metrics, 'Sales Rep',
+                    [('Assigned', 'Assigned', '#FFA500'), ('Closed', 'Closed', '#32CD32')],
+                    'Lead Assignment vs Closure by Sales Rep', 'Sales Representatives', 'Number of Leads'
+                )
             
             with metric_col2:
                 st.markdown("### Conversion Rate by Sales Rep")
-                # Create a horizontal bar chart for conversion rates
-                fig = plt.figure(figsize=(10, 6))
-                plt.barh(sales_metrics['Sales Rep'], sales_metrics['Conversion Rate'])
-                plt.xlabel('Conversion Rate (%)')
-                plt.title('Lead Conversion Rate by Sales Rep')
-                
-                # Add percentage labels on the bars
-                for i, v in enumerate(sales_metrics['Conversion Rate']):
-                    plt.text(v, i, f'{v}%', va='center')
-                
-                st.pyplot(fig)
-                plt.close()
+                # Create a horizontal bar chart for conversion rates, with percentage labels
+                charts.barh_chart(
+                    sales_metrics, 'Sales Rep', 'Conversion Rate', 'Lead Conversion Rate by Sales Rep',
+                    'Conversion Rate (%)', value_format='{}%'
+                )
             
             # Average Time to Close Analysis
             st.markdown("### Average Time to Close Analysis")
-            if 'created_at' in sales_df.columns and 'closed_at' in sales_df.columns:
-                # Convert datetime columns
-                sales_df['created_at'] = pd.to_datetime(sales_df['created_at'])
-                sales_df['closed_at'] = pd.to_datetime(sales_df['closed_at'])
-                
-                # Calculate time to close for won leads
-                won_leads = sales_df[sales_df['status'] == 'Won'].copy()
-                won_leads['time_to_close'] = (won_leads['closed_at'] - won_leads['created_at']).dt.days
+            # Kept up to date lead by lead by lead_analytics, not recomputed here
+            time_stats = lead_analytics.time_to_close_by_rep("Won")
+            if time_stats:
+                time_metrics = pd.DataFrame([
+                    {
+                        "assigned_to": rep, "avg_days": stats["mean"], "median_days": stats["p50"],
+                        "p90_days": stats["p90"], "min_days": stats["min"], "max_days": stats["max"],
+                    }
+                    for rep, stats in time_stats.items()
+                ]).round(1)
                 
-                # Group by sales rep and calculate average time to close
-                time_metrics = won_leads.groupby('assigned_to')['time_to_close'].agg([
-                    ('avg_days', 'mean'),
-                    ('min_days', 'min'),
-                    ('max_days', 'max')
-                ]).round(1).reset_index()
-                
-                # Create a column chart for average time to close
-                fig = plt.figure(figsize=(10, 6))
-                plt.bar(time_metrics['assigned_to'], time_metrics['avg_days'], color='#4169E1')
-                plt.xlabel('Sales Representatives')
-                plt.ylabel('Average Days to Close')
-                plt.title('Average Time to Close by Sales Rep')
-                plt.xticks(rotation=45)
-                
-                # Add average days labels on top of bars
-                for i, v in enumerate(time_metrics['avg_days']):
-                    plt.text(i, v, f'{v:.1f}d', ha='center', va='bottom')
-                
-                st.pyplot(fig)
-                plt.close()
+                # Create a column chart for average time to close, with average days on top of bars
+                charts.bar_chart(
+                    time_metrics, 'assigned_to', 'avg_days', 'Average Time to Close by Sales Rep',
+                    'Sales Representatives', 'Average Days to Close', color='#4169E1', value_format='{:.1f}d',
+                    figsize=(10, 6)
+                )
                 
                 # Display detailed metrics table
                 st.markdown("### Detailed Performance Metrics")
                 metrics_table = pd.merge(sales_metrics, time_metrics, left_on='Sales Rep', right_on='assigned_to')
                 metrics_table = metrics_table[['Sales Rep', 'Assigned', 'Closed', 'Conversion Rate', 
-                                             'avg_days', 'min_days', 'max_days']]
+                                             'avg_days', 'median_days', 'p90_days', 'min_days', 'max_days']]
                 metrics_table.columns = ['Sales Rep', 'Total Leads', 'Won Deals', 'Success Rate (%)', 
-                                       'Avg Days to Close', 'Min Days', 'Max Days']
+                                       'Avg Days to Close', 'Median Days', '90th Percentile Days', 'Min Days', 'Max Days']
                 st.dataframe(metrics_table.style.highlight_max(axis=0, color='#90EE90'))
+            else:
+                st.info("No deals have been won since lead status changes are recorded.")
+            
+            # How long leads wait in each status before they move on
+            status_stats = lead_analytics.time_in_status()
+            if status_stats:
+                st.markdown("### Time in Status")
+                status_table = pd.DataFrame([
+                    {
+                        "Status": status, "Leads Moved On": stats["count"], "Avg Days": stats["mean"],
+                        "Median Days": stats["p50"], "90th Percentile Days": stats["p90"],
+                    }
+                    for status, stats in status_stats.items()
+                ]).round(1)
+                st.dataframe(status_table, use_container_width=True, hide_index=True)
     
     # Add follow-up reminders if any leads are pending follow-up
-    pending_followup = [lead for lead in leads if lead.get('status') == 'Follow Up']
-    if pending_followup:
+    if kpis["status"].get('Follow Up'):
+        pending_followup, _ = lead_index.page_leads({"status": "Follow Up"}, limit=3)
         st.subheader("⚠️ Follow-up Reminders")
-        for lead in pending_followup[:3]:  # Show top 3 follow-ups
+        for lead in pending_followup:  # Show top 3 follow-ups
             st.warning(
                 f"Follow up required for {lead.get('customer_name', 'N/A')} - "
                 f"Last contact: {lead.get('last_contact_date', 'Not available')}"
@@ -258,67 +260,56 @@ def show_dashboard_overview():
     
     with col1:
         st.subheader("Lead Sources")
-        if not leads_df.empty and "source" in leads_df.columns:
-            # Get actual lead sources data
-            source_counts = leads_df["source"].value_counts()
-            sources = source_counts.index.tolist()
-            values = source_counts.values.tolist()
+        if kpis["source"]:
+            # Get actual lead sources data, most common first
+            source_counts = pd.DataFrame(
+                sorted(kpis["source"].items(), key=lambda item: -item[1]), columns=["source", "count"]
+            )
             
-            fig, ax = plt.subplots(figsize=(8, 8))
-            ax.pie(values, labels=sources, autopct='%1.1f%%', startangle=90)
-            ax.axis('equal')
-            st.pyplot(fig)
+            charts.pie_chart(source_counts, "source", "count")
         else:
             st.info("No lead source data available yet.")
     
     with col2:
         st.subheader("Lead Status")
-        if not leads_df.empty and "status" in leads_df.columns:
-            # Get actual lead status data
-            status_counts = leads_df["status"].value_counts()
-            statuses = status_counts.index.tolist()
-            counts = status_counts.values.tolist()
+        if kpis["status"]:
+            # Get actual lead status data, most common first
+            status_counts = pd.DataFrame(
+                sorted(kpis["status"].items(), key=lambda item: -item[1]), columns=["status", "count"]
+            )
             
-            fig, ax = plt.subplots(figsize=(8, 8))
-            sns.barplot(x=statuses, y=counts, ax=ax)
-            ax.set_title("Leads by Status")
-            ax.set_xlabel("Status")
-            ax.set_ylabel("Count")
-            plt.xticks(rotation=45)
-            st.pyplot(fig)
+            charts.bar_chart(status_counts, "status", "count", "Leads by Status", "Status", "Count", figsize=(8, 8))
         else:
             st.info("No lead status data available yet.")
     
-    # Recent activity - generate based on actual leads
+    # Recent activity from the activity log
     st.subheader("Recent Activity")
     
-    # Generate activity data based on most recent leads
-    activities = []
-    
-    # Sort leads by creation date if available, otherwise use the first 5
-    recent_leads = sorted(leads, key=lambda x: x.get("created_at", ""), reverse=True)[:5] if leads else []
-    
-    for i, lead in enumerate(recent_leads):
-        # Create a timestamp (use current time minus random minutes for demo)
-        timestamp = (datetime.now() - timedelta(minutes=random.randint(10, 300))).strftime("%Y-%m-%d %H:%M")
-        user = lead.get("assigned_to", "Unassigned")
-        action = f"Created new lead: {lead.get('name', 'Unknown')}"
-        
-        activities.append({
-            "timestamp": timestamp,
-            "user": user,
-            "action": action
-        })
+    # The latest events of the activity log (read from its end, not scanned)
+    activities = [
+        {"timestamp": event["time"], "user": event.get("user", ""), "action": activity_log.describe(event)}
+        for event in activity_log.recent_activity(limit=20)
+    ]
     
     if activities:
-        activity_df = pd.DataFrame(activities)
-        st.dataframe(activity_df, use_container_width=True)
+        st.dataframe(pd.DataFrame(activities), use_container_width=True, hide_index=True)
     else:
         st.info("No recent activity available yet.")
+    
+    # Recount the leads in storage to verify the KPI counters shown above
+    with st.expander("KPI Counter Check"):
+        st.caption("Recounts every lead in storage and compares the result with the KPI counters.")
+        if st.button("Verify KPI Counters", key="kpi_check_btn"):
+            differences = kpi.check_consistency(repair=True)
+            if differences:
+                st.warning(f"{len(differences)} counters differed from storage and were recounted")
+                st.dataframe(pd.DataFrame(differences, columns=["Difference"]), hide_index=True)
+            else:
+                st.success("The KPI counters match storage.")
 
 def get_sales_users_list():
     """Get a list of sales users for dropdowns"""
-    users = db.load_users()
+    users = shared_cache.get_users()
     # Start with Unassigned option
     user_list = ["Unassigned"]
     # Add active users with sales role
@@ -379,37 +370,43 @@ def show_leads():
         key="leads_date_range"
     )
     
-    # Get leads from session state
-    leads = st.session_state.leads
+    # Look up the matching leads in the lead index ("All" means no filter on that field)
+    filters = {
+        "status": status_filter,
+        "source": source_filter,
+        "city": city_filter,
+        "assigned_to": assigned_filter
+    }
     
-    leads_df = pd.DataFrame(leads)
+    if len(date_range) >= 2:
+        filters["date_from"] = date_range[0].strftime("%Y-%m-%d")
+        filters["date_to"] = date_range[1].strftime("%Y-%m-%d")
     
-    # Apply filters
-    filtered_df = leads_df.copy() if not leads_df.empty else pd.DataFrame()
+    # Search the leads matching the filters, best matches first
+    search_query = st.text_input(
+        "Search",
+        placeholder="Name, phone, customer code, sector, city, remarks or #ID",
+        key="leads_search"
+    ).strip()
     
-    if not filtered_df.empty:
-        if status_filter != "All":
-            filtered_df = filtered_df[filtered_df["status"] == status_filter]
-        
-        if source_filter != "All":
-            filtered_df = filtered_df[filtered_df["source"] == source_filter]
-        
-        if city_filter != "All":
-            filtered_df = filtered_df[filtered_df["city"] == city_filter]
-            
-        if assigned_filter != "All":
-            filtered_df = filtered_df[filtered_df["assigned_to"] == assigned_filter]
-        
-        if len(date_range) >= 2:
-            start_date = date_range[0].strftime("%Y-%m-%d")
-            end_date = date_range[1].strftime("%Y-%m-%d")
-            filtered_df = filtered_df[(filtered_df["date_created"] >= start_date) & (filtered_df["date_created"] <= end_date)]
+    if search_query:
+        leads_on_page, more_matches = search_index.search_leads(search_query, filters, SEARCH_RESULTS_LIMIT)
+        total = len(leads_on_page)
+    else:
+        # Only the page on screen is read and displayed
+        leads_on_page, total = lead_pager("leads", filters)
+    filtered_df = pd.DataFrame(leads_on_page)
     
     # Display leads
     if filtered_df.empty:
         st.info("No leads found. Create some leads in the Leads Management section.")
     else:
-        st.subheader(f"Showing {len(filtered_df)} leads")
+        if not search_query:
+            st.subheader(f"Showing {len(filtered_df)} of {total} leads")
+        elif more_matches:
+            st.subheader(f"Showing the {total} best matches")
+        else:
+            st.subheader(f"Showing {total} matching lead{'' if total == 1 else 's'}")
         
         # Add action buttons for each lead
         # Add action column to the dataframe
@@ -430,23 +427,15 @@ def show_leads():
         # Apply the new column order
         filtered_df = filtered_df[cols]
         
-        st.dataframe(filtered_df, use_container_width=True)
+        st.dataframe(filtered_df.drop(columns=["version", "status_history"], errors="ignore"), use_container_width=True)
         
         # Action section
         st.subheader("Lead Actions")
         col1, col2 = st.columns(2)
         
         with col1:
-            if not filtered_df.empty:
-                selected_lead_id = st.selectbox(
-                    "Select Lead",
-                    filtered_df["id"].tolist(),
-                    format_func=lambda x: f"Lead #{x} - {filtered_df[filtered_df['id'] == x]['name'].values[0]}",
-                    key="lead_action_select"
-                )
-            else:
-                st.warning("No leads available to select")
-                selected_lead_id = None
+            # Search all the matching leads, not only the page on screen
+            selected_lead_id = lead_picker("Select Lead", "lead_action_select", filters, leads_on_page)
         
         with col2:
             action = st.selectbox(
@@ -455,12 +444,12 @@ def show_leads():
                 key="lead_action_type"
             )
         
-        if selected_lead_id is not None:
+        selected_lead = shared_cache.get_lead(selected_lead_id) if selected_lead_id is not None else None
+        if selected_lead is not None:
             if action == "Edit":
                 st.subheader(f"Edit Lead #{selected_lead_id}")
                 
-                # Get the selected lead data
-                selected_lead = filtered_df[filtered_df["id"] == selected_lead_id].iloc[0]
+                base_version = edit_base_version("quick_edit", selected_lead, QUICK_EDIT_WIDGETS)
                 
                 col1, col2 = st.columns(2)
                 
@@ -507,63 +496,117 @@ def show_leads():
                 remarks = st.text_area("Remarks", value=selected_lead.get("remarks", ""), key="quick_edit_remarks")
                 
                 if st.button("Save Changes", key="quick_edit_save_btn"):
-                    # Update the lead in session state
-                    for i, lead in enumerate(st.session_state.leads):
-                        if lead["id"] == selected_lead_id:
-                            # Update lead with new values
-                            st.session_state.leads[i].update({
-                                "name": lead_name,
-                                "phone": phone,
-                                "sector": sector,
-                                "city": city,
-                                "monthly_bill": monthly_bill,
-                                "required_system": required_system,
-                                "system_type": system_type,
-                                "status": status,
-                                "source": source,
-                                "assigned_to": assigned_to,
-                                "customer_code": customer_code,
-                                "remarks": remarks
-                            })
-                            break
-                    
-                    # Save leads to database
-                    db.save_leads(st.session_state.leads)
-                    
-                    st.session_state.notification = {"type": "success", "message": f"Lead #{selected_lead_id} updated successfully!"}
+                    # Cached leads are shared read-only, so edit a copy of the lead, based on
+                    # the version the form was opened on
+                    updated_lead = shared_cache.get_lead(selected_lead_id)
+                    if updated_lead is None:
+                        st.session_state.notification = {"type": "error", "message": f"Lead #{selected_lead_id} was deleted by someone else."}
+                        st.rerun()
+                    updated_lead["version"] = base_version
+                    # Update the lead with new values
+                    updated_lead.update({
+                        "name": lead_name,
+                        "phone": phone,
+                        "sector": sector,
+                        "city": city,
+                        "monthly_bill": monthly_bill,
+                        "required_system": required_system,
+                        "system_type": system_type,
+                        "status": status,
+                        "source": source,
+                        "assigned_to": assigned_to,
+                        "customer_code": customer_code,
+                        "remarks": remarks
+                    })
+                    # Save the changed lead to the database
+                    try:
+                        db.upsert_lead(updated_lead)
+                        st.session_state.notification = {"type": "success", "message": f"Lead #{selected_lead_id} updated successfully!"}
+                    except db.ConflictError as e:
+                        st.session_state.notification = conflict_notification(e)
+                    forget_edit_base("quick_edit", QUICK_EDIT_WIDGETS)
                     st.rerun()
             
             elif action == "Delete":
-                st.warning(f"Are you sure you want to delete Lead #{selected_lead_id} - {filtered_df[filtered_df['id'] == selected_lead_id]['name'].values[0]}?")
+                st.warning(f"Are you sure you want to delete Lead #{selected_lead_id} - {selected_lead['name']}?")
+                base_version = edit_base_version("delete_lead", selected_lead)
                 
                 if st.button("Confirm Delete", key="confirm_delete_lead_btn"):
-                    # Remove the lead from session state
-                    st.session_state.leads = [lead for lead in st.session_state.leads if lead["id"] != selected_lead_id]
-                    
-                    # Save leads to database
-                    db.save_leads(st.session_state.leads)
-                    
-                    st.session_state.notification = {"type": "success", "message": f"Lead #{selected_lead_id} deleted successfully!"}
+                    # Delete the lead from the database, unless it was edited since it was shown
+                    try:
+                        db.delete_lead(selected_lead_id, base_version)
+                        st.session_state.notification = {"type": "success", "message": f"Lead #{selected_lead_id} deleted successfully!"}
+                    except db.ConflictError as e:
+                        st.session_state.notification = conflict_notification(e)
+                    forget_edit_base("delete_lead")
                     st.rerun()
     
-    # Export option
-    if not filtered_df.empty:
-        if st.button("Export to CSV", key="leads_export_btn"):
-            csv = filtered_df.to_csv(index=False)
+    # Export option (the search results, or all the matching leads), written in the background
+    if total:
+        export_filters = dict(filters, id=[lead["id"] for lead in leads_on_page]) if search_query else filters
+        job = lead_export.get_job(st.session_state.get("leads_export_job"))
+        running = job is not None and job["status"] == "running"
+        
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            export_format = st.selectbox(
+                "Export format",
+                lead_export.available_formats(),
+                format_func=lambda fmt: lead_export.FORMATS[fmt]["label"],
+                key="leads_export_format"
+            )
+        with col2:
+            st.write("")
+            if st.button("Export", key="leads_export_btn", disabled=running):
+                st.session_state.leads_export_job = lead_export.start_export(export_filters, fmt=export_format)
+                running = True
+        
+        if st.session_state.get("leads_export_job"):
+            # Poll the running export without rerunning the whole page
+            st.fragment(show_export_job, run_every=1 if running else None)(st.session_state.leads_export_job, running)
+
+def show_export_job(job_id, polling):
+    """Show the progress of a background lead export, or its file once it is done"""
+    job = lead_export.get_job(job_id)
+    if job is None:
+        return
+    
+    if job["status"] == "running":
+        if job["total"] is None:
+            st.progress(0, text="Counting leads...")
+        else:
+            done = min(job["rows"] / job["total"], 1.0) if job["total"] else 1.0
+            st.progress(done, text=f"Exported {job['rows']:,} of {job['total']:,} leads")
+        if st.button("Cancel", key="leads_export_cancel"):
+            lead_export.cancel_export(job_id)
+        return
+    
+    if polling:
+        # The export finished while polling; rerun the page to stop the timer and enable Export again
+        st.rerun()
+    
+    if job["status"] == "done":
+        st.success(f"Exported {job['rows']:,} leads")
+        with open(job["path"], "rb") as f:
             st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name="leads_export.csv",
-                mime="text/csv",
+                label=f"Download {lead_export.FORMATS[job['format']]['label']}",
+                data=f,
+                file_name=job["file_name"],
+                mime=lead_export.FORMATS[job["format"]]["mime"],
                 key="leads_download_btn"
             )
+        st.caption(f"Also saved as {job['path']}")
+    elif job["status"] == "failed":
+        st.error(f"Export failed: {job['error']}")
+    else:
+        st.info("Export cancelled")
 
 def show_leads_management():
     """Show leads management dashboard with lead creation and editing"""
     st.header("Leads Management")
     
     # Create tabs for different actions
-    tab1, tab2, tab3 = st.tabs(["Create Lead", "Edit Lead", "Assign Leads"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Create Lead", "Edit Lead", "Assign Leads", "Import Leads"])
     
     with tab1:
         st.subheader("Create New Lead")
@@ -600,10 +643,12 @@ def show_leads_management():
             )
             assigned_to = st.selectbox(
                 "Assigned To",
-                ["Unassigned"] + get_sales_users_list(),
+                ["Unassigned"] + get_sales_users_list() + [AUTO_ASSIGN],
                 index=get_assigned_to_index(["Unassigned"] + get_sales_users_list(), "Unassigned"),
                 key="create_assigned_to"
             )
+            if assigned_to == AUTO_ASSIGN:
+                routing_strategy = routing_strategy_selectbox("create_routing_strategy")
             # Auto-generate customer code and display it as read-only
             next_code = db.get_next_customer_code()
             st.text_input("Customer Code", value=next_code, key="create_customer_code", disabled=True)
@@ -622,7 +667,8 @@ def show_leads_management():
                     if st.button("Yes, Create Lead", key="confirm_create_btn"):
                         # Create a new lead with the form data
                         new_lead = {
-                            "id": st.session_state.next_lead_id,
+                            # Reserve the ID and code now; the code shown above is only a preview
+                            "id": db.allocate_lead_id(),
                             "name": lead_name,
                             "phone": phone,
                             "sector": sector,
@@ -633,21 +679,25 @@ def show_leads_management():
                             "status": status,
                             "source": source,
                             "assigned_to": assigned_to,
-                            "customer_code": next_code,  # Use the auto-generated code
+                            "customer_code": db.allocate_customer_code(),
                             "remarks": remarks,
                             "date_created": datetime.now().strftime("%Y-%m-%d")
                         }
+                        if assigned_to == AUTO_ASSIGN:
+                            new_lead["assigned_to"] = lead_router.assign_lead(new_lead, routing_strategy)
                         
-                        # Add the new lead to the session state
-                        st.session_state.leads.append(new_lead)
-                        
-                        # Increment the next lead ID
-                        st.session_state.next_lead_id += 1
+                        # Save the new lead to the database
+                        try:
+                            db.upsert_lead(new_lead)
+                        except Exception:
+                            # Not stored: the rep it was routed to stops counting it
+                            lead_router.release_lead(new_lead["id"])
+                            raise
                         
-                        # Save leads to database
-                        db.save_leads(st.session_state.leads)
-                        
-                        st.session_state.notification = {"type": "success", "message": f"Lead '{lead_name}' created successfully!"}
+                        message = f"Lead '{lead_name}' created successfully with customer code {new_lead['customer_code']}!"
+                        if assigned_to == AUTO_ASSIGN:
+                            message += f" It was assigned to {new_lead['assigned_to']}."
+                        st.session_state.notification = {"type": "success", "message": message}
                         
                         # Use a callback to reset the form
                         if "create_lead_btn" not in st.session_state:
@@ -662,22 +712,18 @@ def show_leads_management():
     with tab2:
         st.subheader("Edit Lead")
         
-        if not st.session_state.leads:
+        if lead_index.count_leads() == 0:
             st.info("No leads available to edit. Please create some leads first.")
         else:
-            # Create a dropdown to select a lead to edit
-            lead_options = {lead["id"]: f"Lead #{lead['id']} - {lead['name']}" for lead in st.session_state.leads}
-            selected_lead_id = st.selectbox(
-                "Select Lead to Edit",
-                options=list(lead_options.keys()),
-                format_func=lambda x: lead_options[x],
-                key="edit_lead_select"
-            )
+            # Search for the lead to edit; the newest leads are offered until something is typed
+            newest_leads, _ = lead_index.page_leads(order="-date_created", limit=LEAD_PICKER_BATCH)
+            selected_lead_id = lead_picker("Select Lead to Edit", "edit_lead_select", default_leads=newest_leads)
             
             # Find the selected lead
-            selected_lead = next((lead for lead in st.session_state.leads if lead["id"] == selected_lead_id), None)
+            selected_lead = shared_cache.get_lead(selected_lead_id) if selected_lead_id is not None else None
             
             if selected_lead:
+                base_version = edit_base_version("edit_lead", selected_lead, EDIT_LEAD_WIDGETS)
                 col1, col2 = st.columns(2)
                 
                 with col1:
@@ -723,71 +769,227 @@ def show_leads_management():
                 remarks = st.text_area("Remarks", value=selected_lead.get("remarks", ""), key="edit_remarks")
                 
                 if st.button("Update Lead", key="update_lead_btn"):
-                    # Update the lead in session state
-                    for i, lead in enumerate(st.session_state.leads):
-                        if lead["id"] == selected_lead_id:
-                            # Update lead with new values
-                            st.session_state.leads[i].update({
-                                "name": lead_name,
-                                "phone": phone,
-                                "sector": sector,
-                                "city": city,
-                                "monthly_bill": monthly_bill,
-                                "required_system": required_system,
-                                "system_type": system_type,
-                                "status": status,
-                                "source": source,
-                                "assigned_to": assigned_to,
-                                "customer_code": customer_code,
-                                "remarks": remarks
-                            })
-                            break
-                    
-                    # Save leads to database
-                    db.save_leads(st.session_state.leads)
-                    
-                    st.session_state.notification = {"type": "success", "message": f"Lead #{selected_lead_id} updated successfully!"}
+                    # Cached leads are shared read-only, so edit a copy of the lead, based on
+                    # the version the form was opened on
+                    updated_lead = shared_cache.get_lead(selected_lead_id)
+                    if updated_lead is None:
+                        st.session_state.notification = {"type": "error", "message": f"Lead #{selected_lead_id} was deleted by someone else."}
+                        st.rerun()
+                    updated_lead["version"] = base_version
+                    # Update the lead with new values
+                    updated_lead.update({
+                        "name": lead_name,
+                        "phone": phone,
+                        "sector": sector,
+                        "city": city,
+                        "monthly_bill": monthly_bill,
+                        "required_system": required_system,
+                        "system_type": system_type,
+                        "status": status,
+                        "source": source,
+                        "assigned_to": assigned_to,
+                        "customer_code": customer_code,
+                        "remarks": remarks
+                    })
+                    # Save the changed lead to the database
+                    try:
+                        db.upsert_lead(updated_lead)
+                        st.session_state.notification = {"type": "success", "message": f"Lead #{selected_lead_id} updated successfully!"}
+                    except db.ConflictError as e:
+                        st.session_state.notification = conflict_notification(e)
+                    forget_edit_base("edit_lead", EDIT_LEAD_WIDGETS)
                     st.rerun()
     
     with tab3:
         st.subheader("Bulk Lead Assignment")
         
-        col1, col2 = st.columns(2)
+        # Select the leads to reassign by filter; owners no longer active (e.g. a departing rep) are listed too
+        col1, col2, col3, col4 = st.columns(4)
         
         with col1:
+            owner_filter = st.selectbox(
+                "Current Owner",
+                ["All"] + sorted(owner for owner in lead_index.value_counts("assigned_to") if owner),
+                key="bulk_owner_filter"
+            )
+        
+        with col2:
             status_filter = st.selectbox(
-                "Filter by Status",
-                ["All", "New", "Contacted", "Qualified", "Proposal", "Closed Won", "Closed Lost"],
+                "Status",
+                ["All", "Open", "Fake Lead", "Lost", "Not Interested", "Quote Shared", "Won"],
                 key="bulk_status_filter"
             )
         
-        with col2:
-            assign_to = st.selectbox(
-                "Assign To",
-                ["Unassigned"] + get_sales_users_list(),
-                index=get_assigned_to_index(["Unassigned"] + get_sales_users_list(), "Unassigned"),
-                key="bulk_assign_to"
+        with col3:
+            source_filter = st.selectbox(
+                "Source",
+                ["All", "Organic Search", "Paid Ads", "Social Media", "Referral", "Walk-In"],
+                key="bulk_source_filter"
             )
         
-        # Generate sample leads based on filter
-        filtered_leads = []
-        for i in range(1, 6):
-            status = "New" if status_filter == "All" else status_filter
-            filtered_leads.append({
-                "id": i,
-                "name": f"Lead {i}",
-                "company": f"Company {i}",
-                "status": status,
-                "current_owner": random.choice(get_sales_users_list())
-            })
-        
-        filtered_leads_df = pd.DataFrame(filtered_leads)
-        
-        # Display leads with checkboxes
-        st.dataframe(filtered_leads_df, use_container_width=True)
-        
-        if st.button("Assign Selected Leads", key="bulk_assign_btn"):
-            st.session_state.notification = {"type": "success", "message": f"Selected leads assigned to {assign_to} successfully!"}
+        with col4:
+            city_filter = st.selectbox(
+                "City",
+                ["All", "Islamabad", "RawalPindi", "Taxila", "Wahcantt", "Lahore", "Karachi"],
+                key="bulk_city_filter"
+            )
+        
+        bulk_filters = {
+            "assigned_to": owner_filter,
+            "status": status_filter,
+            "source": source_filter,
+            "city": city_filter
+        }
+        
+        if st.checkbox("Only leads created in a date range", key="bulk_use_dates"):
+            date_range = st.date_input(
+                "Date Range",
+                value=(datetime.now() - timedelta(days=30), datetime.now()),
+                key="bulk_date_range"
+            )
+            if len(date_range) >= 2:
+                bulk_filters["date_from"] = date_range[0].strftime("%Y-%m-%d")
+                bulk_filters["date_to"] = date_range[1].strftime("%Y-%m-%d")
+        
+        assign_to = st.selectbox(
+            "Assign To",
+            get_sales_users_list(),
+            key="bulk_assign_to"
+        )
+        
+        # Preview: the matching leads come from the lead index, so this costs the size of the selection
+        matching_ids = lead_index.match_ids(bulk_filters)
+        owner_counts = lead_index.value_counts("assigned_to", matching_ids)
+        to_move = len(matching_ids) - owner_counts.get(assign_to, 0)
+        
+        col1, col2 = st.columns(2)
+        col1.metric("Matching leads", f"{len(matching_ids):,}")
+        col2.metric(f"To reassign to {assign_to}", f"{to_move:,}")
+        
+        if owner_counts:
+            owners_df = pd.DataFrame(
+                sorted(owner_counts.items(), key=lambda item: -item[1]),
+                columns=["Current Owner", "Leads"]
+            )
+            st.dataframe(owners_df, hide_index=True, use_container_width=True)
+            
+            sample_leads, _ = lead_index.page_leads(bulk_filters, order="-date_created", limit=10)
+            st.caption(f"Newest {len(sample_leads)} of the matching leads")
+            st.dataframe(
+                pd.DataFrame(sample_leads, columns=["id", "name", "customer_code", "status", "city", "assigned_to", "date_created"]),
+                hide_index=True,
+                use_container_width=True
+            )
+        
+        if st.button(f"Reassign {to_move:,} Leads", key="bulk_assign_btn", disabled=to_move == 0):
+            # One batched write; leads changed to no longer match since the preview are left alone
+            lead_ids = [lead["id"] for lead in shared_cache.get_leads_by_ids(matching_ids) if lead.get("assigned_to") != assign_to]
+            moved = db.update_leads(lead_ids, {"assigned_to": assign_to}, bulk_filters)
+            message = f"{len(moved):,} leads reassigned to {assign_to}."
+            if len(moved) < len(lead_ids):
+                message += f" {len(lead_ids) - len(moved):,} leads were changed by someone else meanwhile and left as they are."
+            st.session_state.notification = {"type": "success", "message": message}
+            st.rerun()
+        
+        # New leads created or imported with "Auto-assign" are routed by lead_router
+        st.subheader("Automatic Routing")
+        loads = lead_router.get_rep_loads()
+        if loads:
+            loads_df = pd.DataFrame([
+                {
+                    "Rep": rep,
+                    "Open Leads": counts["open"],
+                    "Won": counts["won"],
+                    "Lost": counts["lost"],
+                    "Conversion": f"{counts['won'] / (counts['won'] + counts['lost']):.0%}" if counts["won"] + counts["lost"] else "-"
+                }
+                for rep, counts in loads.items()
+            ])
+            st.dataframe(loads_df, hide_index=True, use_container_width=True)
+        else:
+            st.info("There are no active sales reps to route leads to.")
+        
+        decisions = lead_router.recent_decisions(10)
+        if decisions:
+            st.caption("Latest routing decisions")
+            decisions_df = pd.DataFrame(decisions, columns=["time", "lead_id", "strategy", "assigned_to", "area", "open_leads"])
+            decisions_df["strategy"] = decisions_df["strategy"].map(lead_router.STRATEGIES).fillna(decisions_df["strategy"])
+            st.dataframe(decisions_df, hide_index=True, use_container_width=True)
+    
+    with tab4:
+        st.subheader("Import Leads")
+        st.write(
+            "Upload a CSV, Excel or JSON Lines file with one lead per row. Columns: name, phone, city "
+            "and source (required), and sector, monthly_bill, required_system, system_type, status, "
+            "assigned_to, customer_code, remarks and date_created. Each lead gets a new lead ID, and a "
+            "customer code if it has none."
+        )
+        
+        uploaded_file = st.file_uploader("Leads file", type=["csv", "xlsx", "jsonl", "json"], key="import_leads_file")
+        check_only = st.checkbox("Only check the file, don't import it", key="import_leads_check_only")
+        routing_strategy = None
+        if st.checkbox("Auto-assign leads without an owner", key="import_leads_auto_assign"):
+            routing_strategy = routing_strategy_selectbox("import_routing_strategy")
+        
+        if uploaded_file is not None and st.button("Check File" if check_only else "Import Leads", key="import_leads_btn"):
+            progress_bar = st.progress(0.0, text="Reading rows...")
+            
+            def show_progress(rows, imported):
+                done = min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0)
+                progress_bar.progress(done, text=f"{rows:,} rows read, {imported:,} leads {'valid' if check_only else 'imported'}")
+            
+            # Rows are validated and stored a batch at a time as the file is read
+            try:
+                result = lead_import.import_leads(
+                    uploaded_file, lead_import.format_of(uploaded_file.name), dry_run=check_only,
+                    progress=show_progress, routing_strategy=routing_strategy
+                )
+                st.session_state.lead_import_result = dict(result, file_name=uploaded_file.name, dry_run=check_only)
+            except ValueError as e:
+                st.session_state.lead_import_result = None
+                st.error(f"Could not read {uploaded_file.name}: {e}")
+            else:
+                st.rerun()
+        
+        if st.session_state.get("lead_import_result"):
+            show_import_result(st.session_state.lead_import_result)
+
+def routing_strategy_selectbox(key):
+    """Select a lead routing strategy, defaulting to ROUTING_STRATEGY"""
+    strategies = list(lead_router.STRATEGIES)
+    return st.selectbox(
+        "Routing Strategy",
+        strategies,
+        index=strategies.index(lead_router.ROUTING_STRATEGY) if lead_router.ROUTING_STRATEGY in strategies else 0,
+        format_func=lambda strategy: lead_router.STRATEGIES[strategy],
+        key=key
+    )
+
+def show_import_result(result):
+    """Show the outcome of a lead import, with the rows that were skipped"""
+    if result["dry_run"]:
+        st.info(f"{result['imported']:,} of {result['rows']:,} rows in {result['file_name']} can be imported")
+    elif result["imported"]:
+        st.success(
+            f"Imported {result['imported']:,} of {result['rows']:,} rows from {result['file_name']} "
+            f"as leads #{result['first_id']} to #{result['last_id']}"
+        )
+    else:
+        st.warning(f"No leads were imported from {result['file_name']}")
+    
+    if result["failed"]:
+        st.warning(f"{result['failed']:,} rows have errors and {'would be' if result['dry_run'] else 'were'} skipped")
+        errors_df = pd.DataFrame(result["errors"], columns=["Row", "Error"])
+        st.dataframe(errors_df, hide_index=True, use_container_width=True)
+        if result["failed"] > len(result["errors"]):
+            st.caption(f"Showing the first {len(result['errors']):,} errors")
+        st.download_button(
+            label="Download Errors",
+            data=errors_df.to_csv(index=False),
+            file_name="lead_import_errors.csv",
+            mime="text/csv",
+            key="import_errors_download_btn"
+        )
 
 def show_user_accounts():
     """Show user accounts management dashboard"""
@@ -799,10 +1001,12 @@ def show_user_accounts():
     with tab1:
         st.subheader("User List")
         
-        # Get users from session state
-        users = st.session_state.users
+        # Get the current users (the session's copy may be stale)
+        users = shared_cache.get_users()
+        st.session_state.users = users
         
-        users_df = pd.DataFrame(users)
+        # Never show the stored password hashes
+        users_df = pd.DataFrame(users).drop(columns=["password", "version"], errors="ignore")
         st.dataframe(users_df, use_container_width=True)
         
         # User actions
@@ -827,6 +1031,8 @@ def show_user_accounts():
         
         if action == "Edit":
             st.subheader(f"Edit User: {selected_user['name']}")
+            # Before the widgets, so opening another user resets them to show it
+            base_version = edit_base_version("edit_user", selected_user, EDIT_USER_WIDGETS)
             
             col1, col2 = st.columns(2)
             
@@ -851,7 +1057,7 @@ def show_user_accounts():
                 new_password = st.text_input("New Password (leave blank to keep current)", type="password", key="edit_user_password")
             
             if st.button("Save Changes", key="save_user_changes_btn"):
-                # Update the user in session state
+                # Update the user, based on the version the form was opened on
                 update_data = {
                     "username": username,
                     "name": full_name,
@@ -862,18 +1068,19 @@ def show_user_accounts():
                 
                 # Only update password if a new one was provided
                 if new_password:
-                    update_data["password"] = new_password
-                
-                for i, user in enumerate(st.session_state.users):
-                    if user["id"] == selected_user["id"]:
-                        # Update user with new values
-                        st.session_state.users[i].update(update_data)
-                        break
+                    update_data["password"] = credentials.hash_password(new_password)
                 
-                # Save users to database
-                db.save_users(st.session_state.users)
-                
-                st.session_state.notification = {"type": "success", "message": f"User '{full_name}' updated successfully!"}
+                # Save the user to the database
+                try:
+                    db.upsert_user(dict(selected_user, **update_data, version=base_version))
+                    st.session_state.notification = {"type": "success", "message": f"User '{full_name}' updated successfully!"}
+                    forget_edit_base("edit_user", EDIT_USER_WIDGETS)
+                except db.ConflictError as e:
+                    st.session_state.notification = conflict_notification(e)
+                    forget_edit_base("edit_user", EDIT_USER_WIDGETS)
+                except db.DuplicateUsernameError as e:
+                    # Keep the form as entered, so only the username needs changing
+                    st.session_state.notification = {"type": "error", "message": f"{e}. Choose another username."}
                 st.rerun()
         
         elif action == "Delete":
@@ -881,15 +1088,16 @@ def show_user_accounts():
                 st.error("Cannot delete the admin user!")
             else:
                 st.warning(f"Are you sure you want to delete user '{selected_user['name']}'? This action cannot be undone.")
+                base_version = edit_base_version("delete_user", selected_user)
                 
                 if st.button("Confirm Delete", key="confirm_delete_user_btn"):
-                    # Remove the user from session state
-                    st.session_state.users = [user for user in st.session_state.users if user["id"] != selected_user["id"]]
-                    
-                    # Save users to database
-                    db.save_users(st.session_state.users)
-                    
-                    st.session_state.notification = {"type": "success", "message": f"User '{selected_user['name']}' deleted successfully!"}
+                    # Delete the user from the database, unless it was edited since it was shown
+                    try:
+                        db.delete_user(selected_user["id"], base_version)
+                        st.session_state.notification = {"type": "success", "message": f"User '{selected_user['name']}' deleted successfully!"}
+                    except db.ConflictError as e:
+                        st.session_state.notification = conflict_notification(e)
+                    forget_edit_base("delete_user")
                     st.rerun()
         
         elif action == "Deactivate":
@@ -900,19 +1108,16 @@ def show_user_accounts():
                 action_text = "deactivate" if new_status == "Inactive" else "activate"
                 
                 st.warning(f"Are you sure you want to {action_text} user '{selected_user['name']}'?")
+                base_version = edit_base_version("user_status", selected_user)
                 
                 if st.button(f"Confirm {action_text.capitalize()}", key="confirm_status_change_btn"):
-                    # Update the user status in session state
-                    for i, user in enumerate(st.session_state.users):
-                        if user["id"] == selected_user["id"]:
-                            # Update user status
-                            st.session_state.users[i]["status"] = new_status
-                            break
-                    
-                    # Save users to database
-                    db.save_users(st.session_state.users)
-                    
-                    st.session_state.notification = {"type": "success", "message": f"User '{selected_user['name']}' {action_text}d successfully!"}
+                    # Save the new status to the database
+                    try:
+                        db.upsert_user(dict(selected_user, status=new_status, version=base_version))
+                        st.session_state.notification = {"type": "success", "message": f"User '{selected_user['name']}' {action_text}d successfully!"}
+                    except db.ConflictError as e:
+                        st.session_state.notification = conflict_notification(e)
+                    forget_edit_base("user_status")
                     st.rerun()
         
         elif action == "Reset Password":
@@ -920,6 +1125,7 @@ def show_user_accounts():
             
             new_password = st.text_input("New Password", type="password", key="reset_password")
             confirm_password = st.text_input("Confirm Password", type="password", key="confirm_reset_password")
+            base_version = edit_base_version("reset_password", selected_user)
             
             if st.button("Reset Password", key="reset_password_btn"):
                 if new_password != confirm_password:
@@ -927,16 +1133,13 @@ def show_user_accounts():
                 elif not new_password:
                     st.error("Password cannot be empty!")
                 else:
-                    # Update the user's password in session state
-                    for i, user in enumerate(st.session_state.users):
-                        if user["id"] == selected_user["id"]:
-                            st.session_state.users[i]["password"] = new_password
-                            break
-                    
-                    # Save users to database
-                    db.save_users(st.session_state.users)
-                    
-                    st.session_state.notification = {"type": "success", "message": f"Password for '{selected_user['name']}' reset successfully!"}
+                    # Save the new password hash to the database
+                    try:
+                        db.upsert_user(dict(selected_user, password=credentials.hash_password(new_password), version=base_version))
+                        st.session_state.notification = {"type": "success", "message": f"Password for '{selected_user['name']}' reset successfully!"}
+                    except db.ConflictError as e:
+                        st.session_state.notification = conflict_notification(e)
+                    forget_edit_base("reset_password")
                     st.rerun()
     
     with tab2:
@@ -962,22 +1165,23 @@ def show_user_accounts():
             if password == confirm_password:
                 # Create a new user with the form data
                 new_user = {
-                    "id": len(st.session_state.users) + 1,
+                    "id": max((user["id"] for user in shared_cache.get_users()), default=0) + 1,
                     "username": username,
                     "name": full_name,
                     "email": email,
                     "role": role,
                     "status": "Active",
-                    "password": password
+                    "password": credentials.hash_password(password)
                 }
                 
-                # Add the new user to the session state
-                st.session_state.users.append(new_user)
-                
-                # Save users to database
-                db.save_users(st.session_state.users)
-                
-                st.session_state.notification = {"type": "success", "message": f"User '{username}' created successfully!"}
+                # Save the new user to the database (refused if another admin took the id meanwhile)
+                try:
+                    db.upsert_user(new_user)
+                    st.session_state.notification = {"type": "success", "message": f"User '{username}' created successfully!"}
+                except db.ConflictError as e:
+                    st.session_state.notification = conflict_notification(e)
+                except db.DuplicateUsernameError as e:
+                    st.session_state.notification = {"type": "error", "message": f"{e}. Choose another username."}
                 st.rerun()
             else:
                 st.session_state.notification = {"type": "error", "message": "Passwords do not match!"}
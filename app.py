@@ -1,13 +1,9 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime, timedelta
 import os
 import json
 from pathlib import Path
-import local_db as db
+import shared_cache
 
 # Set page configuration
 st.set_page_config(
@@ -32,10 +28,9 @@ def init_session_state():
     if 'notification' not in st.session_state:
         st.session_state.notification = None
 
-    # Always load fresh data from the database on app startup
-    st.session_state.leads = db.load_leads()
-    st.session_state.users = db.load_users()
-    st.session_state.next_lead_id = db.get_next_lead_id()
+    # Point the session at the process-wide cached data; it is only reloaded when storage changed
+    st.session_state.leads = shared_cache.get_leads()
+    st.session_state.users = shared_cache.get_users()
 
 
 # Import modules
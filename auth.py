@@ -2,56 +2,43 @@ import streamlit as st
 import json
 import os
 from pathlib import Path
-import database as db
-
-# Get users from database
-def get_users():
-    users = db.load_users()
-    # Convert to dictionary format for authentication
-    users_dict = {}
-    for user in users:
-        if user["status"] == "Active":  # Only include active users
-            # Store username in lowercase for case-insensitive comparison
-            users_dict[user["username"].lower()] = {
-                "password": user.get("password", "password123"),  # Default password if not set
-                "role": user["role"],
-                "display_name": user["name"],
-                "email": user["email"],
-                "original_username": user["username"]  # Store original username for session state
-            }
-    return users_dict
+import shared_cache
+import credentials
+import login_tracker
+import activity_log
 
 def authenticate_user(username, password):
     """
     Authenticate a user with username and password
     
     Args:
-        username (str): The username
+        username (str): The username (case-insensitive)
         password (str): The password
     
     Returns:
         bool: True if authentication is successful, False otherwise
     """
-    USERS = get_users()
-    # Convert input username to lowercase for case-insensitive comparison
-    username_lower = username.lower()
+    user = credentials.check_credentials(username, password)
+    if user is None:
+        return False
+
+    st.session_state.authenticated = True
+    st.session_state.username = user["username"]  # Use original username
+    st.session_state.role = user["role"]
+    st.session_state.display_name = user["name"]
+    
+    # Update last login time (written in batches)
+    login_tracker.record_login(user["username"])
+    activity_log.record("login", user=user["username"])
     
-    if username_lower in USERS and USERS[username_lower]["password"] == password:
-        st.session_state.authenticated = True
-        st.session_state.username = USERS[username_lower]["original_username"]  # Use original username
-        st.session_state.role = USERS[username_lower]["role"]
-        st.session_state.display_name = USERS[username_lower]["display_name"]
-        
-        # Update last login time
-        db.update_user_last_login(USERS[username_lower]["original_username"])
-        
-        return True
-    return False
+    return True
 
 def logout_user():
     """
     Log out the current user by resetting session state
     """
+    if st.session_state.get("username"):
+        activity_log.record("logout", user=st.session_state.username)
     st.session_state.authenticated = False
     st.session_state.username = ""
     st.session_state.role = ""
@@ -59,19 +46,19 @@ def logout_user():
 
 def get_user_info(username=None):
     """Get user information from the database"""
-    USERS = get_users()
     if username is None and "username" in st.session_state:
         username = st.session_state.username
     
-    if username in USERS:
+    user = credentials.find_user(username)
+    if user is not None and user["status"] == "Active":
         return {
-            "username": username,
-            "role": USERS[username]["role"],
-            "display_name": USERS[username]["display_name"],
-            "email": USERS[username]["email"]
+            "username": user["username"],
+            "role": user["role"],
+            "display_name": user["name"],
+            "email": user["email"]
         }
     return None
 
 def get_all_users():
     """Get all users from the database"""
-    return db.load_users()
+    return shared_cache.get_users()
@@ -0,0 +1,107 @@
+"""
+Benchmark the lead lifecycle statistics (lead_analytics)
+
+Usage:
+    python benchmark_analytics.py [leads]
+
+    leads is the number of synthetic leads (default 200000), each with a status
+    history of a few changes. They are kept in the memory backend. Reading the
+    time-to-close statistics from the incremental view is compared with recomputing
+    them from every lead with pandas, as the dashboard used to, and then a status
+    change is timed as a write plus the view update.
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import storage
+import shared_cache
+import lead_analytics
+
+REPS = ["Syed Adeel", "Saad Saleem", "Muhammad Abdullah", "Ayesha Khan", "Bilal Ahmed"]
+PATHS = [["Open", "Quote Shared", "Won"], ["Open", "Quote Shared", "Lost"], ["Open", "Not Interested"],
+         ["Open", "Quote Shared"], ["Open"], ["Open", "Fake Lead"]]
+
+
+def generate_leads(count):
+    """Generate synthetic leads with status histories"""
+    rng = random.Random(42)
+    start = datetime.now() - timedelta(days=400)
+    stamp = "%Y-%m-%d %H:%M:%S"
+    leads = []
+    for lead_id in range(1, count + 1):
+        at = start + timedelta(seconds=rng.randint(0, 300 * 86400))
+        created_at = at.strftime(stamp)
+        history = []
+        previous = None
+        for status in rng.choice(PATHS):
+            history.append({"from": previous, "to": status, "at": at.strftime(stamp)})
+            previous = status
+            at += timedelta(seconds=int(rng.expovariate(1 / (12 * 86400))))
+        closed = previous in storage.CLOSED_LEAD_STATUSES
+        leads.append({
+            "id": lead_id,
+            "name": f"Customer {lead_id}",
+            "status": previous,
+            "assigned_to": rng.choice(REPS),
+            "date_created": created_at[:10],
+            "created_at": created_at,
+            "status_history": history,
+            "status_changed_at": history[-1]["at"],
+            "closed_at": history[-1]["at"] if closed else None,
+        })
+    return leads
+
+
+def timed(label, func, repeat=5):
+    """Run func `repeat` times and print the mean wall time"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<40} {elapsed * 1000:>10.3f} ms")
+    return result
+
+
+def recompute_with_pandas(leads):
+    """Time to close of the won leads per rep from all leads, the way the dashboard did"""
+    df = pd.DataFrame(leads)
+    won = df[df["status"] == "Won"].copy()
+    won["days"] = (pd.to_datetime(won["closed_at"]) - pd.to_datetime(won["created_at"])).dt.total_seconds() / 86400
+    return won.groupby("assigned_to")["days"].agg(["count", "mean", "median", "min", "max",
+                                                   lambda days: days.quantile(0.9)])
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    print(f"Generating {count:,} leads...")
+    leads = generate_leads(count)
+    storage.set_backend("memory")
+    storage.save_leads(leads)
+
+    print("time to close per rep:")
+    timed("build view (first load)", shared_cache.get_leads, repeat=1)
+    exact = timed("recompute with pandas", lambda: recompute_with_pandas(shared_cache.get_leads()), repeat=3)
+    stats = timed("read incremental view", lead_analytics.time_to_close_by_rep, repeat=1000)
+    for rep, row in exact.iterrows():
+        sketch = stats[rep]
+        print(f"    {rep:<20} {row['count']:>7,.0f} won  mean {row['mean']:6.2f}/{sketch['mean']:6.2f} d  "
+              f"median {row['median']:6.2f}/{sketch['p50']:6.2f} d  (pandas/view)")
+
+    print("incremental updates:")
+    open_ids = [lead["id"] for lead in leads if lead["status"] == "Open"]
+
+    def close_one():
+        lead = shared_cache.get_lead(open_ids.pop())
+        storage.upsert_lead(dict(lead, status="Won"))
+
+    timed("status change (write + views)", close_one, repeat=200)
+    print(f"  won leads counted: {lead_analytics.time_to_close('Won')['count']:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark data.get_filtered_data against the old copy-and-mask implementation
+
+Usage:
+    python benchmark_filters.py [rows]
+
+    rows is the number of synthetic sales rows (default 10000000). The old
+    implementation runs on string columns, as read from the CSV before the sales
+    data was typed; the new one on the typed columns load_data returns.
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from data import apply_types, get_filtered_data
+
+SALES_REPS = ["John Doe", "Jane Smith", "Bob Johnson", "Alice Brown", "Charlie Davis"]
+PRODUCTS = ["Product A", "Product B", "Product C", "Product D"]
+REGIONS = ["North", "South", "East", "West", "Central"]
+
+
+def generate_sales(rows):
+    """Generate synthetic sales rows with string columns, as read from the CSV"""
+    rng = np.random.default_rng(42)
+    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=365).strftime("%Y-%m-%d")
+    units = rng.integers(1, 50, rows)
+    return pd.DataFrame({
+        "date": np.asarray(dates, dtype=object)[rng.integers(0, len(dates), rows)],
+        "sales_rep": np.asarray(SALES_REPS, dtype=object)[rng.integers(0, len(SALES_REPS), rows)],
+        "product": np.asarray(PRODUCTS, dtype=object)[rng.integers(0, len(PRODUCTS), rows)],
+        "region": np.asarray(REGIONS, dtype=object)[rng.integers(0, len(REGIONS), rows)],
+        "units_sold": units,
+        "revenue": units * rng.integers(100, 1000, rows)
+    })
+
+
+def legacy_filtered_data(data, filters=None):
+    """The previous get_filtered_data: a defensive copy, then one string mask per filter"""
+    if filters is None:
+        return data
+
+    filtered_data = data.copy()
+
+    if 'start_date' in filters and 'end_date' in filters:
+        filtered_data = filtered_data[(filtered_data['date'] >= filters['start_date']) &
+                                     (filtered_data['date'] <= filters['end_date'])]
+
+    if 'sales_rep' in filters and filters['sales_rep'] != 'All':
+        filtered_data = filtered_data[filtered_data['sales_rep'] == filters['sales_rep']]
+
+    if 'product' in filters and filters['product'] != 'All':
+        filtered_data = filtered_data[filtered_data['product'] == filters['product']]
+
+    if 'region' in filters and filters['region'] != 'All':
+        filtered_data = filtered_data[filtered_data['region'] == filters['region']]
+
+    return filtered_data
+
+
+def timed(label, func, repeat=3):
+    """Run func `repeat` times and print the mean wall time"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<10} {elapsed * 1000:>10.1f} ms  ({len(result):,} rows)")
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    today = pd.Timestamp.today()
+    start_date = (today - pd.Timedelta(days=30)).strftime("%Y-%m-%d")
+    end_date = today.strftime("%Y-%m-%d")
+
+    print(f"Generating {rows:,} sales rows...")
+    raw = generate_sales(rows)
+    typed = apply_types(raw.copy())
+
+    cases = [
+        ("date range", {"start_date": start_date, "end_date": end_date}),
+        ("rep + date", {"sales_rep": "Jane Smith", "start_date": start_date, "end_date": end_date}),
+        ("all fields", {"sales_rep": "Jane Smith", "product": "Product B", "region": "East",
+                        "start_date": start_date, "end_date": end_date}),
+    ]
+    for name, filters in cases:
+        print(f"{name}:")
+        old = timed("old", lambda: legacy_filtered_data(raw, filters))
+        new = timed("new", lambda: get_filtered_data(typed, filters))
+        print(f"  speedup    {old / new:>10.1f}x")
+
+    # Only the new engine takes lists of values
+    print("multi-select (2 reps, 2 regions):")
+    timed("new", lambda: get_filtered_data(typed, {"sales_rep": ["Jane Smith", "John Doe"],
+                                                   "region": ["East", "West"]}))
+
+
+if __name__ == "__main__":
+    main()
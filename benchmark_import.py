@@ -0,0 +1,86 @@
+"""
+Benchmark the bulk lead import (lead_import) against each storage backend
+
+Usage:
+    python benchmark_import.py [rows]
+
+    rows is the number of rows in the generated CSV file (default 100000); about 1%
+    of them are invalid or duplicates, so the error report is exercised too. Each
+    backend imports into a throwaway copy in a temporary directory.
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+import storage
+import local_db
+import memory_db
+import sqlite_db
+import lead_import
+
+COLUMNS = ["Customer Name", "Phone No", "sector", "city", "Monthly Avg. Bill", "required_system",
+           "system_type", "status", "source", "assigned_to", "remarks"]
+
+
+def write_csv(path, rows):
+    """Write a CSV of synthetic leads row by row, with a few bad rows mixed in"""
+    rng = random.Random(42)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for row in range(rows):
+            phone = f"+92 3{row:09d}"
+            city = rng.choice(lead_import.LEAD_CITIES)
+            if row % 250 == 1:
+                phone = "12345"                      # invalid phone
+            elif row % 250 == 2:
+                phone = f"+92 3{row - 2:09d}"        # duplicate of an earlier row
+            elif row % 250 == 3:
+                city = "Peshawar"                    # not a dashboard city
+            writer.writerow([
+                f"Customer {row}", phone, f"G-{rng.randint(1, 15)}", city, rng.randint(5000, 100000),
+                f"{rng.randint(3, 20)} KW", rng.choice(lead_import.SYSTEM_TYPES),
+                rng.choice(lead_import.LEAD_STATUSES), rng.choice(lead_import.LEAD_SOURCES),
+                "Unassigned", "",
+            ])
+
+
+def use_directory(directory):
+    """Point the file-based backends at `directory` and empty the memory backend"""
+    local_db.LEADS_FILE = os.path.join(directory, "leads.json")
+    local_db.LEADS_LOG_FILE = os.path.join(directory, "leads.log")
+    local_db.COUNTERS_FILE = os.path.join(directory, "counters.json")
+    local_db.USERS_FILE = os.path.join(directory, "users.json")
+    local_db._leads = None
+    sqlite_db.DB_FILE = os.path.join(directory, "evergreen.db")
+    memory_db.reset()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "leads.csv")
+        write_csv(path, rows)
+        print(f"{rows:,} rows, {os.path.getsize(path) / 1e6:.1f} MB CSV")
+
+        for name in ["sqlite", "json", "memory"]:
+            with tempfile.TemporaryDirectory() as data_directory:
+                use_directory(data_directory)
+                storage.set_backend(name)
+                start = time.perf_counter()
+                result = lead_import.import_leads(path, "csv")
+                elapsed = time.perf_counter() - start
+                print(f"  {name:<8} {elapsed:>7.2f} s  {result['imported']:,} imported, "
+                      f"{result['failed']:,} rejected, {storage.count_leads():,} stored")
+
+        print("first errors:")
+        for number, message in result["errors"][:3]:
+            print(f"  row {number}: {message}")
+
+
+if __name__ == "__main__":
+    main()
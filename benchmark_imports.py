@@ -0,0 +1,97 @@
+"""
+Profile what each entry point of the dashboard imports (python -X importtime)
+
+Usage:
+    python benchmark_imports.py [--check]
+
+    Imports the modules behind the login page and each dashboard in a fresh
+    interpreter with -X importtime and prints the total import time, the extra
+    time the dashboard module adds on top of the login page, whether the heavy
+    libraries were loaded, and the slowest packages. With --check it exits with
+    status 1 if the login page imports any of the heavy libraries.
+"""
+import os
+import subprocess
+import sys
+
+# Modules imported to reach each page, in order
+ENTRY_POINTS = {
+    "login page": ["app"],
+    "admin dashboard": ["app", "admin_view"],
+    "sales dashboard": ["app", "sales_view"],
+}
+
+# Libraries the login page should not need
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "seaborn", "pyarrow"]
+
+
+def profile_imports(modules):
+    """
+    Import modules in a fresh interpreter and parse its -X importtime report
+
+    Returns:
+        list: (module name, nesting depth, self microseconds, cumulative microseconds)
+            for everything imported by the requested modules
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {module}" for module in modules)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    )
+
+    entries = []
+    subtree = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        self_us, cumulative_us, name = int(fields[0]), int(fields[1]), fields[2]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        subtree.append((name.strip(), depth, self_us, cumulative_us))
+        # Nested imports are listed before the module that imported them; keep only the
+        # trees of the requested modules, not the interpreter's own startup imports
+        if depth == 0:
+            if name.strip() in modules:
+                entries.extend(subtree)
+            subtree = []
+    return entries
+
+
+def report(label, modules, entries):
+    """Print the import profile of one entry point"""
+    top_level = {name: cumulative for name, depth, _, cumulative in entries if depth == 0}
+    imported = {name for name, _, _, _ in entries}
+    total = sum(top_level.values())
+
+    print(f"{label}: {total / 1000:.0f} ms")
+    if len(modules) > 1:
+        print(f"  {modules[-1]} adds {top_level.get(modules[-1], 0) / 1000:.0f} ms")
+    loaded = [module for module in HEAVY_MODULES if module in imported]
+    print(f"  heavy libraries: {', '.join(loaded) if loaded else 'none'}")
+
+    # Slowest third-party/standard packages, counted once at their outermost import
+    packages = {}
+    for name, _, _, cumulative in entries:
+        if "." not in name and name not in modules:
+            packages[name] = max(packages.get(name, 0), cumulative)
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:8]
+    print("  slowest packages: " + ", ".join(f"{name} {us / 1000:.0f} ms" for name, us in slowest))
+    return loaded
+
+
+def main():
+    check = "--check" in sys.argv[1:]
+    failed = False
+
+    for label, modules in ENTRY_POINTS.items():
+        loaded = report(label, modules, profile_imports(modules))
+        if label == "login page" and loaded:
+            failed = True
+
+    if check and failed:
+        print("The login page imports heavy libraries; keep them inside the views.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark time-to-first-paint of each dashboard page in both chart modes
+
+Usage:
+    python benchmark_pages.py [modes]
+
+    modes is a comma-separated list of chart modes (default native,image). Each
+    page is opened in a fresh Python process with Streamlit's AppTest, so the
+    first run includes importing the views and their chart libraries; a second
+    run in the same process shows the rerun cost. Run it from the project
+    directory, against the data in data/.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+PAGES = [
+    ("admin", "admin", "Admin User", "admin_nav", "Dashboard Overview"),
+    ("admin", "admin", "Admin User", "admin_nav", "Leads"),
+    ("sales", "sales", None, "sales_nav", "My Performance"),
+    ("sales", "sales", None, "sales_nav", "Product Analysis"),
+    ("sales", "sales", None, "sales_nav", "Regional Analysis"),
+]
+
+
+def run_page(role, username, display_name, nav_key, page):
+    """Open one page twice in this process and return (first paint, rerun) in seconds"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.abspath("app.py"), default_timeout=120)
+    at.session_state["authenticated"] = True
+    at.session_state["role"] = role
+    at.session_state["username"] = username
+    at.session_state["display_name"] = display_name
+    at.session_state[nav_key] = page
+
+    start = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"{page}: {at.exception[0].value}")
+
+    start = time.perf_counter()
+    at.run()
+    rerun = time.perf_counter() - start
+    return first, rerun
+
+
+def busiest_rep():
+    """Get the sales rep with the most sales rows, so their pages have charts to draw"""
+    from data import load_data
+    return str(load_data(["sales_rep"])["sales_rep"].value_counts().index[0])
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--page":
+        # Child process: time a single page and report to the parent as JSON
+        print(json.dumps(run_page(*json.loads(sys.argv[2]))))
+        return
+
+    modes = (sys.argv[1] if len(sys.argv) > 1 else "native,image").split(",")
+    rep = busiest_rep()
+
+    print(f"{'page':<22}" + "".join(f"{mode + ' first':>16}{mode + ' rerun':>16}" for mode in modes))
+    for role, username, display_name, nav_key, page in PAGES:
+        args = [role, username, display_name or rep, nav_key, page]
+        row = f"{page:<22}"
+        for mode in modes:
+            env = dict(os.environ, CHART_MODE=mode)
+            result = subprocess.run(
+                [sys.executable, __file__, "--page", json.dumps(args)],
+                env=env, capture_output=True, text=True, check=True
+            )
+            first, rerun = json.loads(result.stdout.strip().splitlines()[-1])
+            row += f"{first * 1000:>13.0f} ms{rerun * 1000:>13.0f} ms"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
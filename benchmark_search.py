@@ -0,0 +1,100 @@
+"""
+Benchmark lead search through search_index
+
+Usage:
+    python benchmark_search.py [leads]
+
+    leads is the number of synthetic leads (default 1000000). They are kept in the
+    memory backend; the index is built on the first search, and then each query is
+    timed against the built index, followed by incremental updates.
+"""
+import gc
+import random
+import sys
+import time
+
+import storage
+import shared_cache
+import search_index
+
+FIRST_NAMES = ["Ahmed", "Ali", "Bilal", "Sana", "Ayesha", "Hamza", "Zainab", "Usman", "Fatima",
+               "Imran", "Saad", "Hira", "Kashif", "Nadia", "Omar", "Rabia", "Tariq", "Yasir"]
+LAST_NAMES = ["Khan", "Malik", "Qureshi", "Butt", "Sheikh", "Chaudhry", "Raza", "Siddiqui",
+              "Abbasi", "Mirza", "Hashmi", "Javed"]
+CITIES = ["Islamabad", "RawalPindi", "Taxila", "Wahcantt", "Lahore", "Karachi"]
+REMARKS = ["", "", "call back after Eid", "wants net metering", "quoted 10 KW hybrid",
+           "visit site on Monday", "asked for financing options", "roof survey done"]
+
+
+def generate_leads(count):
+    """Generate synthetic leads with realistic names, phones and remarks"""
+    rng = random.Random(42)
+    return [{
+        "id": lead_id,
+        "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "phone": f"03{rng.randint(0, 49):02d}-{rng.randint(1000000, 9999999)}",
+        "customer_code": f"Evr{lead_id:03d}",
+        "sector": f"G-{rng.randint(1, 15)}",
+        "city": rng.choice(CITIES),
+        "remarks": rng.choice(REMARKS),
+        "status": "Open",
+        "source": "Referral",
+        "assigned_to": "Unassigned",
+        "date_created": "2025-01-01"
+    } for lead_id in range(1, count + 1)]
+
+
+def timed(label, func, repeat=5):
+    """Run func `repeat` times and print the mean wall time"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<32} {elapsed * 1000:>10.2f} ms")
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    print(f"Generating {count:,} leads...")
+    leads = generate_leads(count)
+    storage.set_backend("memory")
+    storage.save_leads(leads)
+    shared_cache.get_leads()
+
+    timed("build index (first search)", lambda: search_index.search_leads("khan"), repeat=1)
+    print(f"  {search_index.get_stats()['words']:,} words indexed")
+    # Collect the build's garbage now rather than during the first timed query
+    gc.collect()
+
+    phone = leads[count // 2]["phone"]
+    digits = phone.replace("-", "")
+    queries = [
+        ("phone as stored", phone),
+        ("phone digits only", digits),
+        ("phone +92", "+92 " + digits[1:]),
+        ("subscriber number", digits[-7:]),
+        ("phone prefix", digits[:6]),
+        ("customer code", leads[count // 3]["customer_code"]),
+        ("name", "ahmed"),
+        ("full name", "ahmed khan"),
+        ("name prefix", "ayes"),
+        ("misspelt name", "qurehsi"),
+        ("name + city", "bilal raza lahore"),
+        ("remarks word", "financing"),
+        ("very short prefix", "03"),
+    ]
+    print("search (20 results):")
+    for label, query in queries:
+        timed(f"{label} ({query})", lambda: search_index.search_leads(query))
+
+    print("incremental updates:")
+    lead = dict(leads[0], name="Renamed Customer", phone="0300-1234567")
+    timed("upsert_lead", lambda: storage.upsert_lead(dict(lead, version=shared_cache.get_lead(1).get("version", 0))), repeat=20)
+    found, _ = search_index.search_leads("0300-1234567")
+    print(f"  renamed lead found: {[match['id'] for match in found] == [1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark the lead storage backends (json, sqlite and memory)
+
+Usage:
+    python benchmark_storage.py [sizes]
+
+    sizes is a comma-separated list of lead counts (default 1000,100000,1000000).
+    Each run works on a throwaway copy in a temporary directory.
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import storage
+import local_db
+import memory_db
+import sqlite_db
+
+STATUSES = ["Open", "Fake Lead", "Lost", "Not Interested", "Quote Shared", "Won"]
+SOURCES = ["Organic Search", "Paid Ads", "Social Media", "Referral", "Walk-In"]
+CITIES = ["Islamabad", "RawalPindi", "Taxila", "Wahcantt", "Lahore", "Karachi"]
+REPS = ["Unassigned", "Syed Adeel", "Saad Saleem", "Muhammad Abdullah"]
+
+
+def generate_leads(count):
+    """Generate synthetic leads shaped like the ones the lead forms create"""
+    rng = random.Random(42)
+    today = datetime.now()
+    leads = []
+    for lead_id in range(1, count + 1):
+        leads.append({
+            "id": lead_id,
+            "name": f"Customer {lead_id}",
+            "phone": f"03{rng.randint(100000000, 999999999)}",
+            "sector": f"G-{rng.randint(1, 15)}",
+            "city": rng.choice(CITIES),
+            "monthly_bill": rng.randint(5000, 100000),
+            "required_system": f"{rng.randint(3, 20)} KW",
+            "system_type": rng.choice(["On Grid", "HyBrid", "OFF Grid"]),
+            "status": rng.choice(STATUSES),
+            "source": rng.choice(SOURCES),
+            "assigned_to": rng.choice(REPS),
+            "remarks": "",
+            "date_created": (today - timedelta(days=rng.randint(0, 365))).strftime("%Y-%m-%d"),
+            "customer_code": f"Evr{lead_id:03d}"
+        })
+    return leads
+
+
+def timed(label, func, repeat=1):
+    """Run func `repeat` times and print the mean wall time"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<30} {elapsed * 1000:>10.2f} ms")
+    return result
+
+
+def use_directory(directory):
+    """Point the file-based backends at `directory` and empty the memory backend"""
+    local_db.LEADS_FILE = os.path.join(directory, "leads.json")
+    local_db.LEADS_LOG_FILE = os.path.join(directory, "leads.log")
+    local_db.COUNTERS_FILE = os.path.join(directory, "counters.json")
+    local_db.USERS_FILE = os.path.join(directory, "users.json")
+    local_db._leads = None
+    sqlite_db.DB_FILE = os.path.join(directory, "evergreen.db")
+    memory_db.reset()
+
+
+def run_backend(name, leads):
+    """Time the operations the dashboard performs against one backend"""
+    today = datetime.now()
+    filters = {
+        "status": "Quote Shared",
+        "city": "Islamabad",
+        "date_from": (today - timedelta(days=30)).strftime("%Y-%m-%d"),
+        "date_to": today.strftime("%Y-%m-%d")
+    }
+    rep_filters = {"assigned_to": "Syed Adeel", "status": "Open"}
+    lead_id = leads[len(leads) // 2]["id"]
+    lead = {}
+
+    def upsert_lead():
+        # Save on top of the previous save, as an editing session would
+        lead.update(storage.upsert_lead(lead))
+
+    print(f"{name} ({storage.get_backend().__name__}):")
+    timed("bulk save", lambda: storage.save_leads(leads))
+    if name == "json":
+        # Measure a cold load, not the warm in-process copy
+        local_db._leads = None
+    stored = timed("cold load_leads", storage.load_leads)
+    # Edit the lead as stored: the bulk save gave it its version
+    lead.update(next(stored_lead for stored_lead in stored if stored_lead["id"] == lead_id), status="Won")
+    timed("upsert_lead (x100)", upsert_lead, repeat=100)
+    matches = timed("query_leads (admin filters)", lambda: storage.query_leads(filters), repeat=5)
+    timed("query_leads (rep filters)", lambda: storage.query_leads(rep_filters, "-date_created", 50), repeat=5)
+    timed("count_leads", lambda: storage.count_leads(rep_filters), repeat=5)
+    timed("get_next_customer_code", storage.get_next_customer_code, repeat=5)
+    timed("allocate_customer_code (x100)", storage.allocate_customer_code, repeat=100)
+    print(f"  ({len(matches)} leads matched the admin filters)")
+
+
+def main():
+    sizes = [int(size) for size in (sys.argv[1] if len(sys.argv) > 1 else "1000,100000,1000000").split(",")]
+
+    for size in sizes:
+        print(f"\n=== {size:,} leads ===")
+        leads = generate_leads(size)
+        for name in ["json", "sqlite", "memory"]:
+            with tempfile.TemporaryDirectory() as directory:
+                use_directory(directory)
+                storage.set_backend(name)
+                run_backend(name, leads)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,10 +26,28 @@ a = Analysis(
         ('data', 'data'),
         ('app.py', '.'),
         ('auth.py', '.'),
+        ('credentials.py', '.'),
+        ('login_tracker.py', '.'),
         ('views.py', '.'),
         ('admin_view.py', '.'),
         ('sales_view.py', '.'),
         ('database.py', '.'),
+        ('storage.py', '.'),
+        ('local_db.py', '.'),
+        ('sqlite_db.py', '.'),
+        ('memory_db.py', '.'),
+        ('shared_cache.py', '.'),
+        ('lead_index.py', '.'),
+        ('search_index.py', '.'),
+        ('lead_export.py', '.'),
+        ('lead_import.py', '.'),
+        ('lead_router.py', '.'),
+        ('activity_log.py', '.'),
+        ('lead_analytics.py', '.'),
+        ('kpi.py', '.'),
+        ('sales_cube.py', '.'),
+        ('charts.py', '.'),
+        ('chart_cache.py', '.'),
     ],
     hiddenimports=['streamlit', 'pandas', 'numpy', 'matplotlib', 'seaborn', 'PIL'],
     hookspath=[],
@@ -0,0 +1,107 @@
+"""
+Process-wide LRU cache of rendered chart images
+
+Rasterizing a matplotlib figure usually takes longer than everything else on a
+page, and most reruns draw the same charts from the same numbers. Images are
+keyed by chart type, drawing options and a hash of the aggregated input data,
+and the least recently used ones are evicted once the cache holds more than
+CHART_CACHE_MB of image bytes.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Total size of the cached images
+CHART_CACHE_BYTES = int(float(os.environ.get("CHART_CACHE_MB", "32")) * 1024 * 1024)
+
+_lock = threading.Lock()
+_images = OrderedDict()  # key -> image bytes, least recently used first
+_size = 0
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0,
+}
+
+def chart_key(chart_type, data, options):
+    """
+    Build the cache key of a chart
+
+    Args:
+        chart_type (str): Name of the chart renderer
+        data: Chart input (a DataFrame, Series, or anything with a stable repr)
+        options (dict): Drawing options (titles, labels, colors...)
+
+    Returns:
+        str: Hex digest identifying the rendered image
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(chart_type.encode())
+    digest.update(repr(sorted(options.items())).encode())
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        if isinstance(data, pd.DataFrame):
+            digest.update(repr(list(data.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    else:
+        digest.update(repr(data).encode())
+    return digest.hexdigest()
+
+def get_or_render(chart_type, data, render, **options):
+    """
+    Get a chart image from the cache, rendering and storing it on a miss
+
+    Args:
+        chart_type (str): Name of the chart renderer
+        data: Chart input passed to render
+        render (callable): Called as render(data, **options); returns image bytes
+        **options: Drawing options, part of the cache key
+
+    Returns:
+        bytes: The rendered image
+    """
+    global _size
+
+    key = chart_key(chart_type, data, options)
+    with _lock:
+        image = _images.get(key)
+        if image is not None:
+            _images.move_to_end(key)
+            _stats["hits"] += 1
+            return image
+        _stats["misses"] += 1
+
+    # Render outside the lock; two sessions missing on the same chart both render it
+    image = render(data, **options)
+
+    with _lock:
+        if key not in _images and len(image) <= CHART_CACHE_BYTES:
+            _images[key] = image
+            _size += len(image)
+            while _size > CHART_CACHE_BYTES:
+                _, evicted = _images.popitem(last=False)
+                _size -= len(evicted)
+                _stats["evictions"] += 1
+    return image
+
+def clear():
+    """Drop all cached images"""
+    global _size
+    with _lock:
+        _images.clear()
+        _size = 0
+
+def get_stats():
+    """Get hit/miss/eviction counters, the hit rate and the cache size"""
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return dict(
+            _stats,
+            hit_rate=round(_stats["hits"] / lookups, 3) if lookups else 0.0,
+            images=len(_images),
+            bytes=_size,
+            budget_bytes=CHART_CACHE_BYTES,
+        )
@@ -0,0 +1,313 @@
+"""
+Chart drawing shared by the dashboard views
+
+Each function draws one kind of chart from already aggregated data and shows it
+on the page. CHART_MODE picks how:
+
+- "native" (default): a Vega-Lite spec drawn by the browser, so nothing is
+  rendered on the server and matplotlib is never imported
+- "image": a matplotlib/seaborn figure rendered to PNG and kept in chart_cache,
+  so a rerun with unchanged numbers reuses the image instead of drawing it again
+
+matplotlib and seaborn are imported on first use, so they only load in image mode
+or when a chart is exported with chart_png.
+"""
+import io
+import os
+
+import pandas as pd
+import streamlit as st
+
+import chart_cache
+
+CHART_MODES = ["native", "image"]
+CHART_MODE = os.environ.get("CHART_MODE", "native").strip().lower()
+
+def get_chart_mode():
+    """Get the configured chart mode, rejecting unknown values"""
+    if CHART_MODE not in CHART_MODES:
+        raise ValueError(f"Unknown chart mode '{CHART_MODE}'. Choose one of: {', '.join(CHART_MODES)}")
+    return CHART_MODE
+
+def _figure(figsize):
+    """Create a standalone matplotlib figure with one axes (no pyplot global state)"""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    return fig, fig.subplots()
+
+def _png(fig):
+    """Rasterize a figure with the same settings st.pyplot uses"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=200, bbox_inches="tight")
+    return buffer.getvalue()
+
+def _with_labels(data, column, value_format):
+    """Add a _label column with each value formatted for display"""
+    return data.assign(_label=[value_format.format(v) for v in data[column]])
+
+def _render_line(data, x, y, title, xlabel, ylabel):
+    fig, ax = _figure((12, 6))
+    ax.plot(data[x], data[y], marker='o', linestyle='-')
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.grid(True, alpha=0.3)
+    return _png(fig)
+
+def _render_bar(data, x, y, title, xlabel, ylabel, color, value_format, figsize):
+    fig, ax = _figure(figsize)
+    if color is None:
+        import seaborn as sns
+        sns.barplot(x=x, y=y, data=data, ax=ax)
+    else:
+        ax.bar(data[x], data[y], color=color)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis="x", labelrotation=45)
+    if value_format:
+        # Label each bar with its value
+        for i, v in enumerate(data[y]):
+            ax.text(i, v, value_format.format(v), ha='center', va='bottom')
+    return _png(fig)
+
+def _render_barh(data, label, value, title, xlabel, colors, value_format):
+    fig, ax = _figure((10, 6))
+    ax.barh(data[label], data[value], color=colors)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    if value_format:
+        # Label each bar with its value
+        for i, v in enumerate(data[value]):
+            ax.text(v, i, value_format.format(v), va='center')
+    return _png(fig)
+
+def _render_grouped_bar(data, x, bars, title, xlabel, ylabel):
+    fig, ax = _figure((10, 6))
+    positions = range(len(data[x]))
+    width = 0.7 / len(bars)
+    for offset, (column, label, color) in enumerate(bars):
+        ax.bar([i + offset * width for i in positions], data[column], width, label=label, color=color)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.set_xticks([i + width * (len(bars) - 1) / 2 for i in positions])
+    ax.set_xticklabels(data[x], rotation=45)
+    ax.legend()
+    return _png(fig)
+
+def _render_pie(data, names, values):
+    fig, ax = _figure((8, 8))
+    ax.pie(data[values], labels=data[names], autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')
+    return _png(fig)
+
+def _render_scatter(data, x, y, title, xlabel, ylabel):
+    fig, ax = _figure((12, 6))
+    ax.scatter(data[x], data[y])
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.grid(True, alpha=0.3)
+    return _png(fig)
+
+def _field_type(data, column):
+    """Get the Vega-Lite type of a column"""
+    if pd.api.types.is_datetime64_any_dtype(data[column]):
+        return "temporal"
+    if pd.api.types.is_numeric_dtype(data[column]):
+        return "quantitative"
+    return "nominal"
+
+def _spec_line(data, x, y, title, xlabel, ylabel):
+    return {
+        "data": {"values": data},
+        "title": title,
+        "mark": {"type": "line", "point": True},
+        "encoding": {
+            "x": {"field": x, "type": _field_type(data, x), "title": xlabel},
+            "y": {"field": y, "type": "quantitative", "title": ylabel},
+        },
+    }
+
+def _spec_bar(data, x, y, title, xlabel, ylabel, color, value_format, figsize):
+    bars = {
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": x, "type": "nominal", "title": xlabel, "sort": None, "axis": {"labelAngle": -45}},
+            "y": {"field": y, "type": "quantitative", "title": ylabel},
+            "color": {"value": color} if color else {"field": x, "type": "nominal", "legend": None},
+        },
+    }
+    layers = [bars]
+    if value_format:
+        data = _with_labels(data, y, value_format)
+        layers.append({
+            "mark": {"type": "text", "dy": -6},
+            "encoding": {
+                "x": {"field": x, "type": "nominal", "sort": None},
+                "y": {"field": y, "type": "quantitative"},
+                "text": {"field": "_label"},
+            },
+        })
+    return {"data": {"values": data}, "title": title, "layer": layers}
+
+def _spec_barh(data, label, value, title, xlabel, colors, value_format):
+    color = {"field": label, "type": "nominal", "legend": None, "sort": None}
+    if colors:
+        color["scale"] = {"range": list(colors)}
+    layers = [{
+        "mark": "bar",
+        "encoding": {
+            "y": {"field": label, "type": "nominal", "title": None, "sort": None},
+            "x": {"field": value, "type": "quantitative", "title": xlabel},
+            "color": color,
+        },
+    }]
+    if value_format:
+        data = _with_labels(data, value, value_format)
+        layers.append({
+            "mark": {"type": "text", "align": "left", "dx": 3},
+            "encoding": {
+                "y": {"field": label, "type": "nominal", "sort": None},
+                "x": {"field": value, "type": "quantitative"},
+                "text": {"field": "_label"},
+            },
+        })
+    return {"data": {"values": data}, "title": title, "layer": layers}
+
+def _spec_grouped_bar(data, x, bars, title, xlabel, ylabel):
+    # Name the value columns after their legend labels, then fold them into rows
+    data = data.rename(columns={column: label for column, label, _ in bars})
+    labels = [label for _, label, _ in bars]
+    return {
+        "data": {"values": data},
+        "title": title,
+        "transform": [{"fold": labels, "as": ["series", "value"]}],
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": x, "type": "nominal", "title": xlabel, "sort": None, "axis": {"labelAngle": -45}},
+            "xOffset": {"field": "series", "sort": labels},
+            "y": {"field": "value", "type": "quantitative", "title": ylabel},
+            "color": {
+                "field": "series",
+                "type": "nominal",
+                "title": None,
+                "scale": {"domain": labels, "range": [color for _, _, color in bars]},
+            },
+        },
+    }
+
+def _spec_pie(data, names, values):
+    total = data[values].sum()
+    data = data.assign(_label=[f"{v / total * 100:.1f}%" if total else "" for v in data[values]])
+    return {
+        "data": {"values": data},
+        "height": 360,
+        "encoding": {
+            "theta": {"field": values, "type": "quantitative", "stack": True},
+            "color": {"field": names, "type": "nominal", "sort": None},
+            "order": {"field": values, "type": "quantitative", "sort": "descending"},
+        },
+        "layer": [
+            {"mark": {"type": "arc", "outerRadius": 140}},
+            {"mark": {"type": "text", "radius": 165}, "encoding": {"text": {"field": "_label"}}},
+        ],
+    }
+
+def _spec_scatter(data, x, y, title, xlabel, ylabel):
+    return {
+        "data": {"values": data},
+        "title": title,
+        "mark": "point",
+        "encoding": {
+            "x": {"field": x, "type": "quantitative", "title": xlabel},
+            "y": {"field": y, "type": "quantitative", "title": ylabel},
+        },
+    }
+
+# Chart type -> (matplotlib renderer returning PNG bytes, Vega-Lite spec builder)
+_CHARTS = {
+    "line": (_render_line, _spec_line),
+    "bar": (_render_bar, _spec_bar),
+    "barh": (_render_barh, _spec_barh),
+    "grouped_bar": (_render_grouped_bar, _spec_grouped_bar),
+    "pie": (_render_pie, _spec_pie),
+    "scatter": (_render_scatter, _spec_scatter),
+}
+
+def chart_png(chart_type, data, **options):
+    """
+    Render a chart to PNG bytes regardless of the chart mode (e.g. for a download)
+
+    Args:
+        chart_type (str): One of the chart types in _CHARTS
+        data (pd.DataFrame): Chart input, as passed to the matching *_chart function
+        **options: The chart's drawing options
+
+    Returns:
+        bytes: The PNG image
+    """
+    render, _ = _CHARTS[chart_type]
+    return chart_cache.get_or_render(chart_type, data, render, **options)
+
+def _show(chart_type, data, **options):
+    if get_chart_mode() == "native":
+        _, build_spec = _CHARTS[chart_type]
+        spec = build_spec(data, **options)
+        st.vega_lite_chart(spec.pop("data")["values"], spec, width="stretch")
+    else:
+        st.image(chart_png(chart_type, data, **options), width="stretch")
+
+def line_chart(data, x, y, title, xlabel, ylabel):
+    """Show a line chart with a marker per point"""
+    _show("line", data[[x, y]], x=x, y=y, title=title, xlabel=xlabel, ylabel=ylabel)
+
+def bar_chart(data, x, y, title, xlabel, ylabel, color=None, value_format=None, figsize=(12, 6)):
+    """
+    Show a vertical bar chart
+
+    Args:
+        data (pd.DataFrame): One row per bar
+        x (str): Column with the bar labels
+        y (str): Column with the bar heights
+        title (str), xlabel (str), ylabel (str): Chart texts
+        color (str): Single bar color (default: the seaborn palette)
+        value_format (str): Format for a value label on each bar, e.g. "{:.1f}d"
+        figsize (tuple): Figure size in inches
+    """
+    _show(
+        "bar", data[[x, y]], x=x, y=y, title=title, xlabel=xlabel, ylabel=ylabel,
+        color=color, value_format=value_format, figsize=figsize
+    )
+
+def barh_chart(data, label, value, title, xlabel, colors=None, value_format=None):
+    """Show a horizontal bar chart (colors may be a list, cycled over the bars)"""
+    _show(
+        "barh", data[[label, value]], label=label, value=value, title=title,
+        xlabel=xlabel, colors=colors, value_format=value_format
+    )
+
+def grouped_bar_chart(data, x, bars, title, xlabel, ylabel):
+    """
+    Show side-by-side bars per x value
+
+    Args:
+        data (pd.DataFrame): One row per x value
+        x (str): Column with the group labels
+        bars (list): (column, legend label, color) for each bar in a group
+        title (str), xlabel (str), ylabel (str): Chart texts
+    """
+    columns = [x] + [column for column, _, _ in bars]
+    _show(
+        "grouped_bar", data[columns], x=x, bars=tuple(bars), title=title,
+        xlabel=xlabel, ylabel=ylabel
+    )
+
+def pie_chart(data, names, values):
+    """Show a pie chart with percentage labels"""
+    _show("pie", data[[names, values]], names=names, values=values)
+
+def scatter_chart(data, x, y, title, xlabel, ylabel):
+    """Show a scatter plot"""
+    _show("scatter", data[[x, y]], x=x, y=y, title=title, xlabel=xlabel, ylabel=ylabel)
@@ -0,0 +1,176 @@
+"""
+Password hashing and the cached username index used for logins
+
+Passwords are stored as salted slow hashes from the standard library (scrypt by
+default, or PBKDF2-SHA256), in the form "scheme$parameters$salt$hash", and
+compared in constant time. The hash cost is a deliberate, tunable part of every
+login (PASSWORD_HASH_SCHEME, SCRYPT_N, PBKDF2_ITERATIONS).
+
+Accounts saved before hashing still hold their plaintext password. They are
+verified as before and rehashed on their first successful login, as are hashes
+made with an older scheme or cost.
+
+Users are looked up through a case-folded username index. It is kept with the
+cached users in shared_cache and rebuilt only when the users change.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+
+import shared_cache
+import storage
+
+PASSWORD_HASH_SCHEME = os.environ.get("PASSWORD_HASH_SCHEME", "scrypt").strip().lower()
+
+# scrypt cost: N (CPU/memory, a power of two), r (block size), p (parallelism)
+SCRYPT_N = int(os.environ.get("SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+PBKDF2_ITERATIONS = int(os.environ.get("PBKDF2_ITERATIONS", "600000"))
+
+# Default password of accounts that never had one set (as before hashing)
+DEFAULT_PASSWORD = "password123"
+
+SALT_BYTES = 16
+
+_lock = threading.Lock()
+_by_username = {}  # case-folded username -> user
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+def _scrypt(password, salt, n, r, p):
+    # OpenSSL's default 32 MB limit is too small for larger N
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+def hash_password(password):
+    """
+    Hash a password with a fresh salt and the configured scheme and cost
+
+    Args:
+        password (str): The plaintext password
+
+    Returns:
+        str: The encoded hash to store in the user record
+    """
+    salt = secrets.token_bytes(SALT_BYTES)
+    if PASSWORD_HASH_SCHEME == "scrypt":
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    if PASSWORD_HASH_SCHEME == "pbkdf2_sha256":
+        digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+    raise ValueError(f"Unknown password hash scheme '{PASSWORD_HASH_SCHEME}'. Choose scrypt or pbkdf2_sha256")
+
+def is_hashed(stored):
+    """Check whether a stored password is a hash made by hash_password"""
+    return isinstance(stored, str) and stored.startswith(("scrypt$", "pbkdf2_sha256$"))
+
+def verify_password(password, stored):
+    """
+    Check a password against a stored hash (or a legacy plaintext password)
+
+    Args:
+        password (str): The password that was entered
+        stored (str): The stored hash or plaintext password
+
+    Returns:
+        bool: True if the password matches
+    """
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode("utf-8"), str(stored).encode("utf-8"))
+
+    scheme, *params = stored.split("$")
+    try:
+        if scheme == "scrypt":
+            n, r, p, salt, expected = params
+            digest = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+        else:
+            iterations, salt, expected = params
+            digest = _pbkdf2(password, base64.b64decode(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest, base64.b64decode(expected))
+
+def needs_rehash(stored):
+    """Check whether a stored password is plaintext or uses another scheme or cost than configured"""
+    if not is_hashed(stored):
+        return True
+    if PASSWORD_HASH_SCHEME == "scrypt":
+        return not stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return not stored.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+# Verified against when the username doesn't exist, so unknown and known usernames take
+# as long to reject
+_dummy_hash = None
+
+def _spend_hash_time(password):
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(8))
+    verify_password(password, _dummy_hash)
+
+def _rebuild_index(users):
+    """Rebuild the username index from the cached users"""
+    with _lock:
+        _by_username.clear()
+        for user in users:
+            _by_username[user["username"].casefold()] = dict(user)
+
+def find_user(username):
+    """
+    Look up a user by username, ignoring case
+
+    Returns:
+        dict: A copy of the user record, or None if there is no such user
+    """
+    shared_cache.refresh_users()
+    with _lock:
+        user = _by_username.get((username or "").casefold())
+        return dict(user) if user is not None else None
+
+def check_credentials(username, password):
+    """
+    Verify a login and return the active user it belongs to
+
+    A plaintext or outdated stored password is replaced by a fresh hash once it
+    has been verified.
+
+    Returns:
+        dict: The user record, or None if the username/password is wrong or the
+            account is not active
+    """
+    user = find_user(username)
+    if user is None:
+        _spend_hash_time(password)
+        return None
+
+    stored = user.get("password", DEFAULT_PASSWORD)
+    if not verify_password(password, stored) or user.get("status") != "Active":
+        return None
+
+    if needs_rehash(stored):
+        try:
+            set_password(user["username"], password)
+        except storage.ConflictError:
+            # Edited meanwhile; the password is rehashed on a later login
+            pass
+    return user
+
+def set_password(username, password):
+    """Hash and store a new password for a user (raises storage.ConflictError on a concurrent edit)"""
+    for user in storage.load_users():
+        if user["username"].casefold() == username.casefold():
+            user["password"] = hash_password(password)
+            storage.upsert_user(user)
+            return True
+    return False
+
+shared_cache.register_user_view(_rebuild_index)
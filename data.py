@@ -1,12 +1,41 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import io
 import os
+import hashlib
+import threading
 from pathlib import Path
 
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional; without it the CSV is read on every load
+    feather = None
+
 # Data file path
 DATA_FILE = Path("data/sales_data.csv")
 
+# Typed columnar copy of DATA_FILE (Arrow IPC), rebuilt whenever the CSV is newer
+COLUMNAR_FILE = DATA_FILE.with_suffix(".arrow")
+
+# "arrow" (default, needs pyarrow) or "csv" to always read the CSV
+SALES_DATA_FORMAT = os.environ.get("SALES_DATA_FORMAT", "arrow").strip().lower()
+
+# Column types of the sales data; dates are parsed to datetime64
+CATEGORY_COLUMNS = ["sales_rep", "product", "region"]
+INTEGER_COLUMNS = ["units_sold", "revenue"]
+
+# Also compare content hashes when the CSV's mtime/size change, so rewriting it with
+# the same content (a copy, a touch) keeps the cached frame
+HASH_SALES_DATA = os.environ.get("SALES_DATA_HASH", "").strip().lower() in ("1", "true", "yes")
+
+# Bytes before a read position that must be unchanged for the CSV to count as appended to
+_APPEND_CHECK_BYTES = 4096
+
+# Parsed sales data shared by all sessions: (path, columns) -> (signature, hash, frame)
+_data_cache = {}
+_data_cache_lock = threading.Lock()
+
 def generate_mock_data():
     """
     Generate mock sales data for demonstration purposes
@@ -51,58 +80,269 @@ def generate_mock_data():
     
     return pd.DataFrame(data)
 
+def apply_types(df):
+    """
+    Convert sales data columns to their real types
+    
+    Args:
+        df (pd.DataFrame): Sales data as read from CSV (any subset of the columns)
+    
+    Returns:
+        pd.DataFrame: The same DataFrame with datetime dates, categorical
+            rep/product/region and integer units/revenue
+    """
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"])
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("int64")
+    return df
+
+def use_columnar():
+    """Check whether sales data is loaded from the columnar copy"""
+    return feather is not None and SALES_DATA_FORMAT == "arrow"
+
+def write_columnar(df):
+    """
+    Write a typed copy of the sales data to the columnar file
+    
+    Args:
+        df (pd.DataFrame): Sales data to write
+    """
+    # Uncompressed and in a single chunk, so loads can use the memory-mapped columns
+    # as they are instead of decoding and concatenating them
+    tmp_file = COLUMNAR_FILE.with_name(COLUMNAR_FILE.name + ".tmp")
+    feather.write_feather(
+        apply_types(df.copy()), tmp_file, compression="uncompressed", chunksize=max(len(df), 1)
+    )
+    os.replace(tmp_file, COLUMNAR_FILE)
+
 def save_data(df):
     """
-    Save data to CSV file
+    Save data to CSV file (and the columnar copy, if enabled)
     
     Args:
         df (pd.DataFrame): DataFrame to save
     """
+    # Cached frames may map the columnar file, so release them before it is replaced
+    invalidate_data_cache()
+    
     # Create data directory if it doesn't exist
     os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
     df.to_csv(DATA_FILE, index=False)
+    
+    # Written after the CSV so it doesn't look stale on the next load
+    if use_columnar():
+        write_columnar(df)
+
+def invalidate_data_cache():
+    """Drop the cached sales data so the next load reads the file again"""
+    with _data_cache_lock:
+        _data_cache.clear()
+
+def _file_signature(path):
+    """Get the modification time and size of a file"""
+    stat = path.stat()
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _file_hash(path):
+    """Hash a file's content in chunks"""
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _read_data(columns=None):
+    """Read the sales data from disk (the columnar copy if enabled, else the CSV)"""
+    if not use_columnar():
+        return apply_types(pd.read_csv(DATA_FILE, usecols=columns))
+    
+    if not COLUMNAR_FILE.exists() or COLUMNAR_FILE.stat().st_mtime_ns < DATA_FILE.stat().st_mtime_ns:
+        write_columnar(pd.read_csv(DATA_FILE))
+    
+    table = feather.read_table(COLUMNAR_FILE, columns=columns, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+def _shared_view(df):
+    """Get a copy of a cached frame that can't write through to the cache"""
+    # With copy-on-write (always on from pandas 3) a shallow copy shares the data and
+    # only copies a column when it is first modified; older pandas needs a real copy
+    if int(pd.__version__.split(".")[0]) >= 3 or pd.get_option("mode.copy_on_write") is True:
+        return df.copy(deep=False)
+    return df.copy()
 
-def load_data():
+def data_signature():
+    """Get the sales file's modification time and size, or None if it doesn't exist"""
+    return _file_signature(DATA_FILE) if DATA_FILE.exists() else None
+
+def _tail(f, size):
+    """Read the bytes of an open file just before `size`"""
+    start = max(0, size - _APPEND_CHECK_BYTES)
+    f.seek(start)
+    return f.read(size - start)
+
+def data_position():
+    """
+    Get how far the sales CSV has been read, to find the rows appended to it later
+    
+    Returns:
+        tuple: (size, the bytes before it), or None if the file doesn't exist
+    """
+    try:
+        with open(DATA_FILE, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            return size, _tail(f, size)
+    except FileNotFoundError:
+        return None
+
+def read_appended_data(position):
+    """
+    Read the sales rows appended to the CSV since a position
+    
+    Only complete lines are read; a row still being written is left for the next call.
+    
+    Args:
+        position (tuple): Position from data_position or a previous call
+    
+    Returns:
+        tuple: (DataFrame of the appended rows with their real types, new position), or
+            (None, None) if the file was replaced or rewritten rather than appended to
+    """
+    size, tail = position
+    try:
+        with open(DATA_FILE, "rb") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end < size or not tail.endswith(b"\n") or _tail(f, size) != tail:
+                return None, None
+            f.seek(size)
+            appended = f.read(end - size)
+    except FileNotFoundError:
+        return None, None
+    
+    appended = appended[:appended.rfind(b"\n") + 1]
+    position = (size + len(appended), (tail + appended)[-_APPEND_CHECK_BYTES:])
+    columns = pd.read_csv(DATA_FILE, nrows=0).columns.tolist()
+    if not appended:
+        return apply_types(pd.DataFrame(columns=columns)), position
+    return apply_types(pd.read_csv(io.BytesIO(appended), header=None, names=columns)), position
+
+def load_data(columns=None):
     """
-    Load sales data from CSV file or generate if not exists
+    Load sales data, generating mock data if none exists
+    
+    The parsed data is cached per process and reused until the CSV's modification
+    time or size changes (or save_data writes it). The CSV is converted to the
+    typed columnar file once (and again whenever the CSV is newer); loads then
+    read only the requested columns, memory-mapped.
+    
+    Args:
+        columns (list): Columns to load (default all)
     
     Returns:
         pd.DataFrame: DataFrame containing sales data
     """
     if not DATA_FILE.exists():
-        df = generate_mock_data()
-        save_data(df)
-        return df
+        save_data(apply_types(generate_mock_data()))
+    
+    key = (str(DATA_FILE), tuple(columns) if columns else None)
+    signature = _file_signature(DATA_FILE)
+    
+    with _data_cache_lock:
+        cached = _data_cache.get(key)
+        if cached is not None and cached[0] == signature:
+            return _shared_view(cached[2])
+        
+        content_hash = _file_hash(DATA_FILE) if HASH_SALES_DATA else None
+        if cached is not None and content_hash is not None and cached[1] == content_hash:
+            _data_cache[key] = (signature, content_hash, cached[2])
+            return _shared_view(cached[2])
+        
+        # The file changed: drop every cached frame of it (releasing their memory maps)
+        # before the columnar copy may be rewritten
+        for other in [other for other in _data_cache if other[0] == key[0]]:
+            del _data_cache[other]
+        df = _read_data(columns)
+        _data_cache[key] = (signature, content_hash, df)
+        return _shared_view(df)
+
+def _value_mask(column, values):
+    """Get a boolean array marking the rows whose column holds one of the values"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Compare the small integer category codes instead of the labels
+        codes = column.cat.categories.get_indexer(values)
+        codes = codes[codes >= 0]
+        row_codes = column.cat.codes.to_numpy()
+        if len(codes) == 1:
+            return row_codes == codes[0]
+        # Several values: look each row's code up in a table of wanted codes (the extra
+        # last slot is for code -1, a missing value)
+        wanted = np.zeros(len(column.cat.categories) + 1, dtype=bool)
+        wanted[codes] = True
+        return wanted[row_codes]
+    return column.isin(values).to_numpy()
+
+def _date_mask(column, start_date=None, end_date=None):
+    """Get a boolean array marking the rows dated within the bounds (inclusive)"""
+    if pd.api.types.is_datetime64_any_dtype(column):
+        dates = column.to_numpy()
+        start = np.datetime64(pd.Timestamp(start_date), "D") if start_date is not None else None
+        # Anything before the next midnight is still on end_date
+        end = np.datetime64(pd.Timestamp(end_date), "D") + 1 if end_date is not None else None
+        if start is not None and end is not None:
+            return (dates >= start) & (dates < end)
+        return dates >= start if start is not None else dates < end
     
-    return pd.read_csv(DATA_FILE)
+    # Untyped data: compare YYYY-MM-DD strings
+    dates = column.astype(str)
+    mask = np.ones(len(column), dtype=bool)
+    if start_date is not None:
+        mask &= (dates >= pd.Timestamp(start_date).strftime("%Y-%m-%d")).to_numpy()
+    if end_date is not None:
+        mask &= (dates <= pd.Timestamp(end_date).strftime("%Y-%m-%d")).to_numpy()
+    return mask
 
 def get_filtered_data(data, filters=None):
     """
     Filter data based on provided filters
     
+    All filters are combined into one boolean mask, so nothing is copied until
+    the matching rows are taken (and not at all if every row matches).
+    
     Args:
         data (pd.DataFrame): Data to filter
-        filters (dict): Dictionary of filters to apply
+        filters (dict): Dictionary of filters to apply. 'start_date'/'end_date'
+            bound the date (inclusive; strings or dates); 'sales_rep', 'product'
+            and 'region' take one value or a list of values ('All' matches any)
     
     Returns:
         pd.DataFrame: Filtered DataFrame
     """
-    if filters is None:
+    if not filters:
         return data
     
-    filtered_data = data.copy()
+    masks = []
     
-    if 'start_date' in filters and 'end_date' in filters:
-        filtered_data = filtered_data[(filtered_data['date'] >= filters['start_date']) & 
-                                     (filtered_data['date'] <= filters['end_date'])]
+    if filters.get('start_date') is not None or filters.get('end_date') is not None:
+        masks.append(_date_mask(data['date'], filters.get('start_date'), filters.get('end_date')))
     
-    if 'sales_rep' in filters and filters['sales_rep'] != 'All':
-        filtered_data = filtered_data[filtered_data['sales_rep'] == filters['sales_rep']]
+    for column in ['sales_rep', 'product', 'region']:
+        value = filters.get(column)
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        if value is None or not values or 'All' in values:
+            continue
+        masks.append(_value_mask(data[column], values))
     
-    if 'product' in filters and filters['product'] != 'All':
-        filtered_data = filtered_data[filtered_data['product'] == filters['product']]
+    if not masks:
+        return data
     
-    if 'region' in filters and filters['region'] != 'All':
-        filtered_data = filtered_data[filtered_data['region'] == filters['region']]
+    mask = masks[0].copy()
+    for other in masks[1:]:
+        mask &= other
     
-    return filtered_data
+    if mask.all():
+        return data
+    return data[mask]
@@ -5,6 +5,7 @@ import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import db
 from dotenv import load_dotenv
+from storage import parse_customer_code
 
 # Load environment variables
 load_dotenv()
@@ -81,48 +82,43 @@ def load_users():
     
     return users
 
-def get_next_lead_id():
-    """Get the next available lead ID"""
-    leads = load_leads()
-    if not leads:
-        return 1
-    return max(lead["id"] for lead in leads) + 1
+def _seed_counter(name):
+    """Compute a counter's starting value from the stored leads (only used once per counter)"""
+    leads = [lead for lead in load_leads() if lead]
+    if name == "lead_id":
+        return max((lead["id"] for lead in leads), default=0) + 1
+    if name == "customer_code":
+        numbers = [parse_customer_code(lead.get("customer_code")) for lead in leads]
+        return max((number for number in numbers if number is not None), default=0) + 1
+    raise ValueError(f"Unknown counter: {name}")
 
-def update_user_last_login(username):
-    """Update the last login timestamp for a user"""
-    users = load_users()
-    for user in users:
-        # Case-insensitive comparison for username
-        if user["username"].lower() == username.lower():
-            user["last_login"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-            break
-    save_users(users)
+def peek_counter(name):
+    """Get the next value a counter will hand out, without reserving it"""
+    value = db.reference(f'/counters/{name}').get()
+    return value if value is not None else _seed_counter(name)
 
-def get_next_customer_code():
-    """Get the next available customer code in the format Evr001, Evr002, etc."""
-    leads = load_leads()
-    
-    if not leads:
-        return "Evr001"  # First customer code
-    
-    # Extract existing codes
-    existing_codes = []
-    for lead in leads:
-        if "customer_code" in lead and lead["customer_code"].startswith("Evr"):
-            try:
-                # Extract the numeric part
-                code_num = int(lead["customer_code"][3:])
-                existing_codes.append(code_num)
-            except ValueError:
-                # Skip if the format is not as expected
-                continue
-    
-    if not existing_codes:
-        return "Evr001"  # No valid codes found
-    
-    # Get the next number and format it
-    next_num = max(existing_codes) + 1
-    return f"Evr{next_num:03d}"  # Format with leading zeros
+def allocate_counter(name, count=1):
+    """Reserve `count` consecutive values from a counter and return the first"""
+    ref = db.reference(f'/counters/{name}')
+    seed = _seed_counter(name) if ref.get() is None else None
+
+    # Firebase retries the transaction if another client changed the counter meanwhile
+    def reserve(current):
+        return (current if current is not None else seed) + count
+
+    return ref.transaction(reserve) - count
+
+def update_users_last_login(logins):
+    """Set the last login timestamp of several users with one multi-path update"""
+    # Case-insensitive comparison for username
+    by_name = {username.lower(): timestamp for username, timestamp in logins.items()}
+    updates = {}
+    for i, user in enumerate(load_users()):
+        timestamp = by_name.get(user["username"].lower())
+        if timestamp is not None:
+            updates[f"{i}/last_login"] = timestamp
+    if updates:
+        db.reference('/users').update(updates)
 
 # Function to initialize the database with data from local files (for migration)
 def migrate_local_data_to_firebase():
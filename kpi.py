@@ -0,0 +1,124 @@
+"""
+Lead KPI counters for the admin dashboard
+
+Counts the leads in total, per status, per source, and per rep and status, as a
+view of shared_cache: the counters are tallied once when the leads are loaded and
+then moved by the change of each lead that is added, edited or deleted, so the
+dashboard reads its KPIs without going over the leads.
+
+check_consistency tallies the leads in storage from scratch and compares the result
+with the counters, to verify that the updates kept them right.
+"""
+import threading
+
+import shared_cache
+import storage
+
+WON_STATUS = "Won"
+
+_lock = threading.RLock()
+_counters = None  # see tally
+
+def _bump(counts, key, sign):
+    count = counts.get(key, 0) + sign
+    if count:
+        counts[key] = count
+    else:
+        counts.pop(key, None)
+
+def _count(counters, lead, sign):
+    counters["total"] += sign
+    _bump(counters["status"], lead.get("status"), sign)
+    _bump(counters["source"], lead.get("source"), sign)
+    rep = counters["reps"].setdefault(lead.get("assigned_to"), {})
+    _bump(rep, lead.get("status"), sign)
+    if not rep:
+        del counters["reps"][lead.get("assigned_to")]
+
+def tally(leads):
+    """
+    Count leads from scratch
+
+    Returns:
+        dict: total, status (status -> leads), source (source -> leads) and
+            reps (assigned_to -> status -> leads)
+    """
+    counters = {"total": 0, "status": {}, "source": {}, "reps": {}}
+    for lead in leads:
+        _count(counters, lead, 1)
+    return counters
+
+def rebuild(leads):
+    """Tally the counters from a dict of id -> lead"""
+    global _counters
+    with _lock:
+        _counters = tally(leads.values())
+
+def apply(old, new):
+    """Move the counters for one lead that was added (old is None), edited, or deleted (new is None)"""
+    with _lock:
+        if _counters is None:
+            return
+        if old is not None:
+            _count(_counters, old, -1)
+        if new is not None:
+            _count(_counters, new, 1)
+
+def get_kpis():
+    """
+    Get the dashboard KPIs from the counters
+
+    Returns:
+        dict: total, won and conversion_rate (percent), status and source counts, and
+            reps (assigned_to -> {"assigned", "won"}); leads without a value are
+            counted in the totals only
+    """
+    shared_cache.refresh_leads()
+    with _lock:
+        total = _counters["total"]
+        won = _counters["status"].get(WON_STATUS, 0)
+        return {
+            "total": total,
+            "won": won,
+            "conversion_rate": won / total * 100 if total else 0.0,
+            "status": {status: count for status, count in _counters["status"].items() if status is not None},
+            "source": {source: count for source, count in _counters["source"].items() if source is not None},
+            "reps": {
+                rep: {"assigned": sum(statuses.values()), "won": statuses.get(WON_STATUS, 0)}
+                for rep, statuses in _counters["reps"].items() if rep is not None
+            },
+        }
+
+def _differences(name, kept, fresh):
+    if isinstance(kept, dict):
+        found = []
+        for key in sorted(set(kept) | set(fresh), key=str):
+            missing = {} if isinstance(kept.get(key, fresh.get(key)), dict) else 0
+            found.extend(_differences(f"{name}[{key!r}]", kept.get(key, missing), fresh.get(key, missing)))
+        return found
+    return [f"{name}: counted {kept}, storage has {fresh}"] if kept != fresh else []
+
+def check_consistency(repair=False):
+    """
+    Tally the leads in storage from scratch and compare them with the counters
+
+    Leads written while the check reads storage can show up as differences.
+
+    Args:
+        repair (bool): Replace the counters with the fresh tally if they differ
+
+    Returns:
+        list: Descriptions of the counters that differ (empty if all match)
+    """
+    global _counters
+    shared_cache.refresh_leads()
+    fresh = tally(lead for chunk in storage.iter_leads() for lead in chunk)
+    with _lock:
+        differences = []
+        for name in ["total", "status", "source", "reps"]:
+            differences.extend(_differences(name, _counters[name], fresh[name]))
+        if differences and repair:
+            _counters = fresh
+        return differences
+
+shared_cache.register_view(rebuild, apply)
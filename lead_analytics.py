@@ -0,0 +1,212 @@
+"""
+Incremental lead lifecycle statistics: time to close and time in status
+
+Leads carry their status history (see storage.next_lead_version). From it this
+module keeps, per rep and over all reps, running statistics of how long leads took
+to close (by the status they closed with) and how long they stayed in each status
+before moving on. The statistics are a view of shared_cache: built once when the
+leads are loaded and then updated lead by lead (an edit removes the lead's old
+durations and adds its new ones), so the dashboard reads them without going over
+the leads.
+
+Percentiles come from a DurationSketch, which counts durations in logarithmic
+buckets; they (and min/max) are accurate to SKETCH_RELATIVE_ACCURACY. Count and mean
+are exact. Durations are attributed to the lead's current owner.
+"""
+import math
+import threading
+from datetime import datetime
+
+import shared_cache
+from storage import CLOSED_LEAD_STATUSES
+
+SKETCH_RELATIVE_ACCURACY = 0.01
+
+# Percentiles reported by summaries
+PERCENTILES = [50, 90]
+
+class DurationSketch:
+    """
+    Count, mean, min, max and percentiles of durations in seconds, with removals
+
+    Durations fall into buckets whose bounds are within a relative accuracy of each
+    other (as in DDSketch), so the sketch is as large as the range of durations, not
+    their number, and a duration is removed again by taking it out of its bucket. A
+    bucket reports the mean of its durations, which is exact for a lone duration.
+    """
+
+    def __init__(self, accuracy=SKETCH_RELATIVE_ACCURACY):
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets = {}  # bucket index -> [count, total] of durations of a second or more
+        self._zero = 0      # durations under a second
+        self._summary = None
+        self.count = 0
+        self.total = 0
+
+    def add(self, seconds, weight=1):
+        """Count a duration (a negative weight removes it again)"""
+        seconds = int(seconds)
+        self.count += weight
+        self.total += seconds * weight
+        self._summary = None
+        if seconds < 1:
+            self._zero += weight
+            return
+        index = math.ceil(math.log(seconds) / self._log_gamma)
+        bucket = self._buckets.setdefault(index, [0, 0])
+        bucket[0] += weight
+        bucket[1] += seconds * weight
+        if not bucket[0]:
+            del self._buckets[index]
+
+    def remove(self, seconds):
+        """Remove a duration counted with add"""
+        self.add(seconds, -1)
+
+    def _bucket_value(self, index):
+        count, total = self._buckets[index]
+        return total / count
+
+    def quantiles(self, fractions):
+        """Get the durations at the given fractions (0-1, ascending) of the count, or None if empty"""
+        if self.count <= 0:
+            return [None] * len(fractions)
+        results = []
+        targets = iter(fractions)
+        target = next(targets)
+        seen = self._zero
+        while seen > target * (self.count - 1):
+            results.append(0.0)
+            target = next(targets, None)
+            if target is None:
+                return results
+        for index in sorted(self._buckets):
+            seen += self._buckets[index][0]
+            while seen > target * (self.count - 1):
+                results.append(self._bucket_value(index))
+                target = next(targets, None)
+                if target is None:
+                    return results
+        return results + [self._bucket_value(max(self._buckets))] * (len(fractions) - len(results))
+
+    def summary(self):
+        """
+        Get the statistics in days (computed once per change)
+
+        Returns:
+            dict: count, mean, min, max and p50/p90 (None while the sketch is empty)
+        """
+        if self._summary is None:
+            days = [None if value is None else value / 86400
+                    for value in self.quantiles([0.0] + [p / 100 for p in PERCENTILES] + [1.0])]
+            self._summary = {
+                "count": self.count,
+                "mean": self.total / self.count / 86400 if self.count > 0 else None,
+                "min": days[0],
+                "max": days[-1],
+            }
+            self._summary.update((f"p{p}", value) for p, value in zip(PERCENTILES, days[1:-1]))
+        return dict(self._summary)
+
+def _time(value):
+    """Parse a lead timestamp ("YYYY-MM-DD HH:MM:SS" or a date), or None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def lead_durations(lead):
+    """
+    Get the durations a lead contributes to the statistics
+
+    Returns:
+        list: ("close", status, seconds) for a lead closed by a status change, and
+            ("status", status, seconds) for every status the lead has left
+    """
+    history = lead.get("status_history")
+    if not history:
+        return []
+    durations = []
+    # Leads from before the history was kept started on their creation date
+    entered = _time(lead.get("created_at") or lead.get("date_created"))
+    start = entered
+    for change in history:
+        at = _time(change.get("at"))
+        if change.get("from") is not None and entered is not None and at is not None and at >= entered:
+            durations.append(("status", change["from"], (at - entered).total_seconds()))
+        entered = at
+
+    last = history[-1]
+    closed = _time(lead.get("closed_at"))
+    if (lead.get("status") in CLOSED_LEAD_STATUSES and last.get("from") is not None
+            and start is not None and closed is not None and closed >= start):
+        durations.append(("close", lead["status"], (closed - start).total_seconds()))
+    return durations
+
+_lock = threading.RLock()
+_sketches = {}  # (kind, status, rep or None for all reps) -> DurationSketch
+
+def _count(lead, weight):
+    rep = lead.get("assigned_to") or "Unassigned"
+    for kind, status, seconds in lead_durations(lead):
+        for key in ((kind, status, rep), (kind, status, None)):
+            sketch = _sketches.get(key)
+            if sketch is None:
+                sketch = _sketches[key] = DurationSketch()
+            sketch.add(seconds, weight)
+            if sketch.count == 0:
+                del _sketches[key]
+
+def _rebuild(leads):
+    with _lock:
+        _sketches.clear()
+        for lead in leads.values():
+            _count(lead, 1)
+
+def _apply(old, new):
+    with _lock:
+        if old is not None:
+            _count(old, -1)
+        if new is not None:
+            _count(new, 1)
+
+def time_to_close_by_rep(status="Won"):
+    """
+    Get time-to-close statistics per rep for the leads closed with a status
+
+    Returns:
+        dict: rep -> summary (see DurationSketch.summary), sorted by rep
+    """
+    shared_cache.refresh_leads()
+    with _lock:
+        return {
+            rep: sketch.summary() for (kind, closed_with, rep), sketch in sorted(
+                _sketches.items(), key=lambda item: str(item[0][2]))
+            if kind == "close" and closed_with == status and rep is not None
+        }
+
+def time_to_close(status="Won", rep=None):
+    """Get time-to-close statistics of the leads closed with a status, for a rep or all reps (None if there are none)"""
+    shared_cache.refresh_leads()
+    with _lock:
+        sketch = _sketches.get(("close", status, rep))
+        return sketch.summary() if sketch is not None else None
+
+def time_in_status(rep=None):
+    """
+    Get how long leads stayed in each status before moving on, for a rep or all reps
+
+    Returns:
+        dict: status -> summary (see DurationSketch.summary)
+    """
+    shared_cache.refresh_leads()
+    with _lock:
+        return {
+            status: sketch.summary() for (kind, status, owner), sketch in sorted(_sketches.items(), key=lambda item: item[0][1])
+            if kind == "status" and owner == rep
+        }
+
+shared_cache.register_view(_rebuild, _apply)
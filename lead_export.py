@@ -0,0 +1,221 @@
+"""
+Background lead exports to CSV, Excel or Parquet
+
+An export runs in its own worker thread. It reads the matching leads from storage
+EXPORT_CHUNK_ROWS at a time (storage.iter_leads) and appends each chunk to a file
+under EXPORT_DIR, so memory stays bounded by the chunk size however many leads are
+exported, and the page that started it keeps responding. The job's progress is kept
+here for the page to poll, and the finished file is offered for download. Finished
+exports are deleted after EXPORT_RETENTION_SECONDS.
+
+Excel needs openpyxl and Parquet needs pyarrow; formats whose library isn't
+installed are not offered.
+"""
+import csv
+import importlib.util
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import storage
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join("data", "exports"))
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "2000"))
+EXPORT_RETENTION_SECONDS = float(os.environ.get("EXPORT_RETENTION_SECONDS", "3600"))
+
+# Columns of an export, in order
+EXPORT_COLUMNS = [
+    "id", "name", "customer_code", "phone", "sector", "city", "monthly_bill",
+    "required_system", "system_type", "status", "source", "assigned_to", "remarks",
+    "date_created", "created_at", "closed_at",
+]
+INTEGER_COLUMNS = ["id"]
+
+FORMATS = {
+    "csv": {"label": "CSV", "extension": "csv", "mime": "text/csv", "module": None},
+    "xlsx": {
+        "label": "Excel",
+        "extension": "xlsx",
+        "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "module": "openpyxl",
+    },
+    "parquet": {"label": "Parquet", "extension": "parquet", "mime": "application/vnd.apache.parquet", "module": "pyarrow"},
+}
+
+# Rows of one Excel worksheet, less the header
+XLSX_MAX_ROWS = 1_048_575
+
+_lock = threading.Lock()
+_jobs = {}  # job id -> job record
+
+class ExportCancelled(Exception):
+    """Raised inside a worker when its export was cancelled"""
+
+def available_formats():
+    """Get the export formats whose libraries are installed"""
+    return [
+        fmt for fmt, spec in FORMATS.items()
+        if spec["module"] is None or importlib.util.find_spec(spec["module"]) is not None
+    ]
+
+def _row(lead):
+    return [lead.get(column) for column in EXPORT_COLUMNS]
+
+def _text(value):
+    return None if value is None else str(value)
+
+def _write_csv(path, chunks, progress):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for chunk in chunks:
+            writer.writerows(_row(lead) for lead in chunk)
+            progress(len(chunk))
+
+def _write_xlsx(path, chunks, progress):
+    from openpyxl import Workbook
+
+    # Write-only workbooks stream rows out instead of keeping every cell in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Leads")
+    sheet.append(EXPORT_COLUMNS)
+    for chunk in chunks:
+        for lead in chunk:
+            sheet.append(_row(lead))
+        progress(len(chunk))
+    workbook.save(path)
+
+def _write_parquet(path, chunks, progress):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Lead fields aren't typed consistently (monthly_bill can be a number or text),
+    # so everything but the integer columns is written as text
+    schema = pa.schema([
+        (column, pa.int64() if column in INTEGER_COLUMNS else pa.string())
+        for column in EXPORT_COLUMNS
+    ])
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            columns = {
+                column: [lead.get(column) if column in INTEGER_COLUMNS else _text(lead.get(column)) for lead in chunk]
+                for column in EXPORT_COLUMNS
+            }
+            writer.write_table(pa.table(columns, schema=schema))
+            progress(len(chunk))
+
+_WRITERS = {
+    "csv": _write_csv,
+    "xlsx": _write_xlsx,
+    "parquet": _write_parquet,
+}
+
+def start_export(filters=None, order=None, fmt="csv"):
+    """
+    Start exporting the leads matching filters in a background thread
+
+    Args:
+        filters (dict): Filters as accepted by storage.query_leads
+        order (str): Sort order as accepted by storage.query_leads (default "id")
+        fmt (str): One of available_formats()
+
+    Returns:
+        str: Job id, for get_job and cancel_export
+    """
+    if fmt not in available_formats():
+        raise ValueError(f"Unsupported export format: {fmt}")
+    _clean_up()
+
+    job_id = uuid.uuid4().hex
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    extension = FORMATS[fmt]["extension"]
+    job = {
+        "id": job_id,
+        "format": fmt,
+        "status": "running",
+        "rows": 0,
+        "total": None,
+        "file_name": f"leads_export_{stamp}.{extension}",
+        "path": os.path.join(EXPORT_DIR, f"leads_export_{stamp}_{job_id[:8]}.{extension}"),
+        "error": None,
+        "cancelled": False,
+        "started_at": time.time(),
+        "finished_at": None,
+    }
+    with _lock:
+        _jobs[job_id] = job
+    threading.Thread(
+        target=_run, args=(job, filters, order), name=f"lead-export-{job_id[:8]}", daemon=True
+    ).start()
+    return job_id
+
+def _run(job, filters, order):
+    partial = job["path"] + ".part"
+
+    def progress(rows):
+        with _lock:
+            job["rows"] += rows
+            if job["cancelled"]:
+                raise ExportCancelled()
+
+    try:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        total = storage.count_leads(filters)
+        if job["format"] == "xlsx" and total > XLSX_MAX_ROWS:
+            raise ValueError(f"{total:,} leads don't fit in one Excel sheet; export them as CSV or Parquet")
+        with _lock:
+            job["total"] = total
+        _WRITERS[job["format"]](partial, storage.iter_leads(filters, order, EXPORT_CHUNK_ROWS), progress)
+        # Only a complete file gets the final name
+        os.replace(partial, job["path"])
+        status, error = "done", None
+    except ExportCancelled:
+        status, error = "cancelled", None
+    except Exception as e:
+        status, error = "failed", str(e)
+
+    if status != "done" and os.path.exists(partial):
+        os.remove(partial)
+    with _lock:
+        job["status"] = status
+        job["error"] = error
+        job["finished_at"] = time.time()
+
+def get_job(job_id):
+    """Get a copy of an export job's record, or None if it is unknown or expired"""
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+def cancel_export(job_id):
+    """Ask a running export to stop after its current chunk"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None and job["status"] == "running":
+            job["cancelled"] = True
+
+def _clean_up():
+    """Forget expired jobs and delete their files, and any files left by earlier runs"""
+    now = time.time()
+    with _lock:
+        expired = [
+            job for job in _jobs.values()
+            if job["finished_at"] is not None and now - job["finished_at"] > EXPORT_RETENTION_SECONDS
+        ]
+        for job in expired:
+            del _jobs[job["id"]]
+        in_use = {job["path"] for job in _jobs.values()}
+
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        if path in in_use or path.endswith(".part") and path[:-len(".part")] in in_use:
+            continue
+        try:
+            if now - os.path.getmtime(path) > EXPORT_RETENTION_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
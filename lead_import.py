@@ -0,0 +1,326 @@
+"""
+Bulk lead import from CSV, Excel or JSON Lines
+
+Rows are read one at a time from the file, validated, and collected into batches of
+IMPORT_BATCH_ROWS valid leads. Each batch gets its lead ids and customer codes as one
+block from the storage counters and is stored with a single storage.insert_leads
+write, so memory stays bounded by the batch size and the number of writes by the
+number of batches. Invalid rows are skipped and reported with their row numbers.
+
+Checks per row: name and phone are required; the phone must be a Pakistani number
+(stored as its digits, +92 written as 0); city, source, status and system type must
+be one of the dashboard's options; assigned_to must be an active sales rep or
+Unassigned; and a phone or customer code may not repeat one already stored or an
+earlier row of the file.
+
+Excel needs openpyxl.
+"""
+import csv
+import io
+import json
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+import storage
+import shared_cache
+import lead_router
+from search_index import normalize_phone
+
+IMPORT_BATCH_ROWS = int(os.environ.get("IMPORT_BATCH_ROWS", "1000"))
+
+# Row errors kept for the report; rows beyond this are still counted
+MAX_REPORTED_ERRORS = 1000
+
+# The options offered by the lead forms
+LEAD_CITIES = ["Islamabad", "RawalPindi", "Taxila", "Wahcantt", "Lahore", "Karachi"]
+LEAD_SOURCES = ["Organic Search", "Paid Ads", "Social Media", "Referral", "Walk-In"]
+LEAD_STATUSES = ["Open", "Fake Lead", "Lost", "Not Interested", "Quote Shared", "Won"]
+SYSTEM_TYPES = ["On Grid", "HyBrid", "OFF Grid"]
+
+# Header spellings accepted besides the field names, e.g. the form labels
+COLUMN_ALIASES = {
+    "customer_name": "name",
+    "phone_no": "phone",
+    "monthly_avg._bill": "monthly_bill",
+    "monthly_avg_bill": "monthly_bill",
+}
+
+# Columns a CSV or Excel file must have
+REQUIRED_COLUMNS = ["name", "phone"]
+
+FORMATS = {
+    "csv": "CSV",
+    "xlsx": "Excel",
+    "jsonl": "JSON Lines",
+}
+
+# Mobile numbers have 11 digits (03xx-xxxxxxx), landlines 10 or 11 with the area code
+_PHONE = re.compile(r"0\d{9,10}")
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def format_of(file_name):
+    """Get the import format of a file from its extension, or None if unsupported"""
+    extension = os.path.splitext(file_name)[1].lower().lstrip(".")
+    if extension == "json":
+        extension = "jsonl"
+    return extension if extension in FORMATS else None
+
+def _column(header):
+    key = str(header or "").strip().lower().replace(" ", "_")
+    return COLUMN_ALIASES.get(key, key)
+
+def _check_columns(columns):
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"The file has no {' or '.join(missing)} column")
+
+@contextmanager
+def _text_stream(file):
+    """Open a text stream over a path or an open (binary or text) file"""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, newline="", encoding="utf-8-sig") as f:
+            yield f
+    elif isinstance(file, io.TextIOBase):
+        yield file
+    else:
+        stream = io.TextIOWrapper(file, newline="", encoding="utf-8-sig")
+        try:
+            yield stream
+        finally:
+            # Leave the caller's file open
+            stream.detach()
+
+def _read_csv(file):
+    with _text_stream(file) as stream:
+        reader = csv.reader(stream)
+        columns = [_column(header) for header in next(reader, [])]
+        _check_columns(columns)
+        # Row 1 is the header
+        for number, values in enumerate(reader, start=2):
+            if any(value.strip() for value in values):
+                yield number, dict(zip(columns, values))
+
+def _read_xlsx(file):
+    from openpyxl import load_workbook
+
+    # Read-only workbooks load rows as they are iterated instead of the whole sheet
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        columns = [_column(header) for header in next(rows, ())]
+        _check_columns(columns)
+        for number, values in enumerate(rows, start=2):
+            if any(value is not None and str(value).strip() for value in values):
+                yield number, dict(zip(columns, values))
+    finally:
+        workbook.close()
+
+def _read_jsonl(file):
+    with _text_stream(file) as stream:
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                yield number, {_column(key): value for key, value in record.items()}
+            else:
+                yield number, None
+
+_READERS = {
+    "csv": _read_csv,
+    "xlsx": _read_xlsx,
+    "jsonl": _read_jsonl,
+}
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+def _choice(record, field, options, default, errors):
+    """Get a field's value spelled as in options (matched case-insensitively); required if default is None"""
+    value = _text(record.get(field))
+    if not value:
+        if default is None:
+            errors.append(f"{field} is required")
+        return default
+    for option in options:
+        if option.lower() == value.lower():
+            return option
+    errors.append(f"{field} '{value}' is not one of: {', '.join(options)}")
+    return default
+
+def validate_lead(record, assignees, today):
+    """
+    Check one imported row and build the lead to store from it
+
+    Args:
+        record (dict): Column -> value of the row
+        assignees (list): Names leads may be assigned to (Unassigned included)
+        today (str): date_created for rows without one (YYYY-MM-DD)
+
+    Returns:
+        tuple: (lead without id, list of error messages)
+    """
+    errors = []
+
+    name = _text(record.get("name"))
+    if not name:
+        errors.append("name is required")
+
+    raw_phone = _text(record.get("phone"))
+    phone = normalize_phone(raw_phone)
+    if not raw_phone:
+        errors.append("phone is required")
+    elif not _PHONE.fullmatch(phone):
+        errors.append(f"phone '{raw_phone}' is not a valid phone number")
+
+    bill = record.get("monthly_bill")
+    try:
+        monthly_bill = int(float(_text(bill).replace(",", ""))) if _text(bill) else 0
+        if monthly_bill < 0:
+            raise ValueError
+    except ValueError:
+        errors.append(f"monthly_bill '{bill}' is not an amount")
+        monthly_bill = 0
+
+    date_created = _text(record.get("date_created"))[:10] or today
+    if not _DATE.fullmatch(date_created):
+        errors.append(f"date_created '{date_created}' is not a YYYY-MM-DD date")
+
+    lead = {
+        "name": name,
+        "phone": phone,
+        "sector": _text(record.get("sector")),
+        "city": _choice(record, "city", LEAD_CITIES, None, errors),
+        "monthly_bill": monthly_bill,
+        "required_system": _text(record.get("required_system")),
+        "system_type": _choice(record, "system_type", SYSTEM_TYPES, SYSTEM_TYPES[0], errors),
+        "status": _choice(record, "status", LEAD_STATUSES, "Open", errors),
+        "source": _choice(record, "source", LEAD_SOURCES, None, errors),
+        "assigned_to": _choice(record, "assigned_to", assignees, "Unassigned", errors),
+        "customer_code": _text(record.get("customer_code")) or None,
+        "remarks": _text(record.get("remarks")),
+        "date_created": date_created,
+    }
+    return lead, errors
+
+def sales_assignees():
+    """Get the names leads can be assigned to: Unassigned and the active sales reps"""
+    return ["Unassigned"] + [
+        user["name"] for user in shared_cache.get_users()
+        if user["status"] == "Active" and user["role"] == "sales"
+    ]
+
+def _stored_keys():
+    """Get the stored leads' normalized phones and customer codes, mapped to their lead ids"""
+    phones, codes = {}, {}
+    for chunk in storage.iter_leads(chunk_size=IMPORT_BATCH_ROWS):
+        for lead in chunk:
+            if lead.get("phone"):
+                phones.setdefault(normalize_phone(str(lead["phone"])), lead["id"])
+            if lead.get("customer_code"):
+                codes.setdefault(lead["customer_code"], lead["id"])
+    return phones, codes
+
+def _store_batch(batch, codes, routing_strategy=None):
+    """
+    Give a batch of leads ids and customer codes from one counter block each, and store it
+
+    codes maps the customer codes already taken to their owner; allocated codes are
+    added to it, and one a row of the file already claimed is skipped. With a
+    routing_strategy, unassigned leads are routed to reps by lead_router.
+    """
+    first_id = storage.allocate_counter("lead_id", len(batch))
+    for offset, lead in enumerate(batch):
+        lead["id"] = first_id + offset
+        if routing_strategy and lead["assigned_to"] == "Unassigned":
+            lead["assigned_to"] = lead_router.assign_lead(lead, routing_strategy)
+
+    missing_codes = [lead for lead in batch if lead["customer_code"] is None]
+    if missing_codes:
+        first_code = storage.allocate_counter("customer_code", len(missing_codes))
+        for offset, lead in enumerate(missing_codes):
+            code = storage.format_customer_code(first_code + offset)
+            while code in codes:
+                code = storage.allocate_customer_code()
+            lead["customer_code"] = code
+            codes[code] = f"lead #{lead['id']}"
+    try:
+        storage.insert_leads(batch)
+    except Exception:
+        # Nothing was stored: the reps the leads were routed to stop counting them
+        for lead in batch:
+            lead_router.release_lead(lead["id"])
+        raise
+
+def import_leads(file, fmt, dry_run=False, progress=None, routing_strategy=None):
+    """
+    Import leads from a file, a batch at a time
+
+    Args:
+        file: Path or open file (binary or text) to read
+        fmt (str): One of FORMATS
+        dry_run (bool): Only validate the rows; nothing is stored
+        progress (callable): Called as progress(rows_read, leads_imported) after each batch
+        routing_strategy (str): Route leads without an owner to reps with this
+            lead_router strategy (they stay Unassigned if None)
+
+    Returns:
+        dict: rows (rows read), imported (leads stored, or that would be in a dry run),
+            failed (rows skipped), errors (up to MAX_REPORTED_ERRORS (row, message)
+            pairs) and first_id / last_id of the stored leads
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+    assignees = sales_assignees()
+    today = datetime.now().strftime("%Y-%m-%d")
+    # Phones and customer codes taken so far -> "lead #id" or "row n", for duplicate checks
+    phones, codes = _stored_keys()
+    phones = {phone: f"lead #{lead_id}" for phone, lead_id in phones.items()}
+    codes = {code: f"lead #{lead_id}" for code, lead_id in codes.items()}
+
+    result = {"rows": 0, "imported": 0, "failed": 0, "errors": [], "first_id": None, "last_id": None}
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            _store_batch(batch, codes, routing_strategy)
+            if result["first_id"] is None:
+                result["first_id"] = batch[0]["id"]
+            result["last_id"] = batch[-1]["id"]
+        result["imported"] += len(batch)
+        batch.clear()
+        if progress is not None:
+            progress(result["rows"], result["imported"])
+
+    for number, record in _READERS[fmt](file):
+        result["rows"] += 1
+        if record is None:
+            lead, errors = None, ["not a JSON object"]
+        else:
+            lead, errors = validate_lead(record, assignees, today)
+            if lead["phone"] and lead["phone"] in phones:
+                errors.append(f"phone {lead['phone']} is already used by {phones[lead['phone']]}")
+            if lead["customer_code"] and lead["customer_code"] in codes:
+                errors.append(f"customer_code {lead['customer_code']} is already used by {codes[lead['customer_code']]}")
+
+        if errors:
+            result["failed"] += 1
+            if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                result["errors"].append((number, "; ".join(errors)))
+            continue
+
+        phones[lead["phone"]] = f"row {number}"
+        if lead["customer_code"]:
+            codes[lead["customer_code"]] = f"row {number}"
+        batch.append(lead)
+        if len(batch) >= IMPORT_BATCH_ROWS:
+            flush()
+
+    flush()
+    return result
@@ -0,0 +1,188 @@
+"""
+In-memory index of the cached leads for the lead filter bars
+
+For each filterable field the index maps a value to the set of lead ids that have
+it, and it keeps the lead ids sorted by date_created for range filters. It is
+registered as a view of shared_cache, so it is rebuilt when the leads are reloaded
+and updated lead by lead when a lead is added, edited or deleted. A filter query
+then costs roughly the size of its result instead of a scan over every lead.
+"""
+import bisect
+import math
+import threading
+
+import shared_cache
+from storage import normalize_lead_filters, sort_and_slice_leads, page_of_leads
+
+# Fields with an exact-match index; date_created has the sorted index instead
+INDEXED_FIELDS = ["status", "source", "city", "assigned_to", "customer_code"]
+
+_lock = threading.RLock()
+_values = {field: {} for field in INDEXED_FIELDS}  # field -> value -> set of ids
+_dates = []                                         # sorted (date_created, id) pairs
+_date_of = {}                                       # id -> date_created
+
+def _date_key(lead):
+    return (lead.get("date_created") or "", lead["id"])
+
+def _add(lead):
+    lead_id = lead["id"]
+    for field in INDEXED_FIELDS:
+        _values[field].setdefault(lead.get(field), set()).add(lead_id)
+    key = _date_key(lead)
+    bisect.insort(_dates, key)
+    _date_of[lead_id] = key[0]
+
+def _remove(lead):
+    lead_id = lead["id"]
+    for field in INDEXED_FIELDS:
+        ids = _values[field].get(lead.get(field))
+        if ids is not None:
+            ids.discard(lead_id)
+            if not ids:
+                del _values[field][lead.get(field)]
+    key = _date_key(lead)
+    i = bisect.bisect_left(_dates, key)
+    if i < len(_dates) and _dates[i] == key:
+        del _dates[i]
+    _date_of.pop(lead_id, None)
+
+def rebuild(leads):
+    """Rebuild the index from a dict of id -> lead"""
+    with _lock:
+        for index in _values.values():
+            index.clear()
+        for lead in leads.values():
+            for field in INDEXED_FIELDS:
+                _values[field].setdefault(lead.get(field), set()).add(lead["id"])
+        _dates[:] = sorted(_date_key(lead) for lead in leads.values())
+        _date_of.clear()
+        _date_of.update((lead_id, date) for date, lead_id in _dates)
+
+def _move(old, new):
+    """Update the index for an edited lead, touching only the fields that changed"""
+    lead_id = new["id"]
+    for field in INDEXED_FIELDS:
+        before, after = old.get(field), new.get(field)
+        if before != after:
+            ids = _values[field].get(before)
+            if ids is not None:
+                ids.discard(lead_id)
+                if not ids:
+                    del _values[field][before]
+            _values[field].setdefault(after, set()).add(lead_id)
+
+def apply(old, new):
+    """Update the index for one lead that was added (old is None), edited, or deleted (new is None)"""
+    with _lock:
+        if old is not None and new is not None and _date_key(old) == _date_key(new):
+            # The usual edit (e.g. a reassignment) keeps the date, so the sorted
+            # date list is left alone and the update costs the same at any size
+            _move(old, new)
+            return
+        if old is not None:
+            _remove(old)
+        if new is not None:
+            _add(new)
+
+def _field_ids(field, allowed):
+    """Get the ids of the leads whose field is one of the allowed values"""
+    if field == "id":
+        return {lead_id for lead_id in allowed if lead_id in _date_of}
+    index = _values[field]
+    if len(allowed) == 1:
+        return index.get(next(iter(allowed)), set())
+    return set().union(*(index.get(value, ()) for value in allowed))
+
+def match_ids(filters=None):
+    """
+    Get the ids of the leads matching the given filters
+
+    Args:
+        filters (dict): Filters as accepted by storage.query_leads (single values or
+            lists; None, "All" and empty lists are ignored; date_from/date_to bound
+            date_created)
+
+    Returns:
+        set: Matching lead ids
+    """
+    normalized = normalize_lead_filters(filters)
+    date_from = normalized.pop("date_from", None)
+    date_to = normalized.pop("date_to", None)
+
+    shared_cache.refresh_leads()
+    with _lock:
+        candidates = [_field_ids(field, allowed) for field, allowed in normalized.items()]
+
+        if date_from or date_to:
+            lo = bisect.bisect_left(_dates, (date_from,)) if date_from else 0
+            hi = bisect.bisect_right(_dates, (date_to, math.inf)) if date_to else len(_dates)
+            # Use the date range as a candidate set only if it is the most selective one
+            if not candidates or hi - lo <= min(len(ids) for ids in candidates):
+                candidates.append({lead_id for _, lead_id in _dates[lo:hi]})
+                date_from = date_to = None
+
+        if not candidates:
+            return set(_date_of)
+
+        # Intersect starting from the smallest set so the work stays proportional to the result
+        candidates.sort(key=len)
+        result = set(candidates[0])
+        for ids in candidates[1:]:
+            if not result:
+                break
+            result &= ids
+
+        if date_from:
+            result = {lead_id for lead_id in result if _date_of[lead_id] >= date_from}
+        if date_to:
+            result = {lead_id for lead_id in result if _date_of[lead_id] <= date_to}
+        return result
+
+def query_leads(filters=None, order=None, limit=None, offset=0):
+    """
+    Query the cached leads through the index
+
+    Takes the same arguments as storage.query_leads.
+
+    Returns:
+        list: Matching read-only leads
+    """
+    leads = shared_cache.get_leads_by_ids(match_ids(filters))
+    return sort_and_slice_leads(leads, order, limit, offset)
+
+def page_leads(filters=None, order=None, limit=50, after=None):
+    """
+    Get one page of the cached leads through the index
+
+    Takes the same arguments as storage.page_leads; only the page is sorted.
+
+    Returns:
+        tuple: (read-only leads on the page, cursor of the next page or None)
+    """
+    leads = shared_cache.get_leads_by_ids(match_ids(filters))
+    return page_of_leads(leads, order, limit, after)
+
+def count_leads(filters=None):
+    """Count the cached leads matching the given filters"""
+    return len(match_ids(filters))
+
+def value_counts(field, lead_ids=None):
+    """
+    Count the cached leads per value of an indexed field
+
+    Args:
+        field (str): One of INDEXED_FIELDS
+        lead_ids (set): Only count these leads (e.g. from match_ids)
+
+    Returns:
+        dict: value -> number of leads
+    """
+    shared_cache.refresh_leads()
+    with _lock:
+        if lead_ids is None:
+            return {value: len(ids) for value, ids in _values[field].items()}
+        counts = {value: len(ids & lead_ids) for value, ids in _values[field].items()}
+        return {value: count for value, count in counts.items() if count}
+
+shared_cache.register_view(rebuild, apply)
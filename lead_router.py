@@ -0,0 +1,351 @@
+"""
+Automatic routing of new leads to sales reps
+
+A strategy picks the active sales rep a new lead is assigned to:
+
+- round_robin: the reps in turn
+- least_open: the rep with the fewest open leads
+- conversion: open leads weighed against the rep's conversion rate, so reps who
+  close more get proportionally more leads
+- affinity: the least loaded rep among those who already have leads in the lead's
+  sector (or else its city), unless they carry more than AFFINITY_SLACK more open
+  leads than the least loaded rep overall, who gets the lead then
+
+The router keeps per-rep counters of open, won and lost leads, and of leads per
+city and sector, as a view of shared_cache: they are counted once when the leads
+are loaded and then updated lead by lead. The reps are kept in a lazy min-heap per
+strategy and area, so a decision costs O(log reps) rather than a scan of the leads.
+A rep picked for a lead that isn't stored yet counts it right away, so the leads of
+one batch are spread out too; if the lead's save fails (release_lead) or it isn't
+stored within ROUTING_PENDING_TTL_SECONDS, the rep stops counting it.
+
+Every decision is appended to ROUTING_LOG_FILE as a line of JSON.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import shared_cache
+
+ROUTING_STRATEGY = os.environ.get("ROUTING_STRATEGY", "least_open")
+ROUTING_LOG_FILE = os.environ.get("ROUTING_LOG_FILE", os.path.join("data", "routing_log.jsonl"))
+# A routed lead not stored after this many seconds (an abandoned save) stops counting for its rep
+ROUTING_PENDING_TTL_SECONDS = float(os.environ.get("ROUTING_PENDING_TTL_SECONDS", "600"))
+
+STRATEGIES = {
+    "round_robin": "Round robin",
+    "least_open": "Fewest open leads",
+    "conversion": "Weighted by conversion rate",
+    "affinity": "City / sector affinity",
+}
+
+UNASSIGNED = "Unassigned"
+
+# How many more open leads than the least loaded rep (a share, plus a few) a rep
+# may carry and still get a lead for their area; without it the reps who start in
+# an area keep all of its leads
+AFFINITY_SLACK = 0.2
+AFFINITY_SLACK_LEADS = 3
+
+# Leads still being worked, and the closed ones that count towards conversion
+# (fake leads are closed but say nothing about the rep)
+OPEN_STATUSES = {"Open", "Quote Shared"}
+WON_STATUSES = {"Won"}
+LOST_STATUSES = {"Lost", "Not Interested"}
+
+class Router:
+    """Per-rep lead counters and the heaps the strategies pick reps from"""
+
+    def __init__(self, log=None):
+        """
+        Args:
+            log (callable): Called as log(decision) with a dict for every assignment
+        """
+        self.log = log
+        self._lock = threading.RLock()
+        self._reps = []
+        self._active = set()
+        self.rebuild({})
+
+    def rebuild(self, leads):
+        """Count the leads from scratch (a dict of id -> lead, as shared_cache passes them)"""
+        with self._lock:
+            self._open = {}
+            self._won = {}
+            self._lost = {}
+            self._areas = {}      # ("city", city) / ("sector", city, sector) -> rep -> leads
+            self._heaps = {}      # (strategy, area or None) -> heap of (key, rep)
+            self._rep_heaps = {}  # rep -> heap keys it has entries in
+            self._pending = {}    # lead id -> (the lead as counted when it was assigned, when), oldest first
+            self._turn = 0
+            for lead in leads.values():
+                self._count(lead, 1)
+
+    def set_reps(self, reps):
+        """Set the reps leads can be routed to"""
+        with self._lock:
+            reps = sorted(set(reps))
+            if reps != self._reps:
+                self._reps = reps
+                self._active = set(reps)
+                # Rebuilt lazily with the new reps
+                self._heaps.clear()
+                self._rep_heaps.clear()
+
+    def apply(self, old, new):
+        """Update the counters for one lead that was added (old is None), edited, or deleted (new is None)"""
+        with self._lock:
+            lead_id = (new or old)["id"]
+            pending = self._pending.pop(lead_id, None)
+            if pending is not None:
+                # Counted when it was assigned; count it again as stored
+                self._count(pending[0], -1)
+            elif old is not None:
+                self._count(old, -1)
+            if new is not None:
+                self._count(new, 1)
+
+    def release(self, lead_id):
+        """Stop counting a lead picked a rep by assign that won't be stored (its save failed)"""
+        with self._lock:
+            pending = self._pending.pop(lead_id, None)
+            if pending is not None:
+                self._count(pending[0], -1)
+
+    def _expire_pending(self):
+        """Release the leads assigned longer than ROUTING_PENDING_TTL_SECONDS ago and never stored"""
+        cutoff = time.monotonic() - ROUTING_PENDING_TTL_SECONDS
+        expired = []
+        for lead_id, (_, assigned_at) in self._pending.items():
+            if assigned_at >= cutoff:
+                break
+            expired.append(lead_id)
+        for lead_id in expired:
+            self.release(lead_id)
+
+    def _count(self, lead, sign):
+        rep = lead.get("assigned_to")
+        if not rep or rep == UNASSIGNED:
+            return
+        status = lead.get("status")
+        if status in OPEN_STATUSES:
+            self._open[rep] = self._open.get(rep, 0) + sign
+        elif status in WON_STATUSES:
+            self._won[rep] = self._won.get(rep, 0) + sign
+        elif status in LOST_STATUSES:
+            self._lost[rep] = self._lost.get(rep, 0) + sign
+
+        for area in self._lead_areas(lead):
+            reps = self._areas.setdefault(area, {})
+            count = reps.get(rep, 0) + sign
+            if count > 0:
+                changed = rep not in reps
+                reps[rep] = count
+            else:
+                changed = True
+                reps.pop(rep, None)
+                if not reps:
+                    del self._areas[area]
+            if changed:
+                # The area's reps changed; its heap is rebuilt on the next decision
+                self._heaps.pop(("least_open", area), None)
+
+        self._touch(rep)
+
+    @staticmethod
+    def _lead_areas(lead):
+        city = lead.get("city")
+        if not city:
+            return []
+        areas = [("city", city)]
+        if lead.get("sector"):
+            areas.append(("sector", city, lead["sector"]))
+        return areas
+
+    def conversion_rate(self, rep):
+        """Won share of the rep's closed leads, smoothed so new reps start at 50%"""
+        won = self._won.get(rep, 0)
+        return (won + 1) / (won + self._lost.get(rep, 0) + 2)
+
+    def _key(self, strategy, rep):
+        if strategy == "conversion":
+            return (self._open.get(rep, 0) + 1) / self.conversion_rate(rep)
+        return self._open.get(rep, 0)
+
+    def _touch(self, rep):
+        """Push the rep's new key into every heap it is in (older entries become stale)"""
+        heap_keys = self._rep_heaps.get(rep)
+        if not heap_keys:
+            return
+        for heap_key in list(heap_keys):
+            heap = self._heaps.get(heap_key)
+            if heap is None:
+                heap_keys.discard(heap_key)
+                continue
+            heapq.heappush(heap, (self._key(heap_key[0], rep), rep))
+            if len(heap) > 4 * len(self._active) + 16:
+                # Too many stale entries; start over from the current keys
+                del self._heaps[heap_key]
+
+    def _heap(self, strategy, area):
+        heap_key = (strategy, area)
+        heap = self._heaps.get(heap_key)
+        if heap is None:
+            reps = self._active if area is None else self._active.intersection(self._areas.get(area, ()))
+            heap = [(self._key(strategy, rep), rep) for rep in reps]
+            heapq.heapify(heap)
+            self._heaps[heap_key] = heap
+            for rep in reps:
+                self._rep_heaps.setdefault(rep, set()).add(heap_key)
+        return heap
+
+    def _pick(self, strategy, area=None):
+        """Get the rep with the lowest key in an area (all reps if None), or None"""
+        heap = self._heap(strategy, area)
+        members = self._active if area is None else self._areas.get(area, {})
+        while heap:
+            key, rep = heap[0]
+            if rep in self._active and rep in members and key == self._key(strategy, rep):
+                return rep
+            heapq.heappop(heap)
+        return None
+
+    def choose(self, lead, strategy):
+        """
+        Pick the rep for a lead without assigning it
+
+        Returns:
+            tuple: (rep or None if there are no reps, area the rep was picked from)
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        with self._lock:
+            if not self._reps:
+                return None, None
+            if strategy == "round_robin":
+                rep = self._reps[self._turn % len(self._reps)]
+                self._turn += 1
+                return rep, None
+            if strategy == "affinity":
+                least_loaded = self._pick("least_open")
+                limit = self._open.get(least_loaded, 0) * (1 + AFFINITY_SLACK) + AFFINITY_SLACK_LEADS
+                for area in reversed(self._lead_areas(lead)):
+                    rep = self._pick("least_open", area)
+                    if rep is not None and self._open.get(rep, 0) <= limit:
+                        return rep, area
+                return least_loaded, None
+            return self._pick(strategy), None
+
+    def assign(self, lead, strategy):
+        """
+        Pick the rep for a new lead and count the lead for it until it is stored
+
+        Args:
+            lead (dict): The new lead, with its id
+            strategy (str): One of STRATEGIES
+
+        Returns:
+            str: The rep's name, or Unassigned if there are no reps
+        """
+        with self._lock:
+            self._expire_pending()
+            # A lead assigned again (e.g. a retried save) counts once
+            self.release(lead["id"])
+            rep, area = self.choose(lead, strategy)
+            if rep is None:
+                return UNASSIGNED
+            open_before = self._open.get(rep, 0)
+            pending = dict(lead, assigned_to=rep)
+            self._pending[lead["id"]] = (pending, time.monotonic())
+            self._count(pending, 1)
+            if self.log is not None:
+                self.log({
+                    "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "lead_id": lead["id"],
+                    "strategy": strategy,
+                    "assigned_to": rep,
+                    "area": " / ".join(area[1:]) if area else None,
+                    "open_leads": open_before,
+                    "conversion_rate": round(self.conversion_rate(rep), 3),
+                })
+            return rep
+
+    def get_loads(self):
+        """Get each rep's open, won and lost lead counts"""
+        with self._lock:
+            self._expire_pending()
+            return {
+                rep: {"open": self._open.get(rep, 0), "won": self._won.get(rep, 0), "lost": self._lost.get(rep, 0)}
+                for rep in self._reps
+            }
+
+_log_lock = threading.Lock()
+
+def _log_decision(decision):
+    with _log_lock:
+        os.makedirs(os.path.dirname(ROUTING_LOG_FILE) or ".", exist_ok=True)
+        with open(ROUTING_LOG_FILE, "a") as f:
+            f.write(json.dumps(decision) + "\n")
+
+def _active_reps(users):
+    """Names of the active sales reps"""
+    return [user["name"] for user in users if user["status"] == "Active" and user["role"] == "sales"]
+
+_router = Router(log=_log_decision)
+
+def assign_lead(lead, strategy=None):
+    """
+    Pick the rep a new lead is routed to
+
+    Args:
+        lead (dict): The new lead, with its id (set its assigned_to to the result)
+        strategy (str): One of STRATEGIES (default ROUTING_STRATEGY)
+
+    Returns:
+        str: The rep's name, or Unassigned if there are no active reps
+    """
+    # Bring the counters up to date before taking the router's lock
+    shared_cache.refresh_leads()
+    shared_cache.refresh_users()
+    return _router.assign(lead, strategy or ROUTING_STRATEGY)
+
+def release_lead(lead_id):
+    """Stop counting a lead routed by assign_lead for its rep, when its save failed"""
+    _router.release(lead_id)
+
+def get_rep_loads():
+    """Get each active rep's open, won and lost lead counts"""
+    shared_cache.refresh_leads()
+    shared_cache.refresh_users()
+    return _router.get_loads()
+
+def recent_decisions(limit=20):
+    """Get the last routing decisions from the log, newest first"""
+    if not os.path.exists(ROUTING_LOG_FILE):
+        return []
+    with open(ROUTING_LOG_FILE, "rb") as f:
+        # The log only grows, so read just its tail (a decision is about 200 bytes)
+        start = max(0, os.path.getsize(ROUTING_LOG_FILE) - 400 * limit)
+        f.seek(start)
+        lines = f.read().decode("utf-8", "replace").splitlines()
+    if start:
+        # The first line may have been cut
+        lines = lines[1:]
+    decisions = []
+    for line in reversed(lines):
+        try:
+            decisions.append(json.loads(line))
+        except ValueError:
+            continue
+        if len(decisions) == limit:
+            break
+    return decisions
+
+def _rebuild_reps(users):
+    _router.set_reps(_active_reps(users))
+
+shared_cache.register_view(_router.rebuild, _router.apply)
+shared_cache.register_user_view(_rebuild_reps)
@@ -1,41 +1,373 @@
 import os
 import json
+import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
+from storage import normalize_lead_filters, lead_matches, sort_and_slice_leads, parse_customer_code
+from storage import check_version, check_new, check_unique_username, next_version, next_lead_version
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 # Define file paths for local data storage
 DATA_DIR = "data"
 LEADS_FILE = os.path.join(DATA_DIR, "leads.json")
+LEADS_LOG_FILE = os.path.join(DATA_DIR, "leads.log")
+COUNTERS_FILE = os.path.join(DATA_DIR, "counters.json")
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
 
+# Number of change-log entries after which the log is folded into the snapshot, once it
+# also has COMPACT_RATIO entries per stored lead; the ratio keeps the cost of rewriting
+# a large snapshot spread over as many changes (e.g. batches of a bulk import)
+COMPACT_THRESHOLD = int(os.environ.get("LEADS_COMPACT_THRESHOLD", "1000"))
+COMPACT_RATIO = 0.5
+
+_log = logging.getLogger(__name__)
+
 # Ensure data directory exists
 Path(DATA_DIR).mkdir(exist_ok=True)
 
+# In-process view of the lead store: snapshot (leads.json) + replayed change log (leads.log).
+# Leads are kept in a dict keyed by id so single-record changes never touch the other records.
+_leads_lock = threading.RLock()
+_leads = None
+_counters = {}
+_snapshot_stat = None
+_log_offset = 0
+_log_entries = 0
+
+# Serializes read-modify-write cycles of users.json within this process
+_users_lock = threading.Lock()
+
+@contextmanager
+def _file_lock(path):
+    """
+    Hold an exclusive advisory lock on a lock file, shared with other processes
+
+    Every process writing through this module takes the lock around its
+    read-modify-write, so writes from several app processes or scripts can't
+    interleave. The OS releases it if the process dies.
+    """
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            # msvcrt locks a byte range and gives up after ~10 seconds, so keep trying
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _file_stat(path):
+    """Return (mtime_ns, size) for a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _bump_counter(name, value):
+    """Raise a counter to at least `value`; counters never move backwards"""
+    if value > _counters.get(name, 1):
+        _counters[name] = value
+
+def _apply_log_entry(entry):
+    """Apply a single change-log entry to the in-memory store"""
+    if entry["op"] == "upsert":
+        lead = entry["lead"]
+        _leads[lead["id"]] = lead
+        # Keep the counters ahead of every stored lead, including imported or hand-edited ones
+        _bump_counter("lead_id", lead["id"] + 1)
+        code_num = parse_customer_code(lead.get("customer_code"))
+        if code_num is not None:
+            _bump_counter("customer_code", code_num + 1)
+    elif entry["op"] == "delete":
+        _leads.pop(entry["id"], None)
+    elif entry["op"] == "counter":
+        _bump_counter(entry["name"], entry["value"])
+
+def _replay_log(offset):
+    """
+    Replay change-log entries starting at a byte offset
+
+    A trailing line without a newline is an interrupted write and is left for the next replay
+    (the next append cuts it off). A complete line that isn't valid JSON is skipped.
+
+    Returns:
+        tuple: (new offset, number of entries applied)
+    """
+    if not os.path.exists(LEADS_LOG_FILE):
+        return 0, 0
+
+    applied = 0
+    with open(LEADS_LOG_FILE, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                _log.warning("Skipping unreadable line at byte %d of %s", offset - len(line), LEADS_LOG_FILE)
+                continue
+            _apply_log_entry(entry)
+            applied += 1
+    return offset, applied
+
+def _refresh_leads():
+    """Bring the in-memory lead store up to date with the files on disk"""
+    global _leads, _counters, _snapshot_stat, _log_offset, _log_entries
+
+    snapshot_stat = _file_stat(LEADS_FILE)
+    log_stat = _file_stat(LEADS_LOG_FILE)
+    log_size = log_stat[1] if log_stat else 0
+
+    # Full reload on first use, after a compaction, or if the log was truncated elsewhere
+    if _leads is None or snapshot_stat != _snapshot_stat or log_size < _log_offset:
+        _leads = {}
+        _counters = {}
+        if os.path.exists(COUNTERS_FILE):
+            with open(COUNTERS_FILE, 'r') as f:
+                _counters = json.load(f)
+        if snapshot_stat is not None:
+            with open(LEADS_FILE, 'r') as f:
+                for lead in json.load(f):
+                    _apply_log_entry({"op": "upsert", "lead": lead})
+        _snapshot_stat = snapshot_stat
+        _log_offset, _log_entries = _replay_log(0)
+    elif log_size > _log_offset:
+        # Only the tail written since our last read needs replaying
+        _log_offset, applied = _replay_log(_log_offset)
+        _log_entries += applied
+
+def _append_log(entries):
+    """Append change-log entries to the log file and apply them in memory"""
+    global _log_offset, _log_entries
+
+    if not entries:
+        return
+
+    # Callers hold the file lock and have replayed every complete line, so anything past
+    # _log_offset is the partial line of an interrupted write; cut it off rather than
+    # writing onto it
+    log_stat = _file_stat(LEADS_LOG_FILE)
+    if log_stat is not None and log_stat[1] > _log_offset:
+        os.truncate(LEADS_LOG_FILE, _log_offset)
+
+    # Binary, so the bytes written (and _log_offset) don't depend on newline translation
+    data = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries).encode("utf-8")
+    with open(LEADS_LOG_FILE, 'ab') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    for entry in entries:
+        _apply_log_entry(entry)
+    _log_offset += len(data)
+    _log_entries += len(entries)
+
+    if _log_entries >= max(COMPACT_THRESHOLD, COMPACT_RATIO * len(_leads)):
+        _compact_leads()
+
+def _write_json_atomic(path, data, indent=None):
+    """Write JSON to a temp file next to `path` and swap it in atomically"""
+    tmp_file = path + ".tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+    if hasattr(os, "O_DIRECTORY"):
+        # Make the rename itself durable
+        dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+@contextmanager
+def _locked_leads():
+    """Lock the lead store for a read-modify-write and bring it up to date"""
+    with _leads_lock, _file_lock(LEADS_FILE + ".lock"):
+        _refresh_leads()
+        yield
+
+def _compact_leads():
+    global _snapshot_stat, _log_offset, _log_entries
+
+    # Counters first: a crash before the snapshot swap still leaves them current
+    _write_json_atomic(COUNTERS_FILE, _counters)
+    _write_json_atomic(LEADS_FILE, list(_leads.values()), indent=4)
+
+    # Replaying the old log over the new snapshot is harmless, so truncating last is safe
+    open(LEADS_LOG_FILE, 'w').close()
+
+    _snapshot_stat = _file_stat(LEADS_FILE)
+    _log_offset = 0
+    _log_entries = 0
+
+def compact_leads():
+    """Fold the change log into the leads.json snapshot and truncate the log"""
+    with _locked_leads():
+        _compact_leads()
+
 def save_leads(leads):
-    """Save leads to local JSON file"""
-    with open(LEADS_FILE, 'w') as f:
-        json.dump(leads, f, indent=4)
+    """
+    Save leads to local storage
+
+    Only records that differ from the stored copy are written, as upsert/delete entries
+    appended to the change log, each with the next version of the stored record.
+    """
+    with _locked_leads():
+        entries = []
+        seen_ids = set()
+        for lead in leads:
+            seen_ids.add(lead["id"])
+            stored = _leads.get(lead["id"])
+            if stored != lead:
+                version = stored.get("version") if stored is not None else 0
+                entries.append({"op": "upsert", "lead": next_version(dict(lead, version=version))})
+        for lead_id in list(_leads):
+            if lead_id not in seen_ids:
+                entries.append({"op": "delete", "id": lead_id})
+
+        _append_log(entries)
 
 def load_leads():
-    """Load leads from local JSON file"""
-    if os.path.exists(LEADS_FILE):
-        with open(LEADS_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    """Load leads from local storage (snapshot plus change log)"""
+    with _leads_lock:
+        _refresh_leads()
+        # Hand out copies so callers editing a lead in place can't bypass the log
+        return [dict(lead) for lead in _leads.values()]
+
+def upsert_lead(lead):
+    """Insert or replace a single lead by id, if it is based on the stored version"""
+    with _locked_leads():
+        check_version(_leads.get(lead["id"]), lead, "Lead")
+        lead = next_lead_version(_leads.get(lead["id"]), lead)
+        _append_log([{"op": "upsert", "lead": lead}])
+        return dict(lead)
+
+def insert_leads(leads):
+    """Insert a batch of new leads with one change-log append (none of them if one already exists)"""
+    with _locked_leads():
+        for lead in leads:
+            check_new(_leads.get(lead["id"]), lead, "Lead")
+        leads = [next_lead_version(None, lead) for lead in leads]
+        _append_log([{"op": "upsert", "lead": lead} for lead in leads])
+        return [dict(lead) for lead in leads]
+
+def update_leads(lead_ids, changes, filters=None):
+    """Set field values on the leads that still match filters, with one change-log append"""
+    normalized = normalize_lead_filters(filters)
+    with _locked_leads():
+        updated = [
+            next_lead_version(_leads[lead_id], dict(_leads[lead_id], **changes)) for lead_id in lead_ids
+            if lead_id in _leads and lead_matches(_leads[lead_id], normalized)
+        ]
+        _append_log([{"op": "upsert", "lead": lead} for lead in updated])
+        return [dict(lead) for lead in updated]
+
+def delete_lead(lead_id, version=None):
+    """Delete a single lead by id (only if it still has `version`, when given)"""
+    with _locked_leads():
+        if version is not None:
+            check_version(_leads.get(lead_id), {"id": lead_id, "version": version}, "Lead")
+        if lead_id in _leads:
+            _append_log([{"op": "delete", "id": lead_id}])
+
+def query_leads(filters=None, order=None, limit=None, offset=0):
+    """
+    Query leads in the storage layer instead of over a DataFrame of every lead
+
+    Args:
+        filters (dict): Field values to match (see storage.normalize_lead_filters)
+        order (str): Field to sort by, prefixed with '-' for descending (default "id")
+        limit (int): Maximum number of leads to return
+        offset (int): Number of matching leads to skip
+
+    Returns:
+        list: Matching lead dicts
+    """
+    normalized = normalize_lead_filters(filters)
+    with _leads_lock:
+        _refresh_leads()
+        matches = [lead for lead in _leads.values() if lead_matches(lead, normalized)]
+    return [dict(lead) for lead in sort_and_slice_leads(matches, order, limit, offset)]
+
+def count_leads(filters=None):
+    """Count leads matching the given filters"""
+    normalized = normalize_lead_filters(filters)
+    with _leads_lock:
+        _refresh_leads()
+        return sum(1 for lead in _leads.values() if lead_matches(lead, normalized))
+
+def data_version(collection):
+    """Get a marker that changes whenever the stored collection changes on disk"""
+    if collection == "leads":
+        return (_file_stat(LEADS_FILE), _file_stat(LEADS_LOG_FILE))
+    return _file_stat(USERS_FILE)
+
+@contextmanager
+def _locked_users():
+    """Lock users.json for a read-modify-write and yield its current contents"""
+    load_users()  # seeds the file on first use
+    with _users_lock, _file_lock(USERS_FILE + ".lock"):
+        with open(USERS_FILE, 'r') as f:
+            yield json.load(f)
 
 def save_users(users):
     """Save users to local JSON file"""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
+    with _users_lock, _file_lock(USERS_FILE + ".lock"):
+        _write_json_atomic(USERS_FILE, users, indent=4)
 
-def load_users():
-    """Load users from local JSON file"""
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    
-    # Return default users if no users exist
-    default_users = [
+def upsert_user(user):
+    """Insert or replace a single user by id, if it is based on the stored version"""
+    with _locked_users() as users:
+        i = next((i for i, stored in enumerate(users) if stored["id"] == user["id"]), None)
+        check_version(users[i] if i is not None else None, user, "User")
+        check_unique_username(users, user)
+        user = next_version(user)
+        if i is not None:
+            users[i] = user
+        else:
+            users.append(user)
+        _write_json_atomic(USERS_FILE, users, indent=4)
+        return dict(user)
+
+def delete_user(user_id, version=None):
+    """Delete a single user by id (only if it still has `version`, when given)"""
+    with _locked_users() as users:
+        i = next((i for i, stored in enumerate(users) if stored["id"] == user_id), None)
+        if version is not None:
+            check_version(users[i] if i is not None else None, {"id": user_id, "version": version}, "User")
+        if i is not None:
+            del users[i]
+            _write_json_atomic(USERS_FILE, users, indent=4)
+
+def get_default_users():
+    """Get the default user accounts used to seed an empty user store"""
+    return [
         {"id": 1, "username": "admin", "name": "Admin User", "email": "admin@example.com", 
          "role": "admin", "status": "Active", "password": "admin@123",
          "last_login": datetime.now().strftime("%Y-%m-%d %H:%M")},
@@ -49,48 +381,52 @@ def load_users():
          "role": "sales", "status": "Active", "password": "abdullah123",
          "last_login": datetime.now().strftime("%Y-%m-%d %H:%M")}
     ]
-    save_users(default_users)
-    return default_users
 
-def get_next_lead_id():
-    """Get the next available lead ID"""
-    leads = load_leads()
-    if not leads:
-        return 1
-    return max(lead["id"] for lead in leads) + 1
-
-def update_user_last_login(username):
-    """Update the last login timestamp for a user"""
-    users = load_users()
-    for user in users:
-        # Case-insensitive comparison for username
-        if user["username"].lower() == username.lower():
-            user["last_login"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-            break
-    save_users(users)
-
-def get_next_customer_code():
-    """Get the next available customer code in the format Evr001, Evr002, etc."""
-    leads = load_leads()
-    
-    if not leads:
-        return "Evr001"  # First customer code
-    
-    # Extract existing codes
-    existing_codes = []
-    for lead in leads:
-        if "customer_code" in lead and lead["customer_code"].startswith("Evr"):
-            try:
-                # Extract the numeric part
-                code_num = int(lead["customer_code"][3:])
-                existing_codes.append(code_num)
-            except ValueError:
-                # Skip if the format is not as expected
-                continue
-    
-    if not existing_codes:
-        return "Evr001"  # No valid codes found
+def load_users():
+    """Load users from local JSON file"""
+    if os.path.exists(USERS_FILE):
+        with open(USERS_FILE, 'r') as f:
+            return json.load(f)
     
-    # Get the next number and format it
-    next_num = max(existing_codes) + 1
-    return f"Evr{next_num:03d}"  # Format with leading zeros
+    # Return default users if no users exist
+    default_users = get_default_users()
+    _write_json_atomic(USERS_FILE, default_users, indent=4)
+    return default_users
+
+def peek_counter(name):
+    """Get the next value a counter will hand out, without reserving it"""
+    with _leads_lock:
+        _refresh_leads()
+        return _counters.get(name, 1)
+
+def allocate_counter(name, count=1):
+    """
+    Reserve `count` consecutive values from a persistent counter
+
+    The reservation is appended to the change log before it is returned, so a value is
+    never handed out twice, even if the lead that was going to use it is never saved.
+
+    Returns:
+        int: The first reserved value
+    """
+    with _locked_leads():
+        first = _counters.get(name, 1)
+        _append_log([{"op": "counter", "name": name, "value": first + count}])
+        return first
+
+def update_users_last_login(logins):
+    """
+    Merge last login timestamps into the stored users
+
+    The users file is re-read under the lock right before the write, so only the
+    last_login fields change (versions are left alone: a login doesn't conflict with
+    an edit), and it is swapped in atomically so readers never see a partial file.
+    """
+    # Case-insensitive comparison for username
+    by_name = {username.lower(): timestamp for username, timestamp in logins.items()}
+    with _locked_users() as users:
+        for user in users:
+            timestamp = by_name.get(user["username"].lower())
+            if timestamp is not None:
+                user["last_login"] = timestamp
+        _write_json_atomic(USERS_FILE, users, indent=4)
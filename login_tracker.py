@@ -0,0 +1,101 @@
+"""
+Deferred, batched last-login writes
+
+Logins are recorded in memory and written to storage in batches by a single
+writer thread, every LAST_LOGIN_FLUSH_SECONDS or as soon as
+LAST_LOGIN_FLUSH_EVENTS logins are waiting, whichever comes first. A batch is one
+storage.update_users_last_login call, which merges the timestamps into the stored
+user records, so a burst of logins at shift start costs one write instead of one
+full rewrite of the users per login.
+
+Pending logins are flushed when the process exits normally; a crash loses at
+most the logins of one flush interval.
+"""
+import atexit
+import os
+import threading
+from datetime import datetime
+
+import storage
+
+LAST_LOGIN_FLUSH_SECONDS = float(os.environ.get("LAST_LOGIN_FLUSH_SECONDS", "5"))
+LAST_LOGIN_FLUSH_EVENTS = int(os.environ.get("LAST_LOGIN_FLUSH_EVENTS", "20"))
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()  # one batch is written at a time
+_pending = {}  # username -> last login timestamp
+_wake = threading.Event()
+_writer = None
+
+_stats = {
+    "logins": 0,
+    "flushes": 0,
+    "errors": 0,
+}
+
+def record_login(username, when=None):
+    """
+    Record a login, to be written with the next batch
+
+    Args:
+        username (str): The user who logged in
+        when (datetime): Login time (default: now)
+    """
+    timestamp = (when or datetime.now()).strftime("%Y-%m-%d %H:%M")
+    with _lock:
+        _pending[username] = timestamp
+        _stats["logins"] += 1
+        full = len(_pending) >= LAST_LOGIN_FLUSH_EVENTS
+    _start_writer()
+    if full:
+        _wake.set()
+
+def get_pending():
+    """Get the logins not written yet (username -> timestamp)"""
+    with _lock:
+        return dict(_pending)
+
+def flush():
+    """Write the pending logins to storage now"""
+    with _flush_lock:
+        with _lock:
+            batch = dict(_pending)
+            _pending.clear()
+        if not batch:
+            return
+
+        try:
+            storage.update_users_last_login(batch)
+        except Exception:
+            # Keep the batch for the next flush, unless the user has logged in again since
+            with _lock:
+                for username, timestamp in batch.items():
+                    _pending.setdefault(username, timestamp)
+                _stats["errors"] += 1
+            raise
+        with _lock:
+            _stats["flushes"] += 1
+
+def _run_writer():
+    while True:
+        _wake.wait(LAST_LOGIN_FLUSH_SECONDS)
+        _wake.clear()
+        try:
+            flush()
+        except Exception:
+            # Counted in the stats; the batch is retried on the next interval
+            pass
+
+def _start_writer():
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_run_writer, name="last-login-writer", daemon=True)
+            _writer.start()
+
+def get_stats():
+    """Get the number of recorded logins, written batches, failed writes and pending logins"""
+    with _lock:
+        return dict(_stats, pending=len(_pending))
+
+atexit.register(flush)
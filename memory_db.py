@@ -0,0 +1,176 @@
+"""
+In-memory storage backend
+
+Keeps leads and users in process memory only, so nothing is read from or written
+to disk. Useful for benchmarks and throwaway demo sessions (STORAGE_BACKEND=memory).
+"""
+import threading
+from storage import normalize_lead_filters, lead_matches, sort_and_slice_leads, parse_customer_code
+from storage import check_version, check_new, check_unique_username, next_version, next_lead_version
+
+_lock = threading.RLock()
+_leads = {}
+_counters = {}
+_users = None
+_version = 0
+
+def _changed():
+    """Bump the data version after a write"""
+    global _version
+    _version += 1
+
+def _store_lead(lead):
+    """Store a copy of a lead and keep the counters ahead of it"""
+    _leads[lead["id"]] = dict(lead)
+    _counters["lead_id"] = max(_counters.get("lead_id", 1), lead["id"] + 1)
+    code_num = parse_customer_code(lead.get("customer_code"))
+    if code_num is not None:
+        _counters["customer_code"] = max(_counters.get("customer_code", 1), code_num + 1)
+
+def reset(leads=None, users=None):
+    """Replace the stored leads and users (users default to the seed accounts)"""
+    global _users
+    with _lock:
+        _leads.clear()
+        _counters.clear()
+        for lead in leads or []:
+            _store_lead(lead)
+        _users = [dict(user) for user in users] if users is not None else None
+        _changed()
+
+def save_leads(leads):
+    """Save leads in memory"""
+    with _lock:
+        _leads.clear()
+        for lead in leads:
+            _store_lead(lead)
+        _changed()
+
+def load_leads():
+    """Load leads from memory"""
+    with _lock:
+        return [dict(lead) for lead in _leads.values()]
+
+def upsert_lead(lead):
+    """Insert or replace a single lead by id, if it is based on the stored version"""
+    with _lock:
+        check_version(_leads.get(lead["id"]), lead, "Lead")
+        lead = next_lead_version(_leads.get(lead["id"]), lead)
+        _store_lead(lead)
+        _changed()
+        return dict(lead)
+
+def insert_leads(leads):
+    """Insert a batch of new leads (none of them if one already exists)"""
+    with _lock:
+        for lead in leads:
+            check_new(_leads.get(lead["id"]), lead, "Lead")
+        leads = [next_lead_version(None, lead) for lead in leads]
+        for lead in leads:
+            _store_lead(lead)
+        _changed()
+        return [dict(lead) for lead in leads]
+
+def update_leads(lead_ids, changes, filters=None):
+    """Set field values on the leads that still match filters"""
+    normalized = normalize_lead_filters(filters)
+    with _lock:
+        updated = [
+            next_lead_version(_leads[lead_id], dict(_leads[lead_id], **changes)) for lead_id in lead_ids
+            if lead_id in _leads and lead_matches(_leads[lead_id], normalized)
+        ]
+        for lead in updated:
+            _store_lead(lead)
+        _changed()
+        return [dict(lead) for lead in updated]
+
+def delete_lead(lead_id, version=None):
+    """Delete a single lead by id (only if it still has `version`, when given)"""
+    with _lock:
+        if version is not None:
+            check_version(_leads.get(lead_id), {"id": lead_id, "version": version}, "Lead")
+        _leads.pop(lead_id, None)
+        _changed()
+
+def query_leads(filters=None, order=None, limit=None, offset=0):
+    """Query leads by field filters, with optional ordering and paging"""
+    normalized = normalize_lead_filters(filters)
+    with _lock:
+        matches = [lead for lead in _leads.values() if lead_matches(lead, normalized)]
+    return [dict(lead) for lead in sort_and_slice_leads(matches, order, limit, offset)]
+
+def count_leads(filters=None):
+    """Count leads matching the given filters"""
+    normalized = normalize_lead_filters(filters)
+    with _lock:
+        return sum(1 for lead in _leads.values() if lead_matches(lead, normalized))
+
+def data_version(collection):
+    """Get a counter that changes on every write (shared by leads and users)"""
+    return _version
+
+def save_users(users):
+    """Save users in memory"""
+    global _users
+    with _lock:
+        _users = [dict(user) for user in users]
+        _changed()
+
+def upsert_user(user):
+    """Insert or replace a single user by id, if it is based on the stored version"""
+    load_users()
+    with _lock:
+        i = next((i for i, stored in enumerate(_users) if stored["id"] == user["id"]), None)
+        check_version(_users[i] if i is not None else None, user, "User")
+        check_unique_username(_users, user)
+        user = next_version(user)
+        if i is not None:
+            _users[i] = user
+        else:
+            _users.append(user)
+        _changed()
+        return dict(user)
+
+def delete_user(user_id, version=None):
+    """Delete a single user by id (only if it still has `version`, when given)"""
+    load_users()
+    with _lock:
+        i = next((i for i, stored in enumerate(_users) if stored["id"] == user_id), None)
+        if version is not None:
+            check_version(_users[i] if i is not None else None, {"id": user_id, "version": version}, "User")
+        if i is not None:
+            del _users[i]
+            _changed()
+
+def load_users():
+    """Load users from memory, seeding the default accounts on first use"""
+    global _users
+    with _lock:
+        if _users is None:
+            from local_db import get_default_users
+            _users = get_default_users()
+        return [dict(user) for user in _users]
+
+def peek_counter(name):
+    """Get the next value a counter will hand out, without reserving it"""
+    with _lock:
+        return _counters.get(name, 1)
+
+def allocate_counter(name, count=1):
+    """Reserve `count` consecutive values from a counter and return the first"""
+    with _lock:
+        first = _counters.get(name, 1)
+        _counters[name] = first + count
+        return first
+
+def update_users_last_login(logins):
+    """Set the last login timestamp of several users"""
+    # Case-insensitive comparison for username
+    by_name = {username.lower(): timestamp for username, timestamp in logins.items()}
+    load_users()
+    with _lock:
+        for user in _users:
+            timestamp = by_name.get(user["username"].lower())
+            if timestamp is not None:
+                user["last_login"] = timestamp
+        _changed()
@@ -23,7 +23,7 @@ def main():
         return
     
     print("\nNext steps:")
-    print("1. Update your app.py to use firebase_db instead of database.py")
+    print("1. Set STORAGE_BACKEND=firebase in your environment or .env file")
     print("2. Deploy your application")
     print("3. Share the link with your team")
 
@@ -0,0 +1,103 @@
+"""
+Daily rollup cube of the sales data
+
+Sums revenue and units sold, and counts orders, per date x sales rep x product x
+region. The cube is built once per process from data.load_data. When rows are
+appended to the sales file, only the new rows are aggregated and merged into the
+cells; it is rebuilt only when the file is replaced or rewritten. Charts and KPIs
+are answered from the cube, so their cost depends on the number of distinct groups
+rather than the number of sales rows.
+"""
+import threading
+
+import pandas as pd
+
+import data
+
+# Dimensions of the cube and the measures kept for each cell
+DIMENSIONS = ["date", "sales_rep", "product", "region"]
+MEASURES = ["revenue", "units_sold", "orders"]
+
+_lock = threading.Lock()
+_cube = None
+_signature = None
+_position = None   # how far the sales file was read into the cube (see data.data_position)
+
+def _aggregate(rows):
+    """Roll sales rows up to one row per cell"""
+    rows = rows.assign(orders=1)
+    cube = rows.groupby(DIMENSIONS, observed=True, sort=False)[MEASURES].sum().reset_index()
+    return data.apply_types(cube)
+
+def _merge(cube, cells):
+    """Add cells to the cube, summing the measures of the cells both have"""
+    merged = pd.concat([cube, cells], ignore_index=True)
+    merged = merged.groupby(DIMENSIONS, observed=True, sort=False)[MEASURES].sum().reset_index()
+    return data.apply_types(merged)
+
+def _ensure_cube():
+    """Bring the cube up to date if the sales file changed since it was read"""
+    global _cube, _signature, _position
+
+    signature = data.data_signature()
+    if _cube is not None and signature == _signature:
+        return
+    if _cube is not None and _position is not None:
+        rows, position = data.read_appended_data(_position)
+        if rows is not None:
+            # Appended to: the cost depends on the new rows, not on all sales rows
+            if len(rows):
+                _cube = _merge(_cube, _aggregate(rows))
+            _signature, _position = signature, position
+            return
+
+    position = data.data_position()
+    # The full frame is shared with the pages that show sales rows
+    _cube = _aggregate(data.load_data())
+    if position is not None and position == data.data_position():
+        # Taken after loading, since load_data creates the file on first use
+        _signature, _position = data.data_signature(), position
+    else:
+        # The file was created or changed while it was loaded: rebuild on the next read
+        _signature, _position = None, None
+
+def get_cube():
+    """
+    Get the cube
+
+    Returns:
+        pd.DataFrame: One row per date/sales_rep/product/region cell with revenue,
+            units_sold and orders
+    """
+    with _lock:
+        _ensure_cube()
+        return _cube.copy(deep=False)
+
+def rollup(filters=None, by=None):
+    """
+    Sum the cube cells matching the filters
+
+    Args:
+        filters (dict): Filters as accepted by data.get_filtered_data
+        by (str or list): Dimension(s) to group by, e.g. "date" or ["region", "product"]
+
+    Returns:
+        pd.DataFrame: The by column(s) plus revenue, units_sold and orders, with a
+            row per group present in the filtered data
+    """
+    cells = data.get_filtered_data(get_cube(), filters)
+    by = [by] if isinstance(by, str) else list(by)
+    return cells.groupby(by, observed=True)[MEASURES].sum().reset_index()
+
+def totals(filters=None):
+    """
+    Sum all cube cells matching the filters
+
+    Args:
+        filters (dict): Filters as accepted by data.get_filtered_data
+
+    Returns:
+        dict: revenue, units_sold and orders
+    """
+    cells = data.get_filtered_data(get_cube(), filters)
+    return {measure: int(cells[measure].sum()) for measure in MEASURES}
@@ -1,14 +1,22 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime, timedelta
-import database as db
+import storage as db
+import shared_cache
+import lead_index
+import sales_cube
+import charts
 
 from auth import logout_user
+from views import edit_base_version, forget_edit_base, conflict_notification, lead_pager, lead_picker
 from data import load_data, get_filtered_data
 
+# Widgets of the lead edit form, reset after a save so they show the stored lead again
+EDIT_LEAD_WIDGETS = [
+    "edit_sector", "edit_city", "edit_required_system", "edit_system_type",
+    "edit_monthly_bill", "edit_status", "edit_source", "edit_remarks",
+]
+
 def sales_rep_view(username):
     """Sales rep dashboard view with limited access to their own performance data"""
     # Display logo and title together
@@ -27,7 +35,7 @@ def sales_rep_view(username):
     # In a real app, this would be based on the user's identity
     # For this mock app, we'll use the username to filter
     rep_name = st.session_state.display_name
-    rep_data = sales_data[sales_data["sales_rep"] == rep_name]
+    rep_data = get_filtered_data(sales_data, {"sales_rep": rep_name})
     
     # Sidebar navigation
     page = st.sidebar.selectbox(
@@ -63,10 +71,12 @@ def show_my_performance(rep_data, rep_name):
     # KPI metrics
     col1, col2, col3, col4 = st.columns(4)
     
-    rep_revenue = rep_data["revenue"].sum()
-    rep_units = rep_data["units_sold"].sum()
-    rep_avg_order = rep_revenue / len(rep_data) if len(rep_data) > 0 else 0
-    rep_orders = len(rep_data)
+    # KPIs and charts are answered from the daily rollup cube
+    rep_totals = sales_cube.totals({"sales_rep": rep_name})
+    rep_revenue = rep_totals["revenue"]
+    rep_units = rep_totals["units_sold"]
+    rep_orders = rep_totals["orders"]
+    rep_avg_order = rep_revenue / rep_orders if rep_orders > 0 else 0
     
     col1.metric("Total Revenue", f"${rep_revenue:,.2f}")
     col2.metric("Total Units Sold", f"{rep_units:,}")
@@ -95,46 +105,29 @@ def show_my_performance(rep_data, rep_name):
         filters['end_date'] = end_date
     
     filtered_data = get_filtered_data(rep_data, filters)
+    filters["sales_rep"] = rep_name
     
     # Performance trend
     st.subheader("My Revenue Trend")
-    daily_revenue = filtered_data.groupby("date")["revenue"].sum().reset_index()
+    daily_revenue = sales_cube.rollup(filters, "date")
     daily_revenue["date"] = pd.to_datetime(daily_revenue["date"])
     daily_revenue = daily_revenue.sort_values("date")
     
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.plot(daily_revenue["date"], daily_revenue["revenue"], marker='o', linestyle='-')
-    ax.set_title(f"Daily Revenue Trend for {rep_name}")
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Revenue ($)")
-    ax.grid(True, alpha=0.3)
-    st.pyplot(fig)
+    charts.line_chart(daily_revenue, "date", "revenue", f"Daily Revenue Trend for {rep_name}", "Date", "Revenue ($)")
     
     # Product mix
     st.subheader("My Product Mix")
-    product_mix = filtered_data.groupby("product")["revenue"].sum().reset_index()
+    product_mix = sales_cube.rollup(filters, "product")
     product_mix = product_mix.sort_values("revenue", ascending=False)
     
-    fig, ax = plt.subplots(figsize=(12, 6))
-    sns.barplot(x="product", y="revenue", data=product_mix, ax=ax)
-    ax.set_title(f"Product Mix for {rep_name}")
-    ax.set_xlabel("Product")
-    ax.set_ylabel("Revenue ($)")
-    plt.xticks(rotation=45)
-    st.pyplot(fig)
+    charts.bar_chart(product_mix, "product", "revenue", f"Product Mix for {rep_name}", "Product", "Revenue ($)")
     
     # Regional performance
     st.subheader("My Regional Performance")
-    region_mix = filtered_data.groupby("region")["revenue"].sum().reset_index()
+    region_mix = sales_cube.rollup(filters, "region")
     region_mix = region_mix.sort_values("revenue", ascending=False)
     
-    fig, ax = plt.subplots(figsize=(12, 6))
-    sns.barplot(x="region", y="revenue", data=region_mix, ax=ax)
-    ax.set_title(f"Regional Performance for {rep_name}")
-    ax.set_xlabel("Region")
-    ax.set_ylabel("Revenue ($)")
-    plt.xticks(rotation=45)
-    st.pyplot(fig)
+    charts.bar_chart(region_mix, "region", "revenue", f"Regional Performance for {rep_name}", "Region", "Revenue ($)")
     
     # Recent sales
     st.subheader("My Recent Sales")
@@ -149,20 +142,13 @@ def show_my_leads(rep_name):
     tab1, tab2 = st.tabs(["View My Leads", "Add New Lead"])
     
     with tab1:
-        # Get leads from session state
-        leads = st.session_state.leads
-        
-        # Convert to DataFrame
-        leads_df = pd.DataFrame(leads)
-        
-        # Filter for leads assigned to this rep
-        if leads_df.empty:
+        # Count leads assigned to this rep in the lead index
+        if lead_index.count_leads() == 0:
             st.info("No leads found assigned to you.")
         else:
-            # Filter leads assigned to this rep
-            my_leads = leads_df[leads_df["assigned_to"] == rep_name]
+            my_leads_count = lead_index.count_leads({"assigned_to": rep_name})
             
-            if my_leads.empty:
+            if my_leads_count == 0:
                 st.info(f"No leads are currently assigned to you.")
             else:
                 # Add filters
@@ -199,25 +185,24 @@ def show_my_leads(rep_name):
                     key="my_leads_date_range"
                 )
                 
-                # Apply filters
-                filtered_df = my_leads.copy()
-                
-                if status_filter != "All":
-                    filtered_df = filtered_df[filtered_df["status"] == status_filter]
-                
-                if source_filter != "All":
-                    filtered_df = filtered_df[filtered_df["source"] == source_filter]
-                
-                if city_filter != "All":
-                    filtered_df = filtered_df[filtered_df["city"] == city_filter]
+                # Look up the matching leads in the lead index ("All" means no filter on that field)
+                filters = {
+                    "assigned_to": rep_name,
+                    "status": status_filter,
+                    "source": source_filter,
+                    "city": city_filter
+                }
                 
                 if len(date_range) >= 2:
-                    start_date = date_range[0].strftime("%Y-%m-%d")
-                    end_date = date_range[1].strftime("%Y-%m-%d")
-                    filtered_df = filtered_df[(filtered_df["date_created"] >= start_date) & (filtered_df["date_created"] <= end_date)]
+                    filters["date_from"] = date_range[0].strftime("%Y-%m-%d")
+                    filters["date_to"] = date_range[1].strftime("%Y-%m-%d")
+                
+                # Only the page on screen is read and displayed
+                leads_on_page, total = lead_pager("my_leads", filters)
+                filtered_df = pd.DataFrame(leads_on_page)
                 
                 # Display leads
-                st.subheader(f"Showing {len(filtered_df)} leads")
+                st.subheader(f"Showing {len(filtered_df)} of {total} leads")
                 
                 if filtered_df.empty:
                     st.info("No leads match your filter criteria.")
@@ -238,100 +223,101 @@ def show_my_leads(rep_name):
                     # Apply the new column order
                     filtered_df = filtered_df[cols]
                     
-                    st.dataframe(filtered_df, use_container_width=True)
+                    st.dataframe(filtered_df.drop(columns=["version", "status_history"], errors="ignore"), use_container_width=True)
                 
                 # Lead details section
                 st.subheader("Lead Details")
                 
-                # Select a lead to view details
-                selected_lead_id = st.selectbox(
-                    "Select Lead",
-                    filtered_df["id"].tolist(),
-                    format_func=lambda x: f"Lead #{x} - {filtered_df[filtered_df['id'] == x]['name'].values[0]}",
-                    key="my_lead_select"
-                )
+                # Select a lead to view details, searching all the matching leads
+                selected_lead_id = lead_picker("Select Lead", "my_lead_select", filters, leads_on_page)
                 
                 # Get the selected lead data
-                selected_lead = filtered_df[filtered_df["id"] == selected_lead_id].iloc[0]
-                
-                # Display lead details
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.write(f"**Customer Name:** {selected_lead['name']}")
-                    st.write(f"**Phone No:** {selected_lead['phone']}")
-                    st.write(f"**Date Created:** {selected_lead['date_created']}")
-                
-                with col2:
-                    st.write(f"**Assigned To:** {selected_lead['assigned_to']}")
-                    st.write(f"**ID:** {selected_lead['id']}")
-                
-                # Allow sales rep to update specific fields
-                st.subheader("Edit Lead Information")
-                
-                # Editable fields
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    sector = st.text_input(
-                        "Sector",
-                        value=selected_lead['sector'],
-                        key="edit_sector"
-                    )
+                selected_lead = shared_cache.get_lead(selected_lead_id) if selected_lead_id is not None else None
+                if selected_lead is not None:
+                    base_version = edit_base_version("my_lead_edit", selected_lead, EDIT_LEAD_WIDGETS)
                     
-                    city = st.selectbox(
-                        "City",
-                        ["Islamabad", "RawalPindi", "Taxila", "Wahcantt", "Lahore", "Karachi"],
-                        index=["Islamabad", "RawalPindi", "Taxila", "Wahcantt", "Lahore", "Karachi"].index(selected_lead['city']),
-                        key="edit_city"
-                    )
+                    # Display lead details
+                    col1, col2 = st.columns(2)
                     
-                    required_system = st.text_input(
-                        "Required System",
-                        value=selected_lead['required_system'],
-                        key="edit_required_system"
-                    )
+                    with col1:
+                        st.write(f"**Customer Name:** {selected_lead['name']}")
+                        st.write(f"**Phone No:** {selected_lead['phone']}")
+                        st.write(f"**Date Created:** {selected_lead['date_created']}")
                     
-                    system_type = st.selectbox(
-                        "System Type",
-                        ["On Grid", "HyBrid", "OFF Grid"],
-                        index=["On Grid", "HyBrid", "OFF Grid"].index(selected_lead['system_type']),
-                        key="edit_system_type"
-                    )
-                
-                with col2:
-                    monthly_bill = st.text_input(
-                        "Monthly Avg. Bill",
-                        value=selected_lead['monthly_bill'],
-                        key="edit_monthly_bill"
-                    )
+                    with col2:
+                        st.write(f"**Assigned To:** {selected_lead['assigned_to']}")
+                        st.write(f"**ID:** {selected_lead['id']}")
                     
-                    status = st.selectbox(
-                        "Status",
-                        ["Open", "Fake Lead", "Lost", "Not Interested", "Quote Shared", "Won"],
-                        index=["Open", "Fake Lead", "Lost", "Not Interested", "Quote Shared", "Won"].index(selected_lead['status']) if selected_lead['status'] in ["Open", "Fake Lead", "Lost", "Not Interested", "Quote Shared", "Won"] else 0,
-                        key="edit_status"
-                    )
+                    # Allow sales rep to update specific fields
+                    st.subheader("Edit Lead Information")
                     
-                    source = st.selectbox(
-                        "Source",
-                        ["Organic Search", "Paid Ads", "Social Media", "Referral", "Walk-In"],
-                        index=["Organic Search", "Paid Ads", "Social Media", "Referral", "Walk-In"].index(selected_lead['source']),
-                        key="edit_source"
+                    # Editable fields
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        sector = st.text_input(
+                            "Sector",
+                            value=selected_lead['sector'],
+                            key="edit_sector"
+                        )
+                        
+                        city = st.selectbox(
+                            "City",
+                            ["Islamabad", "RawalPindi", "Taxila", "Wahcantt", "Lahore", "Karachi"],
+                            index=["Islamabad", "RawalPindi", "Taxila", "Wahcantt", "Lahore", "Karachi"].index(selected_lead['city']),
+                            key="edit_city"
+                        )
+                        
+                        required_system = st.text_input(
+                            "Required System",
+                            value=selected_lead['required_system'],
+                            key="edit_required_system"
+                        )
+                        
+                        system_type = st.selectbox(
+                            "System Type",
+                            ["On Grid", "HyBrid", "OFF Grid"],
+                            index=["On Grid", "HyBrid", "OFF Grid"].index(selected_lead['system_type']),
+                            key="edit_system_type"
+                        )
+                    
+                    with col2:
+                        monthly_bill = st.text_input(
+                            "Monthly Avg. Bill",
+                            value=selected_lead['monthly_bill'],
+                            key="edit_monthly_bill"
+                        )
+                        
+                        status = st.selectbox(
+                            "Status",
+                            ["Open", "Fake Lead", "Lost", "Not Interested", "Quote Shared", "Won"],
+                            index=["Open", "Fake Lead", "Lost", "Not Interested", "Quote Shared", "Won"].index(selected_lead['status']) if selected_lead['status'] in ["Open", "Fake Lead", "Lost", "Not Interested", "Quote Shared", "Won"] else 0,
+                            key="edit_status"
+                        )
+                        
+                        source = st.selectbox(
+                            "Source",
+                            ["Organic Search", "Paid Ads", "Social Media", "Referral", "Walk-In"],
+                            index=["Organic Search", "Paid Ads", "Social Media", "Referral", "Walk-In"].index(selected_lead['source']),
+                            key="edit_source"
+                        )
+                    
+                    remarks = st.text_area(
+                        "Remarks",
+                        value=selected_lead['remarks'],
+                        key="edit_remarks"
                     )
-                
-                remarks = st.text_area(
-                    "Remarks",
-                    value=selected_lead['remarks'],
-                    key="edit_remarks"
-                )
-                
-                if st.button("Save Changes", key="save_lead_changes_btn"):
-                    # Update the lead in session state
-                    for i, lead in enumerate(st.session_state.leads):
-                        if lead["id"] == selected_lead_id:
+                    
+                    if st.button("Save Changes", key="save_lead_changes_btn"):
+                        # Cached leads are shared read-only, so edit a copy of the lead, based on
+                        # the version the form was opened on
+                        updated_lead = shared_cache.get_lead(selected_lead_id)
+                        if updated_lead is None:
+                            st.error(f"Lead #{selected_lead_id} was deleted by someone else.")
+                        else:
+                            updated_lead["version"] = base_version
                             # Update only the editable fields
-                            st.session_state.leads[i].update({
+                            updated_lead.update({
                                 "sector": sector,
                                 "city": city,
                                 "required_system": required_system,
@@ -341,13 +327,15 @@ def show_my_leads(rep_name):
                                 "source": source,
                                 "remarks": remarks
                             })
-                            break
-                    
-                    # Save leads to database
-                    db.save_leads(st.session_state.leads)
-                    
-                    st.success(f"Lead #{selected_lead_id} updated successfully!")
-                    st.rerun()
+                            # Save the changed lead to the database
+                            forget_edit_base("my_lead_edit", EDIT_LEAD_WIDGETS)
+                            try:
+                                db.upsert_lead(updated_lead)
+                            except db.ConflictError as e:
+                                st.error(conflict_notification(e)["message"])
+                            else:
+                                st.success(f"Lead #{selected_lead_id} updated successfully!")
+                                st.rerun()
 
     with tab2:
         st.subheader("Add New Lead")
@@ -402,7 +390,8 @@ def show_my_leads(rep_name):
                     if st.button("Yes, Create Lead", key="sales_confirm_create_btn"):
                         # Create a new lead with the form data
                         new_lead = {
-                            "id": st.session_state.next_lead_id,
+                            # Reserve the ID and code now; the code shown above is only a preview
+                            "id": db.allocate_lead_id(),
                             "name": lead_name,
                             "phone": phone,
                             "sector": sector,
@@ -413,21 +402,15 @@ def show_my_leads(rep_name):
                             "status": status,
                             "source": source,
                             "assigned_to": rep_name,  # Automatically assign to the current sales rep
-                            "customer_code": next_code,  # Use the auto-generated code
+                            "customer_code": db.allocate_customer_code(),
                             "remarks": remarks,
                             "date_created": datetime.now().strftime("%Y-%m-%d")
                         }
                         
-                        # Add the new lead to the session state
-                        st.session_state.leads.append(new_lead)
+                        # Save the new lead to the database
+                        db.upsert_lead(new_lead)
                         
-                        # Increment the next lead ID
-                        st.session_state.next_lead_id += 1
-                        
-                        # Save leads to database
-                        db.save_leads(st.session_state.leads)
-                        
-                        st.success(f"Lead '{lead_name}' created successfully and assigned to you!")
+                        st.success(f"Lead '{lead_name}' ({new_lead['customer_code']}) created successfully and assigned to you!")
                         
                         # Force a rerun to refresh the page
                         st.rerun()
@@ -452,12 +435,14 @@ def show_product_analysis(rep_data, rep_name):
         filters['product'] = selected_product
     
     filtered_data = get_filtered_data(rep_data, filters)
+    filters["sales_rep"] = rep_name
     
     # KPI metrics for the selected product
     col1, col2, col3 = st.columns(3)
     
-    product_revenue = filtered_data["revenue"].sum()
-    product_units = filtered_data["units_sold"].sum()
+    product_totals = sales_cube.totals(filters)
+    product_revenue = product_totals["revenue"]
+    product_units = product_totals["units_sold"]
     product_avg_price = product_revenue / product_units if product_units > 0 else 0
     
     col1.metric("Total Revenue", f"${product_revenue:,.2f}")
@@ -466,40 +451,34 @@ def show_product_analysis(rep_data, rep_name):
     
     # Product performance trend
     st.subheader("Performance Trend")
-    product_daily_sales = filtered_data.groupby("date")["revenue"].sum().reset_index()
+    product_daily_sales = sales_cube.rollup(filters, "date")
     product_daily_sales["date"] = pd.to_datetime(product_daily_sales["date"])
     product_daily_sales = product_daily_sales.sort_values("date")
     
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.plot(product_daily_sales["date"], product_daily_sales["revenue"], marker='o', linestyle='-')
-    ax.set_title(f"Daily Revenue Trend for {selected_product if selected_product != 'All' else 'All Products'}")
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Revenue ($)")
-    ax.grid(True, alpha=0.3)
-    st.pyplot(fig)
+    charts.line_chart(
+        product_daily_sales, "date", "revenue",
+        f"Daily Revenue Trend for {selected_product if selected_product != 'All' else 'All Products'}",
+        "Date", "Revenue ($)"
+    )
     
     # Product performance by region
     st.subheader("Performance by Region")
-    product_region = filtered_data.groupby("region")["revenue"].sum().reset_index()
+    product_region = sales_cube.rollup(filters, "region")
     product_region = product_region.sort_values("revenue", ascending=False)
     
-    fig, ax = plt.subplots(figsize=(12, 6))
-    sns.barplot(x="region", y="revenue", data=product_region, ax=ax)
-    ax.set_title(f"Regional Performance for {selected_product if selected_product != 'All' else 'All Products'}")
-    ax.set_xlabel("Region")
-    ax.set_ylabel("Revenue ($)")
-    plt.xticks(rotation=45)
-    st.pyplot(fig)
+    charts.bar_chart(
+        product_region, "region", "revenue",
+        f"Regional Performance for {selected_product if selected_product != 'All' else 'All Products'}",
+        "Region", "Revenue ($)"
+    )
     
     # Units sold vs revenue
     st.subheader("Units Sold vs Revenue")
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.scatter(filtered_data["units_sold"], filtered_data["revenue"])
-    ax.set_title(f"Units Sold vs Revenue for {selected_product if selected_product != 'All' else 'All Products'}")
-    ax.set_xlabel("Units Sold")
-    ax.set_ylabel("Revenue ($)")
-    ax.grid(True, alpha=0.3)
-    st.pyplot(fig)
+    charts.scatter_chart(
+        filtered_data, "units_sold", "revenue",
+        f"Units Sold vs Revenue for {selected_product if selected_product != 'All' else 'All Products'}",
+        "Units Sold", "Revenue ($)"
+    )
 
 def show_regional_analysis(rep_data, rep_name):
     """Show regional analysis dashboard limited to the sales rep's data"""
@@ -517,14 +496,15 @@ def show_regional_analysis(rep_data, rep_name):
     if selected_region != "All":
         filters['region'] = selected_region
     
-    filtered_data = get_filtered_data(rep_data, filters)
+    filters["sales_rep"] = rep_name
     
     # KPI metrics for the selected region
     col1, col2, col3 = st.columns(3)
     
-    region_revenue = filtered_data["revenue"].sum()
-    region_units = filtered_data["units_sold"].sum()
-    region_avg_order = region_revenue / len(filtered_data) if len(filtered_data) > 0 else 0
+    region_totals = sales_cube.totals(filters)
+    region_revenue = region_totals["revenue"]
+    region_units = region_totals["units_sold"]
+    region_avg_order = region_revenue / region_totals["orders"] if region_totals["orders"] > 0 else 0
     
     col1.metric("Total Revenue", f"${region_revenue:,.2f}")
     col2.metric("Total Units Sold", f"{region_units:,}")
@@ -532,40 +512,34 @@ def show_regional_analysis(rep_data, rep_name):
     
     # Region performance comparison
     st.subheader("My Regional Performance")
-    region_performance = rep_data.groupby("region")["revenue"].sum().reset_index()
+    region_performance = sales_cube.rollup({"sales_rep": rep_name}, "region")
     region_performance = region_performance.sort_values("revenue", ascending=False)
     
-    fig, ax = plt.subplots(figsize=(12, 6))
-    sns.barplot(x="region", y="revenue", data=region_performance, ax=ax)
-    ax.set_title(f"Revenue by Region for {rep_name}")
-    ax.set_xlabel("Region")
-    ax.set_ylabel("Revenue ($)")
-    plt.xticks(rotation=45)
-    st.pyplot(fig)
+    charts.bar_chart(
+        region_performance, "region", "revenue",
+        f"Revenue by Region for {rep_name}",
+        "Region", "Revenue ($)"
+    )
     
     # Product mix by region
     st.subheader("Product Mix in Region")
-    region_product_mix = filtered_data.groupby("product")["revenue"].sum().reset_index()
+    region_product_mix = sales_cube.rollup(filters, "product")
     region_product_mix = region_product_mix.sort_values("revenue", ascending=False)
     
-    fig, ax = plt.subplots(figsize=(12, 6))
-    sns.barplot(x="product", y="revenue", data=region_product_mix, ax=ax)
-    ax.set_title(f"Product Mix for {selected_region if selected_region != 'All' else 'All Regions'}")
-    ax.set_xlabel("Product")
-    ax.set_ylabel("Revenue ($)")
-    plt.xticks(rotation=45)
-    st.pyplot(fig)
+    charts.bar_chart(
+        region_product_mix, "product", "revenue",
+        f"Product Mix for {selected_region if selected_region != 'All' else 'All Regions'}",
+        "Product", "Revenue ($)"
+    )
     
     # Time trend for region
     st.subheader("Regional Performance Over Time")
-    region_time = filtered_data.groupby("date")["revenue"].sum().reset_index()
+    region_time = sales_cube.rollup(filters, "date")
     region_time["date"] = pd.to_datetime(region_time["date"])
     region_time = region_time.sort_values("date")
     
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.plot(region_time["date"], region_time["revenue"], marker='o', linestyle='-')
-    ax.set_title(f"Daily Revenue Trend for {selected_region if selected_region != 'All' else 'All Regions'}")
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Revenue ($)")
-    ax.grid(True, alpha=0.3)
-    st.pyplot(fig)
+    charts.line_chart(
+        region_time, "date", "revenue",
+        f"Daily Revenue Trend for {selected_region if selected_region != 'All' else 'All Regions'}",
+        "Date", "Revenue ($)"
+    )
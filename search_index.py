@@ -0,0 +1,419 @@
+"""
+Full-text search over the cached leads
+
+An inverted index maps every word of a lead's name, phone, customer code, sector,
+city and remarks to the ids of the leads containing it. The distinct words are also
+kept sorted, so a search term finds every word it is a prefix of with a bisect, and
+the words are split into trigrams so that a misspelt term still finds similar words.
+Phone numbers are indexed by their digits only, so "0332-4098765", "0332 4098765",
+"+92 332 4098765" and "03324098765" all match each other.
+
+Like lead_index, the index is registered as a view of shared_cache and updated lead
+by lead when a lead is added, edited or deleted. A full rebuild is deferred until
+the next search after the leads are reloaded, so pages that never search don't pay
+for it.
+"""
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+import shared_cache
+import lead_index
+from storage import normalize_lead_filters
+
+SEARCH_FIELDS = ["name", "phone", "customer_code", "sector", "city", "remarks"]
+
+# Terms shorter than this only match whole words
+MIN_PREFIX_LENGTH = 2
+# Words at least this long (and not all digits) can be matched fuzzily
+MIN_FUZZY_LENGTH = 3
+# Minimum trigram similarity (Dice coefficient) of a fuzzy match
+FUZZY_THRESHOLD = 0.4
+# A term that is a prefix of more words than this is checked against the leads
+# found by the other terms instead of being expanded
+MAX_PREFIX_WORDS = 5000
+# Up to this many matches are all scored; more are ranked newest first until the
+# best results are known
+RANK_ALL_LIMIT = 2000
+# Score of a lead for one term, by how the term matched
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+FUZZY_SCORE = 1.0
+
+_WORD = re.compile(r"[^\W_]+")
+_LEAD_ID = re.compile(r"\s*#(\d+)\s*")
+_PHONE = re.compile(r"\+?\d[\d\s\-().]{5,}\d")
+_MIN_PHONE_DIGITS = 7
+_TEXT_FIELDS = [field for field in SEARCH_FIELDS if field != "phone"]
+
+_lock = threading.RLock()
+_build_lock = threading.Lock()
+_postings = {}   # word -> lead id, or set of lead ids if several leads have it
+_words = []      # sorted distinct words
+_trigrams = {}   # trigram -> set of fuzzy-matchable words
+_stale = True    # leads were reloaded; rebuild before the next search
+_generation = 0  # bumped on every reload, so a build from older leads is discarded
+_backlog = []    # (old, new) changes seen while stale, replayed after the build
+
+def normalize_phone(text):
+    """Reduce a phone number to its digits, with +92 / 0092 written as a leading 0"""
+    digits = re.sub(r"\D", "", text)
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if digits.startswith("92") and len(digits) == 12:
+        digits = "0" + digits[2:]
+    return digits
+
+def tokenize(text):
+    """
+    Split text into search words
+
+    Words are case- and accent-folded runs of letters and digits; phone-like runs of
+    digits, spaces, dashes and brackets become one word of their digits.
+    """
+    text = str(text).casefold()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+
+    phones = []
+    def take_phone(match):
+        digits = normalize_phone(match.group())
+        if len(digits) < _MIN_PHONE_DIGITS:
+            return match.group()
+        phones.append(digits)
+        return " "
+
+    rest = _PHONE.sub(take_phone, text)
+    return phones + _WORD.findall(rest)
+
+def _lead_words(lead):
+    """Get the set of search words of a lead"""
+    # The text fields are tokenized in one go; "|" keeps phone numbers from spanning two fields
+    words = set(tokenize(" | ".join(
+        str(lead[field]) for field in _TEXT_FIELDS if lead.get(field) not in (None, "")
+    )))
+    phone = normalize_phone(str(lead.get("phone") or ""))
+    if phone:
+        words.add(phone)
+        # The subscriber number alone, for searches without the operator code
+        if len(phone) > _MIN_PHONE_DIGITS:
+            words.add(phone[-_MIN_PHONE_DIGITS:])
+    return words
+
+def _word_trigrams(word):
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _is_fuzzy(word):
+    return len(word) >= MIN_FUZZY_LENGTH and not word.isdigit()
+
+def _ids(word):
+    """Get the ids of the leads having word"""
+    ids = _postings.get(word, ())
+    return (ids,) if type(ids) is int else ids
+
+def _post(postings, word, lead_id):
+    """Add a lead id to a word's posting; return True if the word is new"""
+    ids = postings.get(word)
+    if ids is None:
+        # Most words (phone numbers, customer codes) belong to a single lead, so
+        # a lone id is stored as is rather than in a set
+        postings[word] = lead_id
+        return True
+    if type(ids) is int:
+        if ids != lead_id:
+            postings[word] = {ids, lead_id}
+    else:
+        ids.add(lead_id)
+    return False
+
+def _add_word(word, lead_id):
+    if _post(_postings, word, lead_id):
+        bisect.insort(_words, word)
+        if _is_fuzzy(word):
+            for gram in _word_trigrams(word):
+                _trigrams.setdefault(gram, set()).add(word)
+
+def _remove_word(word, lead_id):
+    ids = _postings.get(word)
+    if ids is None:
+        return
+    if type(ids) is int:
+        if ids != lead_id:
+            return
+    else:
+        ids.discard(lead_id)
+        if len(ids) == 1:
+            _postings[word] = ids.pop()
+        return
+    del _postings[word]
+    i = bisect.bisect_left(_words, word)
+    if i < len(_words) and _words[i] == word:
+        del _words[i]
+    if _is_fuzzy(word):
+        for gram in _word_trigrams(word):
+            words = _trigrams.get(gram)
+            if words is not None:
+                words.discard(word)
+                if not words:
+                    del _trigrams[gram]
+
+def _apply(old, new):
+    if old is not None and new is not None and all(old.get(field) == new.get(field) for field in SEARCH_FIELDS):
+        return
+    old_words = _lead_words(old) if old is not None else set()
+    new_words = _lead_words(new) if new is not None else set()
+    if old is not None:
+        for word in old_words - new_words:
+            _remove_word(word, old["id"])
+    if new is not None:
+        for word in new_words - old_words:
+            _add_word(word, new["id"])
+
+def rebuild(leads):
+    """Mark the index for a rebuild from the reloaded leads, done on the next search"""
+    global _stale, _generation
+    with _lock:
+        _stale = True
+        _generation += 1
+        _backlog.clear()
+
+def apply(old, new):
+    """Update the index for one lead that was added (old is None), edited, or deleted (new is None)"""
+    with _lock:
+        if _stale:
+            _backlog.append((old, new))
+        else:
+            _apply(old, new)
+
+def _ensure_index():
+    """Build the index if the leads were reloaded since the last build"""
+    global _postings, _words, _trigrams, _stale
+
+    with _build_lock:
+        while True:
+            # Reloads the leads (and calls rebuild) if storage changed
+            leads = shared_cache.get_leads()
+            with _lock:
+                if not _stale:
+                    return
+                generation = _generation
+
+            # Build outside _lock so edits made meanwhile aren't held up; they are
+            # queued in the backlog and replayed on top of the new index
+            postings = {}
+            for lead in leads:
+                lead_id = lead["id"]
+                for word in _lead_words(lead):
+                    # _post, inlined for the millions of words of a large rebuild
+                    ids = postings.get(word)
+                    if ids is None:
+                        postings[word] = lead_id
+                    elif type(ids) is int:
+                        postings[word] = {ids, lead_id}
+                    else:
+                        ids.add(lead_id)
+            words = sorted(postings)
+            trigrams = {}
+            for word in words:
+                if _is_fuzzy(word):
+                    for gram in _word_trigrams(word):
+                        trigrams.setdefault(gram, set()).add(word)
+
+            with _lock:
+                if generation != _generation:
+                    continue  # reloaded again during the build
+                _postings, _words, _trigrams = postings, words, trigrams
+                # Replaying a change the snapshot already has leaves the index unchanged
+                for old, new in _backlog:
+                    _apply(old, new)
+                _backlog.clear()
+                _stale = False
+                return
+
+def _prefix_words(term):
+    """Get the (lo, hi) range of _words starting with term (empty for terms too short to be prefixes)"""
+    lo = bisect.bisect_left(_words, term)
+    if len(term) < MIN_PREFIX_LENGTH:
+        return lo, lo
+    hi = bisect.bisect_left(_words, term + "\U0010ffff")
+    return lo, hi
+
+def _fuzzy_words(term):
+    """Yield (word, similarity) for the indexed words similar to term"""
+    grams = _word_trigrams(term)
+    shared = Counter()
+    for gram in grams:
+        shared.update(_trigrams.get(gram, ()))
+    for word, count in shared.items():
+        similarity = 2 * count / (len(grams) + len(_word_trigrams(word)))
+        if similarity >= FUZZY_THRESHOLD:
+            yield word, similarity
+
+def _term_matches(term, lo, hi):
+    """
+    Find the leads matching one term, given the range of words it is a prefix of
+
+    Returns:
+        tuple: (ids of leads having the word, ids of leads having a longer word starting
+            with it, (similarity, ids) of similar words, most similar first)
+    """
+    exact = _ids(term)
+    prefix = set().union(*(_ids(word) for word in _words[lo:hi] if word != term))
+    fuzzy = []
+    # Only look for misspellings when nothing starts with the term
+    if not exact and not prefix and _is_fuzzy(term):
+        fuzzy = sorted(((similarity, _ids(word)) for word, similarity in _fuzzy_words(term)),
+                       key=lambda match: match[0], reverse=True)
+    return exact, prefix, fuzzy
+
+def _match(terms, allowed):
+    """
+    Find the leads matching every term
+
+    Terms that are a prefix of more than MAX_PREFIX_WORDS words are not expanded; they
+    are returned to be checked against each candidate's own words.
+
+    Returns:
+        tuple: (candidate ids, _term_matches of the other terms, the broad terms)
+    """
+    candidates = None
+    matched = []
+    broad = []
+    for term in terms:
+        lo, hi = _prefix_words(term)
+        if hi - lo > MAX_PREFIX_WORDS:
+            broad.append(term)
+            continue
+        exact, prefix, fuzzy = _term_matches(term, lo, hi)
+        ids = prefix.union(exact, *(ids for _, ids in fuzzy))
+        candidates = ids if candidates is None else candidates & ids
+        if allowed is not None:
+            candidates &= allowed
+        if not candidates:
+            return set(), [], []
+        matched.append((exact, prefix, fuzzy))
+
+    if candidates is None:
+        # Every term is very short: expand the first one over its first MAX_PREFIX_WORDS words
+        term = broad.pop(0)
+        lo, _ = _prefix_words(term)
+        exact, prefix, fuzzy = _term_matches(term, lo, lo + MAX_PREFIX_WORDS)
+        candidates = prefix.union(exact, *(ids for _, ids in fuzzy))
+        if allowed is not None:
+            candidates &= allowed
+        matched.append((exact, prefix, fuzzy))
+    return candidates, matched, broad
+
+def _score(lead_id, matched, broad):
+    """Score a candidate over all the terms, or None if it doesn't match a broad term"""
+    score = 0.0
+    for exact, prefix, fuzzy in matched:
+        if lead_id in exact:
+            score += EXACT_SCORE
+        elif lead_id in prefix:
+            score += PREFIX_SCORE
+        else:
+            score += FUZZY_SCORE * next((similarity for similarity, ids in fuzzy if lead_id in ids), 0)
+    if broad:
+        lead = shared_cache.get_lead(lead_id)
+        if lead is None:
+            return None
+        words = _lead_words(lead)
+        for term in broad:
+            if term in words:
+                score += EXACT_SCORE
+            elif any(word.startswith(term) for word in words):
+                score += PREFIX_SCORE
+            else:
+                return None
+    return score
+
+def _best_score(candidates, matched, broad):
+    """Get the highest score any of the candidates can have"""
+    best = EXACT_SCORE * len(broad)
+    for exact, prefix, fuzzy in matched:
+        if not candidates.isdisjoint(exact):
+            best += EXACT_SCORE
+        elif not candidates.isdisjoint(prefix):
+            best += PREFIX_SCORE
+        else:
+            best += FUZZY_SCORE * next((similarity for similarity, ids in fuzzy if not candidates.isdisjoint(ids)), 0)
+    return best
+
+def _rank(candidates, matched, broad, limit):
+    """Get the ids of the limit + 1 best candidates: highest score first, then newest (highest id)"""
+    if len(candidates) <= RANK_ALL_LIMIT:
+        scores = {}
+        for lead_id in candidates:
+            score = _score(lead_id, matched, broad)
+            if score is not None:
+                scores[lead_id] = score
+        return heapq.nlargest(limit + 1, scores, key=lambda lead_id: (scores[lead_id], lead_id))
+
+    # Walk the candidates from the newest down and stop as soon as limit + 1 of them
+    # have the best possible score, since no older lead can rank above them
+    best_score = _best_score(candidates, matched, broad)
+    top = []  # min-heap of (score, id)
+    for lead_id in range(max(candidates), min(candidates) - 1, -1):
+        if lead_id not in candidates:
+            continue
+        score = _score(lead_id, matched, broad)
+        if score is None:
+            continue
+        heapq.heappush(top, (score, lead_id))
+        if len(top) > limit + 1:
+            heapq.heappop(top)
+        if len(top) == limit + 1 and top[0][0] >= best_score:
+            break
+    return [lead_id for _, lead_id in sorted(top, reverse=True)]
+
+def search_leads(query, filters=None, limit=20):
+    """
+    Find the leads best matching a search query
+
+    Every word of the query must match a word of the lead, as a whole word, as a
+    prefix or, failing both, fuzzily. Whole-word matches rank above prefixes and
+    prefixes above fuzzy matches; equal scores list the newest lead first. A query
+    of the form "#123" finds the lead with that id.
+
+    Args:
+        query (str): Words, parts of words, customer codes, phone numbers or "#id"
+        filters (dict): Filters as accepted by lead_index.match_ids that the leads must
+            also match
+        limit (int): Maximum number of leads to return
+
+    Returns:
+        tuple: (matching read-only leads, best first; whether there are more matches)
+    """
+    lead_id = _LEAD_ID.fullmatch(query)
+    if lead_id:
+        ids = lead_index.match_ids(dict(filters or {}, id=int(lead_id.group(1))))
+        return shared_cache.get_leads_by_ids(ids), False
+
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return [], False
+    allowed = lead_index.match_ids(filters) if normalize_lead_filters(filters) else None
+
+    _ensure_index()
+    with _lock:
+        candidates, matched, broad = _match(terms, allowed)
+    if not candidates:
+        return [], False
+
+    # Ranked outside _lock, since checking broad terms reads the leads from shared_cache,
+    # which calls apply() while holding its own lock
+    best = _rank(candidates, matched, broad, limit)
+    return shared_cache.get_leads_by_ids(best[:limit]), len(best) > limit
+
+def get_stats():
+    """Get the number of indexed words and trigrams"""
+    with _lock:
+        return {"words": len(_words), "trigrams": len(_trigrams), "stale": _stale}
+
+shared_cache.register_view(rebuild, apply)
@@ -0,0 +1,268 @@
+"""
+Process-wide cache of the lead and user collections
+
+Streamlit runs every session of the app in one process, so the collections are
+parsed once and shared by all sessions instead of being reloaded on every rerun.
+The cache checks storage.data_version() (file mtimes/sizes, database file state)
+to notice changes made by other processes, and applies writes made through
+storage in this process directly, without a reload (unless the markers show that
+someone else wrote since the cache was loaded).
+
+Leads are handed out as read-only mappings: edit a copy (dict(lead)) and save it
+with storage.upsert_lead, which refuses the save (ConflictError) if the lead was
+changed since the copy was taken. Users are small and are handed out as fresh
+copies.
+
+Derived views of the leads (e.g. lead_index) register with register_view and are
+rebuilt on a reload and updated lead by lead on in-process writes. Views of the
+users (e.g. the credentials username index) register with register_user_view and
+are rebuilt whenever the users change.
+"""
+import os
+import threading
+import time
+from types import MappingProxyType
+
+import storage
+
+# Backends without a change marker (e.g. firebase) are reloaded after this many seconds
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "30"))
+
+_lock = threading.RLock()
+
+_leads = None          # id -> read-only lead
+_leads_view = None     # tuple of the cached leads, rebuilt lazily after a change
+_leads_token = None
+_leads_loaded_at = 0.0
+
+_users = None
+_users_token = None
+_users_loaded_at = 0.0
+
+_views = []            # (rebuild, apply) pairs kept in step with _leads
+_user_views = []       # rebuild callables kept in step with _users
+
+_STALE = object()      # token of a cached collection that must be reloaded on the next read
+_local = threading.local()  # the change markers the current thread's write started from
+
+_stats = {
+    "lead_hits": 0,
+    "lead_misses": 0,
+    "lead_writes_applied": 0,
+    "user_hits": 0,
+    "user_misses": 0,
+}
+
+def _is_fresh(cached, cached_token, loaded_at, token):
+    """Check whether a cached collection still matches storage"""
+    if cached is None:
+        return False
+    if token is None:
+        return time.monotonic() - loaded_at < CACHE_TTL_SECONDS
+    return token == cached_token
+
+def _ensure_leads():
+    """Reload the leads if storage changed since they were cached"""
+    global _leads, _leads_view, _leads_token, _leads_loaded_at
+
+    token = storage.data_version("leads")
+    if _is_fresh(_leads, _leads_token, _leads_loaded_at, token):
+        _stats["lead_hits"] += 1
+        return
+
+    _stats["lead_misses"] += 1
+    _leads = {lead["id"]: MappingProxyType(lead) for lead in storage.load_leads()}
+    _leads_view = None
+    _leads_token = token
+    _leads_loaded_at = time.monotonic()
+    _rebuild_views()
+
+def _rebuild_views():
+    for rebuild, _ in _views:
+        rebuild(_leads)
+
+def _apply_views(old, new):
+    for _, apply in _views:
+        apply(old, new)
+
+def register_view(rebuild, apply):
+    """
+    Keep a derived view of the leads in step with the cache
+
+    Args:
+        rebuild (callable): Called as rebuild(leads) with a dict of id -> read-only lead
+            whenever the leads are (re)loaded
+        apply (callable): Called as apply(old, new) when a single lead is added (old is
+            None), edited, or deleted (new is None) through storage in this process
+    """
+    with _lock:
+        _views.append((rebuild, apply))
+        if _leads is not None:
+            rebuild(_leads)
+
+def refresh_leads():
+    """Reload the leads (and rebuild the views) if storage changed since they were cached"""
+    with _lock:
+        _ensure_leads()
+
+def _ensure_users():
+    """Reload the users if storage changed since they were cached"""
+    global _users, _users_token, _users_loaded_at
+
+    token = storage.data_version("users")
+    if _is_fresh(_users, _users_token, _users_loaded_at, token):
+        _stats["user_hits"] += 1
+        return
+
+    _stats["user_misses"] += 1
+    _users = storage.load_users()
+    _users_token = token
+    _users_loaded_at = time.monotonic()
+    _rebuild_user_views()
+
+def _rebuild_user_views():
+    for rebuild in _user_views:
+        rebuild(_users)
+
+def register_user_view(rebuild):
+    """
+    Keep a derived view of the users in step with the cache
+
+    Args:
+        rebuild (callable): Called as rebuild(users) with the cached user list whenever
+            the users are (re)loaded or saved
+    """
+    with _lock:
+        _user_views.append(rebuild)
+        if _users is not None:
+            rebuild(_users)
+
+def refresh_users():
+    """Reload the users (and rebuild the user views) if storage changed since they were cached"""
+    with _lock:
+        _ensure_users()
+
+def get_leads():
+    """
+    Get all leads, shared read-only across sessions
+
+    Returns:
+        tuple: Read-only lead mappings in storage order
+    """
+    global _leads_view
+    with _lock:
+        _ensure_leads()
+        if _leads_view is None:
+            _leads_view = tuple(_leads.values())
+        return _leads_view
+
+def get_lead(lead_id):
+    """Get an editable copy of a single lead, or None if it doesn't exist"""
+    with _lock:
+        _ensure_leads()
+        lead = _leads.get(lead_id)
+        return dict(lead) if lead is not None else None
+
+def get_leads_by_ids(lead_ids):
+    """Get the cached read-only leads with the given ids, skipping ids that don't exist"""
+    with _lock:
+        if _leads is None:
+            _ensure_leads()
+        return [_leads[lead_id] for lead_id in lead_ids if lead_id in _leads]
+
+def get_users():
+    """Get a copy of all users"""
+    with _lock:
+        _ensure_users()
+        return [dict(user) for user in _users]
+
+def invalidate():
+    """Drop the cached collections so the next read reloads them"""
+    global _leads, _leads_view, _users
+    with _lock:
+        _leads = None
+        _leads_view = None
+        _users = None
+
+def get_stats():
+    """Get cache hit/miss counters (misses are full reloads from storage)"""
+    with _lock:
+        return dict(_stats)
+
+def _is_newer(record, cached):
+    """Check whether a written record is newer than the cached one (a reload may have overtaken the write)"""
+    return cached is None or (record.get("version") or 0) > (cached.get("version") or 0)
+
+def _apply_lead(lead):
+    old = _leads.get(lead["id"])
+    if _is_newer(lead, old):
+        lead = MappingProxyType(dict(lead))
+        _leads[lead["id"]] = lead
+        _apply_views(old, lead)
+
+def _before_storage_write(event):
+    """Note the change markers before a write made through storage in this thread"""
+    _local.tokens = {"leads": storage.data_version("leads"), "users": storage.data_version("users")}
+
+def _on_storage_write(event, payload):
+    """Apply a write made through storage in this process to the cached collections"""
+    global _leads, _leads_view, _leads_token, _users, _users_token
+
+    tokens = getattr(_local, "tokens", None) or {}
+    _local.tokens = None
+
+    with _lock:
+        if event == "set_backend":
+            invalidate()
+            return
+
+        if _leads is not None:
+            if event == "upsert_lead":
+                _apply_lead(payload)
+            elif event in ("insert_leads", "update_leads"):
+                for lead in payload:
+                    _apply_lead(lead)
+            elif event == "delete_lead":
+                old = _leads.pop(payload, None)
+                if old is not None:
+                    _apply_views(old, None)
+            elif event == "save_leads":
+                _leads = {lead["id"]: MappingProxyType(dict(lead)) for lead in payload}
+                _rebuild_views()
+
+            if event in ("upsert_lead", "insert_leads", "update_leads", "delete_lead", "save_leads"):
+                _leads_view = None
+                _stats["lead_writes_applied"] += 1
+
+        if event == "save_users":
+            _users = [dict(user) for user in payload]
+            _rebuild_user_views()
+        elif event == "upsert_user" and _users is not None:
+            i = next((i for i, user in enumerate(_users) if user["id"] == payload["id"]), None)
+            if i is None:
+                _users.append(dict(payload))
+                _rebuild_user_views()
+            elif _is_newer(payload, _users[i]):
+                _users[i] = dict(payload)
+                _rebuild_user_views()
+        elif event == "delete_user" and _users is not None:
+            _users = [user for user in _users if user["id"] != payload]
+            _rebuild_user_views()
+        elif event == "update_users_last_login" and _users is not None:
+            by_name = {username.lower(): timestamp for username, timestamp in payload.items()}
+            for user in _users:
+                timestamp = by_name.get(user["username"].lower())
+                if timestamp is not None:
+                    user["last_login"] = timestamp
+            _rebuild_user_views()
+
+        # Our own write moved the change markers (in some backends those of both
+        # collections). If the cache matched the markers the write started from, adopt
+        # the new ones so it doesn't look like an outside change; otherwise another
+        # process (or thread) wrote too, so reload on the next read.
+        if _leads is not None:
+            _leads_token = storage.data_version("leads") if tokens.get("leads", _STALE) == _leads_token else _STALE
+        if _users is not None:
+            _users_token = storage.data_version("users") if tokens.get("users", _STALE) == _users_token else _STALE
+
+storage.add_listener(_on_storage_write, before=_before_storage_write)
@@ -0,0 +1,123 @@
+"""
+Replay historical leads through the lead routing strategies and compare them
+
+Usage:
+    python simulate_routing.py [leads.json] [--synthetic N] [--close-after N]
+
+    The leads (default data/leads.json, or N synthetic ones) are routed in the order
+    they were created, by each strategy in lead_router, to the reps the leads were
+    actually assigned to. A routed lead stays open until --close-after more leads
+    have arrived (default 50), and then closes with its recorded status.
+
+    Reported per strategy: leads per rep, the highest number of open leads any rep
+    held at once, the share of leads routed to a rep who already had leads in that
+    sector of the city, and the expected wins: every closed lead weighed by the conversion rate
+    its rep actually achieved, as a measure of sending leads to strong closers.
+"""
+import json
+import statistics
+import sys
+import time
+from collections import deque
+
+from lead_router import Router, STRATEGIES, UNASSIGNED, OPEN_STATUSES, WON_STATUSES, LOST_STATUSES
+
+
+def load_leads(argv):
+    """Get the leads to replay, in the order they were created"""
+    if "--synthetic" in argv:
+        from benchmark_storage import generate_leads
+        leads = generate_leads(int(argv[argv.index("--synthetic") + 1]))
+    else:
+        paths = [arg for arg in argv if arg.endswith(".json")]
+        with open(paths[0] if paths else "data/leads.json") as f:
+            leads = json.load(f)
+    return sorted(leads, key=lambda lead: (lead.get("date_created") or "", lead["id"]))
+
+
+def actual_rates(leads):
+    """Get the conversion rate each rep achieved on the recorded leads"""
+    won, closed = {}, {}
+    for lead in leads:
+        rep = lead.get("assigned_to")
+        if lead.get("status") in WON_STATUSES or lead.get("status") in LOST_STATUSES:
+            closed[rep] = closed.get(rep, 0) + 1
+            if lead["status"] in WON_STATUSES:
+                won[rep] = won.get(rep, 0) + 1
+    return {rep: won.get(rep, 0) / count for rep, count in closed.items()}
+
+
+def simulate(leads, reps, strategy, close_after, rates):
+    """Route the leads with one strategy and collect the outcome"""
+    router = Router()
+    router.set_reps(reps)
+    routed = {rep: 0 for rep in reps}
+    open_leads = {rep: 0 for rep in reps}
+    peak_open = 0
+    affinity_hits = 0
+    expected_wins = 0.0
+    closing = deque()
+    seen_areas = {rep: set() for rep in reps}
+
+    start = time.perf_counter()
+    for lead in leads:
+        opened = dict(lead, status="Open")
+        rep = router.assign(opened, strategy)
+        opened["assigned_to"] = rep
+        router.apply(None, opened)
+
+        routed[rep] += 1
+        open_leads[rep] += 1
+        peak_open = max(peak_open, open_leads[rep])
+        area = (lead.get("city"), lead.get("sector"))
+        if area in seen_areas[rep]:
+            affinity_hits += 1
+        seen_areas[rep].add(area)
+        closing.append((lead, opened))
+
+        # Close the lead that arrived close_after leads ago with its recorded status
+        if len(closing) > close_after:
+            lead_then, done = closing.popleft()
+            recorded = lead_then.get("status")
+            if recorded not in OPEN_STATUSES:
+                router.apply(done, dict(done, status=recorded))
+                open_leads[done["assigned_to"]] -= 1
+                if recorded in WON_STATUSES or recorded in LOST_STATUSES:
+                    expected_wins += rates.get(done["assigned_to"], 0.0)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "routed": routed,
+        "peak_open": peak_open,
+        "affinity": affinity_hits / len(leads),
+        "expected_wins": expected_wins,
+        "per_decision_us": elapsed / len(leads) * 1e6,
+    }
+
+
+def main():
+    argv = sys.argv[1:]
+    close_after = int(argv[argv.index("--close-after") + 1]) if "--close-after" in argv else 50
+    leads = load_leads(argv)
+    reps = sorted({lead.get("assigned_to") for lead in leads} - {None, "", UNASSIGNED})
+    if not reps:
+        print("None of the leads is assigned to a rep; nothing to compare against")
+        return
+
+    rates = actual_rates(leads)
+
+    print(f"{len(leads):,} leads, {len(reps)} reps, leads close {close_after} arrivals after they open")
+    print("actual conversion: " + ", ".join(f"{rep} {rates.get(rep, 0):.0%}" for rep in reps))
+    print()
+    print(f"{'strategy':<30} {'leads/rep min-max':>18} {'stdev':>8} {'peak open':>10} "
+          f"{'same area':>10} {'exp. wins':>10} {'us/lead':>8}")
+    for strategy, label in STRATEGIES.items():
+        result = simulate(leads, reps, strategy, close_after, rates)
+        counts = list(result["routed"].values())
+        print(f"{label:<30} {f'{min(counts):,}-{max(counts):,}':>18} {statistics.pstdev(counts):>8.1f} "
+              f"{result['peak_open']:>10,} {result['affinity']:>10.0%} {result['expected_wins']:>10.1f} "
+              f"{result['per_decision_us']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from storage import parse_customer_code, check_version, check_new, next_version, next_lead_version, lead_sort_key
+from storage import DuplicateUsernameError
+
+# Define file paths for SQLite data storage
+DATA_DIR = "data"
+DB_FILE = os.environ.get("SQLITE_DB_PATH", os.path.join(DATA_DIR, "evergreen.db"))
+
+# Ensure data directory exists
+Path(DATA_DIR).mkdir(exist_ok=True)
+
+# Lead fields that get their own indexed column; the full record is kept as JSON in `data`
+LEAD_INDEXED_FIELDS = ["status", "source", "city", "assigned_to", "date_created", "customer_code"]
+
+# Columns query_leads may sort by
+LEAD_ORDER_FIELDS = ["id"] + LEAD_INDEXED_FIELDS
+
+# Ids per statement in update_leads
+UPDATE_CHUNK_IDS = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY,
+    status TEXT,
+    source TEXT,
+    city TEXT,
+    assigned_to TEXT,
+    date_created TEXT,
+    customer_code TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leads_status ON leads(status);
+CREATE INDEX IF NOT EXISTS idx_leads_source ON leads(source);
+CREATE INDEX IF NOT EXISTS idx_leads_city ON leads(city);
+CREATE INDEX IF NOT EXISTS idx_leads_assigned_to ON leads(assigned_to);
+CREATE INDEX IF NOT EXISTS idx_leads_date_created ON leads(date_created);
+CREATE INDEX IF NOT EXISTS idx_leads_customer_code ON leads(customer_code);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL COLLATE NOCASE UNIQUE,
+    role TEXT,
+    status TEXT,
+    data TEXT NOT NULL
+);
+"""
+
+# Streamlit serves each session on its own thread, and sqlite3 connections are per-thread
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_for = None
+
+def _connect():
+    """Get this thread's connection, creating the schema on first use"""
+    global _initialized_for
+
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_FILE:
+        return conn
+
+    conn = sqlite3.connect(DB_FILE, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.conn = conn
+    _local.path = DB_FILE
+
+    with _init_lock:
+        if _initialized_for != DB_FILE:
+            conn.executescript(SCHEMA)
+            with conn:
+                _seed_counters(conn)
+            _initialized_for = DB_FILE
+    return conn
+
+def _seed_counters(conn):
+    """Create missing counters from the stored leads (a one-time scan per database)"""
+    conn.execute(
+        "INSERT OR IGNORE INTO counters SELECT 'lead_id', COALESCE(MAX(id), 0) + 1 FROM leads"
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO counters "
+        "SELECT 'customer_code', COALESCE(MAX(CAST(substr(customer_code, 4) AS INTEGER)), 0) + 1 "
+        "FROM leads WHERE customer_code GLOB 'Evr[0-9]*'"
+    )
+
+@contextmanager
+def _write_transaction():
+    """Run a read-modify-write in a transaction that holds the write lock from the start"""
+    conn = _connect()
+    # BEGIN IMMEDIATE takes the write lock up front, so the read and the write can't interleave
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def _stored(conn, table, record_id):
+    """Get a stored lead/user by id, or None"""
+    row = conn.execute(f"SELECT data FROM {table} WHERE id = ?", (record_id,)).fetchone()
+    return json.loads(row[0]) if row is not None else None
+
+def _bump_counters(conn, lead):
+    """Keep the counters ahead of a stored lead, including imported or hand-edited ones"""
+    conn.execute("UPDATE counters SET value = MAX(value, ?) WHERE name = 'lead_id'", (lead["id"] + 1,))
+    code_num = parse_customer_code(lead.get("customer_code"))
+    if code_num is not None:
+        conn.execute("UPDATE counters SET value = MAX(value, ?) WHERE name = 'customer_code'", (code_num + 1,))
+
+def _lead_row(lead):
+    """Convert a lead dict to a row for the leads table"""
+    return (lead["id"],) + tuple(lead.get(field) for field in LEAD_INDEXED_FIELDS) + (json.dumps(lead),)
+
+def _user_row(user):
+    """Convert a user dict to a row for the users table"""
+    return (user["id"], user["username"], user.get("role"), user.get("status"), json.dumps(user))
+
+def _where_clause(filters):
+    """
+    Build a WHERE clause from lead filters
+
+    Args:
+        filters (dict): Field values to match. Values may be a single value or a list of
+            values; None, "All" and empty lists are ignored. "date_from"/"date_to" bound
+            date_created (inclusive, YYYY-MM-DD).
+
+    Returns:
+        tuple: (sql, params)
+    """
+    clauses = []
+    params = []
+    for field, value in (filters or {}).items():
+        if field == "date_from":
+            if value:
+                clauses.append("date_created >= ?")
+                params.append(value)
+        elif field == "date_to":
+            if value:
+                clauses.append("date_created <= ?")
+                params.append(value)
+        elif field in LEAD_ORDER_FIELDS:
+            if value is None or value == "All":
+                continue
+            if isinstance(value, (list, tuple, set)):
+                if not value:
+                    continue
+                clauses.append(f"{field} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f"{field} = ?")
+                params.append(value)
+        else:
+            raise ValueError(f"Unsupported lead filter: {field}")
+
+    sql = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return sql, params
+
+def _order_clause(order):
+    """Build an ORDER BY clause from a field name, prefixed with '-' for descending"""
+    order = order or "id"
+    descending = order.startswith("-")
+    field = order.lstrip("-")
+    if field not in LEAD_ORDER_FIELDS:
+        raise ValueError(f"Unsupported lead order: {order}")
+    direction = "DESC" if descending else "ASC"
+    # Tie-break on id so paging through equal keys is stable
+    return f" ORDER BY {field} {direction}, id {direction}"
+
+def _cursor_clause(order, after):
+    """Build the condition for rows after a page cursor (see storage.lead_sort_key)"""
+    descending = order.startswith("-")
+    field = order.lstrip("-")
+    op = "<" if descending else ">"
+    has_value, value, last_id = after
+    if field == "id":
+        return f"id {op} ?", [last_id]
+    # NULLs come first in ascending order and last in descending order
+    if not has_value:
+        if descending:
+            return f"({field} IS NULL AND id < ?)", [last_id]
+        return f"(({field} IS NULL AND id > ?) OR {field} IS NOT NULL)", [last_id]
+    clause = f"{field} {op} ? OR ({field} = ? AND id {op} ?)"
+    if descending:
+        clause += f" OR {field} IS NULL"
+    return f"({clause})", [value, value, last_id]
+
+def save_leads(leads):
+    """Save leads to SQLite, replacing the stored set"""
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM leads")
+        conn.executemany("INSERT INTO leads VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (_lead_row(lead) for lead in leads))
+        # Counters only move forward, so raise them to cover the new set
+        _seed_counters(conn)
+        conn.execute(
+            "UPDATE counters SET value = MAX(value, (SELECT COALESCE(MAX(id), 0) + 1 FROM leads)) "
+            "WHERE name = 'lead_id'"
+        )
+        conn.execute(
+            "UPDATE counters SET value = MAX(value, (SELECT COALESCE(MAX(CAST(substr(customer_code, 4) AS INTEGER)), 0) + 1 "
+            "FROM leads WHERE customer_code GLOB 'Evr[0-9]*')) WHERE name = 'customer_code'"
+        )
+
+def load_leads():
+    """Load leads from SQLite"""
+    rows = _connect().execute("SELECT data FROM leads ORDER BY id")
+    return [json.loads(data) for (data,) in rows]
+
+def upsert_lead(lead):
+    """Insert or replace a single lead by id, if it is based on the stored version"""
+    with _write_transaction() as conn:
+        stored = _stored(conn, "leads", lead["id"])
+        check_version(stored, lead, "Lead")
+        lead = next_lead_version(stored, lead)
+        conn.execute("INSERT OR REPLACE INTO leads VALUES (?, ?, ?, ?, ?, ?, ?, ?)", _lead_row(lead))
+        _bump_counters(conn, lead)
+    return lead
+
+def insert_leads(leads):
+    """Insert a batch of new leads in one transaction (none of them if one already exists)"""
+    if not leads:
+        return []
+    with _write_transaction() as conn:
+        placeholders = ", ".join("?" * len(leads))
+        row = conn.execute(
+            f"SELECT data FROM leads WHERE id IN ({placeholders}) LIMIT 1", [lead["id"] for lead in leads]
+        ).fetchone()
+        if row is not None:
+            stored = json.loads(row[0])
+            check_new(stored, stored, "Lead")
+        leads = [next_lead_version(None, lead) for lead in leads]
+        conn.executemany("INSERT INTO leads VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (_lead_row(lead) for lead in leads))
+        for lead in leads:
+            _bump_counters(conn, lead)
+    return leads
+
+def update_leads(lead_ids, changes, filters=None):
+    """Set field values on the leads that still match filters, in one transaction"""
+    lead_ids = list(lead_ids)
+    updated = []
+    with _write_transaction() as conn:
+        # A chunk of ids at a time, to stay under SQLite's limit on query parameters
+        for start in range(0, len(lead_ids), UPDATE_CHUNK_IDS):
+            where, params = _where_clause(dict(filters or {}, id=lead_ids[start:start + UPDATE_CHUNK_IDS]))
+            stored = [json.loads(data) for (data,) in conn.execute("SELECT data FROM leads" + where, params)]
+            leads = [next_lead_version(lead, dict(lead, **changes)) for lead in stored]
+            conn.executemany("INSERT OR REPLACE INTO leads VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (_lead_row(lead) for lead in leads))
+            updated.extend(leads)
+    return updated
+
+def delete_lead(lead_id, version=None):
+    """Delete a single lead by id (only if it still has `version`, when given)"""
+    with _write_transaction() as conn:
+        if version is not None:
+            check_version(_stored(conn, "leads", lead_id), {"id": lead_id, "version": version}, "Lead")
+        conn.execute("DELETE FROM leads WHERE id = ?", (lead_id,))
+
+def query_leads(filters=None, order=None, limit=None, offset=0):
+    """
+    Query leads using the indexed columns
+
+    Args:
+        filters (dict): Filters as accepted by the WHERE builder (status, source, city,
+            assigned_to, customer_code, date_from, date_to)
+        order (str): Field to sort by, prefixed with '-' for descending (default "id")
+        limit (int): Maximum number of leads to return
+        offset (int): Number of matching leads to skip
+
+    Returns:
+        list: Matching lead dicts
+    """
+    where, params = _where_clause(filters)
+    sql = "SELECT data FROM leads" + where + _order_clause(order)
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+    elif offset:
+        sql += " LIMIT -1 OFFSET ?"
+        params.append(offset)
+    return [json.loads(data) for (data,) in _connect().execute(sql, params)]
+
+def page_leads(filters=None, order=None, limit=50, after=None):
+    """
+    Get one page of leads after a cursor, reading only that page from the database
+
+    Returns:
+        tuple: (leads on the page, cursor of the next page or None on the last page)
+    """
+    order = order or "id"
+    where, params = _where_clause(filters)
+    if after is not None:
+        clause, cursor_params = _cursor_clause(order, after)
+        where += (" AND " if where else " WHERE ") + clause
+        params += cursor_params
+    sql = "SELECT data FROM leads" + where + _order_clause(order) + " LIMIT ?"
+    # One extra row tells whether there is a next page
+    leads = [json.loads(data) for (data,) in _connect().execute(sql, params + [limit + 1])]
+    next_cursor = lead_sort_key(leads[limit - 1], order) if len(leads) > limit else None
+    return leads[:limit], next_cursor
+
+def iter_leads(filters=None, order=None, chunk_size=1000):
+    """Yield the leads matching filters in chunks, streamed from one read of the database"""
+    where, params = _where_clause(filters)
+    sql = "SELECT data FROM leads" + where + _order_clause(order)
+    cursor = _connect().execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [json.loads(data) for (data,) in rows]
+    finally:
+        cursor.close()
+
+def count_leads(filters=None):
+    """Count leads matching the given filters"""
+    where, params = _where_clause(filters)
+    return _connect().execute("SELECT COUNT(*) FROM leads" + where, params).fetchone()[0]
+
+def data_version(collection):
+    """Get a marker that changes whenever the database file changes (any table)"""
+    # In WAL mode commits land in the -wal file until a checkpoint rewrites the main file
+    stats = []
+    for path in (DB_FILE, DB_FILE + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stats.append(None)
+        else:
+            stats.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(stats)
+
+def save_users(users):
+    """Save users to SQLite, replacing the stored set"""
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM users")
+        conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?)", (_user_row(user) for user in users))
+
+def upsert_user(user):
+    """Insert or replace a single user by id, if it is based on the stored version"""
+    load_users()  # seeds the table on first use
+    with _write_transaction() as conn:
+        check_version(_stored(conn, "users", user["id"]), user, "User")
+        user = next_version(user)
+        # Not INSERT OR REPLACE: that would delete another user with the same (NOCASE) username
+        try:
+            conn.execute(
+                "INSERT INTO users VALUES (?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                "username = excluded.username, role = excluded.role, status = excluded.status, data = excluded.data",
+                _user_row(user)
+            )
+        except sqlite3.IntegrityError:
+            raise DuplicateUsernameError(f"The username '{user['username']}' is already taken") from None
+    return user
+
+def delete_user(user_id, version=None):
+    """Delete a single user by id (only if it still has `version`, when given)"""
+    with _write_transaction() as conn:
+        if version is not None:
+            check_version(_stored(conn, "users", user_id), {"id": user_id, "version": version}, "User")
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+
+def load_users():
+    """Load users from SQLite"""
+    rows = _connect().execute("SELECT data FROM users ORDER BY id").fetchall()
+    if rows:
+        return [json.loads(data) for (data,) in rows]
+
+    # Seed from the local JSON store (which falls back to the default users)
+    import local_db
+    users = local_db.load_users()
+    save_users(users)
+    return users
+
+def peek_counter(name):
+    """Get the next value a counter will hand out, without reserving it"""
+    row = _connect().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+    return 1 if row is None else row[0]
+
+def allocate_counter(name, count=1):
+    """Reserve `count` consecutive values from a counter and return the first"""
+    with _write_transaction() as conn:
+        row = conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        first = 1 if row is None else row[0]
+        conn.execute("INSERT OR REPLACE INTO counters VALUES (?, ?)", (name, first + count))
+    return first
+
+def update_users_last_login(logins):
+    """Set the last login timestamp of several users in one transaction"""
+    load_users()  # seeds the table on first use
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            "UPDATE users SET data = json_set(data, '$.last_login', ?) WHERE username = ? COLLATE NOCASE",
+            ((timestamp, username) for username, timestamp in logins.items())
+        )
+
+# Function to initialize the database with data from local files (for migration)
+def migrate_local_data_to_sqlite():
+    """Migrate data from the local JSON store to SQLite"""
+    import local_db
+
+    local_leads = local_db.load_leads()
+    save_leads(local_leads)
+    print(f"Migrated {len(local_leads)} leads to SQLite")
+
+    local_users = local_db.load_users()
+    save_users(local_users)
+    print(f"Migrated {len(local_users)} users to SQLite")
@@ -0,0 +1,634 @@
+"""
+Storage interface shared by the dashboard
+
+Every backend is a module exposing the same functions (load_leads, save_leads,
+upsert_lead, insert_leads, update_leads, delete_lead, query_leads, count_leads, peek_counter,
+allocate_counter, load_users, save_users, upsert_user, delete_user,
+update_users_last_login, and optionally data_version). The backend is chosen
+with the STORAGE_BACKEND environment variable (or .env) and imported lazily, so
+unused backends and their dependencies never load.
+
+Leads and users carry a version number. upsert_lead/upsert_user only save a
+record whose version is the one stored (the version it was read at) and store it
+with the next version; otherwise they raise ConflictError, so an edit based on a
+stale copy is refused instead of silently overwriting someone else's change.
+Lead writes also stamp the lead's lifecycle (created_at, status_history, closed_at)
+with next_lead_version.
+
+Writes made through this module are announced to listeners registered with
+add_listener, which is how in-process caches stay current without reloading.
+"""
+import os
+import heapq
+import importlib
+import threading
+from datetime import datetime
+
+try:
+    from dotenv import load_dotenv
+except ImportError:  # python-dotenv is optional; plain environment variables still work
+    load_dotenv = None
+
+if load_dotenv is not None:
+    load_dotenv()
+
+# Backend name -> module implementing the storage interface
+BACKENDS = {
+    "json": "local_db",
+    "sqlite": "sqlite_db",
+    "firebase": "firebase_db",
+    "memory": "memory_db",
+}
+
+DEFAULT_BACKEND = "json"
+
+# Lead fields that can be used in query filters and sort orders
+LEAD_QUERY_FIELDS = ["id", "status", "source", "city", "assigned_to", "date_created", "customer_code"]
+
+# Lead statuses that close a lead; closed_at is stamped when a lead enters one
+CLOSED_LEAD_STATUSES = ["Won", "Lost", "Not Interested", "Fake Lead"]
+
+# Fields next_lead_version maintains; a saved copy can't change them
+LEAD_LIFECYCLE_FIELDS = ["created_at", "status_changed_at", "closed_at", "status_history"]
+
+# Customer codes are the prefix plus a number zero-padded to at least 3 digits (Evr001 ... Evr1000)
+CUSTOMER_CODE_PREFIX = "Evr"
+
+_backend = None
+_backend_lock = threading.Lock()
+_listeners = []         # (listener, before) pairs, see add_listener
+
+class StorageError(Exception):
+    """Base class of the errors raised by the storage layer"""
+
+class ConflictError(StorageError):
+    """Raised when a record was changed or deleted by someone else since it was read"""
+
+class DuplicateUsernameError(StorageError):
+    """Raised when a user would get a username (compared case-insensitively) another user has"""
+
+def register_backend(name, module_name):
+    """Register an additional backend module under a name usable in STORAGE_BACKEND"""
+    BACKENDS[name] = module_name
+
+def get_backend_name():
+    """Get the configured backend name"""
+    return os.environ.get("STORAGE_BACKEND", DEFAULT_BACKEND).strip().lower()
+
+def get_backend():
+    """Get the configured backend module, importing it on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = get_backend_name()
+                if name not in BACKENDS:
+                    raise ValueError(
+                        f"Unknown storage backend '{name}'. Choose one of: {', '.join(sorted(BACKENDS))}"
+                    )
+                _backend = importlib.import_module(BACKENDS[name])
+    return _backend
+
+def set_backend(name):
+    """Switch to another registered backend (used by benchmarks and scripts)"""
+    global _backend
+    os.environ["STORAGE_BACKEND"] = name
+    with _backend_lock:
+        _backend = None
+    backend = get_backend()
+    _notify("set_backend", name)
+    return backend
+
+def add_listener(listener, before=None):
+    """
+    Register a function called after every write made through this module
+
+    The listener is called as listener(event, payload), where event is the name of the
+    write function (e.g. "upsert_lead") and payload is what was written. before, if
+    given, is called as before(event) just before the write, e.g. to read the
+    data_version it starts from; it isn't followed by the listener if the write fails.
+    """
+    if all(registered != listener for registered, _ in _listeners):
+        _listeners.append((listener, before))
+
+def remove_listener(listener):
+    """Unregister a listener added with add_listener"""
+    _listeners[:] = [pair for pair in _listeners if pair[0] != listener]
+
+def _notify_before(event):
+    for _, before in list(_listeners):
+        if before is not None:
+            before(event)
+
+def _notify(event, payload):
+    for listener, _ in list(_listeners):
+        listener(event, payload)
+
+def format_customer_code(number):
+    """Format a customer code number, e.g. 7 -> Evr007, 1234 -> Evr1234"""
+    return f"{CUSTOMER_CODE_PREFIX}{number:03d}"
+
+def parse_customer_code(code):
+    """Get the number from a customer code, or None if it is not in the EvrNNN format"""
+    if not isinstance(code, str) or not code.startswith(CUSTOMER_CODE_PREFIX):
+        return None
+    digits = code[len(CUSTOMER_CODE_PREFIX):]
+    return int(digits) if digits.isdigit() else None
+
+def normalize_lead_filters(filters):
+    """
+    Normalize lead filters for matching in Python
+
+    Values may be a single value or a list of values; None, "All" and empty lists
+    are dropped. "date_from"/"date_to" bound date_created (inclusive, YYYY-MM-DD).
+
+    Returns:
+        dict: field -> set of allowed values, plus the date bounds as strings
+    """
+    normalized = {}
+    for field, value in (filters or {}).items():
+        if field in ("date_from", "date_to"):
+            if value:
+                normalized[field] = value
+        elif field in LEAD_QUERY_FIELDS:
+            if value is None or value == "All":
+                continue
+            if isinstance(value, (list, tuple, set)):
+                if not value:
+                    continue
+                normalized[field] = set(value)
+            else:
+                normalized[field] = {value}
+        else:
+            raise ValueError(f"Unsupported lead filter: {field}")
+    return normalized
+
+def lead_matches(lead, filters):
+    """Check a lead against filters returned by normalize_lead_filters"""
+    for field, allowed in filters.items():
+        if field == "date_from":
+            if (lead.get("date_created") or "") < allowed:
+                return False
+        elif field == "date_to":
+            if (lead.get("date_created") or "") > allowed:
+                return False
+        elif lead.get(field) not in allowed:
+            return False
+    return True
+
+def _order_field(order):
+    field = order.lstrip("-")
+    if field not in LEAD_QUERY_FIELDS:
+        raise ValueError(f"Unsupported lead order: {order}")
+    return field
+
+def lead_sort_key(lead, order):
+    """
+    Get the position of a lead in a sort order, used as the page cursor of page_leads
+
+    Missing values sort first, like NULLs in SQL; ties are broken on id.
+    """
+    value = lead.get(order.lstrip("-"))
+    return (value is not None, value or "", lead["id"])
+
+def sort_and_slice_leads(leads, order=None, limit=None, offset=0):
+    """Sort matching leads by a field ('-' prefix for descending) and apply limit/offset"""
+    order = order or "id"
+    _order_field(order)
+    leads = sorted(leads, key=lambda lead: lead_sort_key(lead, order), reverse=order.startswith("-"))
+    end = None if limit is None else offset + limit
+    return leads[offset:end]
+
+def page_of_leads(leads, order=None, limit=50, after=None):
+    """
+    Pick one page of leads in sort order, after a cursor
+
+    Only the page is sorted (a bounded heap over the matches), however many leads match.
+
+    Returns:
+        tuple: (leads on the page, cursor of the next page or None on the last page)
+    """
+    order = order or "id"
+    _order_field(order)
+    descending = order.startswith("-")
+    keyed = ((lead_sort_key(lead, order), lead) for lead in leads)
+    if after is not None:
+        after = tuple(after)
+        keyed = (item for item in keyed if (item[0] < after if descending else item[0] > after))
+    pick = heapq.nlargest if descending else heapq.nsmallest
+    # One extra lead tells whether there is a next page
+    page = pick(limit + 1, keyed, key=lambda item: item[0])
+    next_cursor = page[limit - 1][0] if len(page) > limit else None
+    return [lead for _, lead in page[:limit]], next_cursor
+
+def check_version(stored, record, kind="Record"):
+    """
+    Check that a record being saved is based on the stored version
+
+    Args:
+        stored (dict): The stored record, or None if there is none
+        record (dict): The record being saved; its "version" is the version it was
+            read at (missing or 0 for a new record)
+        kind (str): Record kind used in the error message
+
+    Raises:
+        ConflictError: If the stored record has another version or was deleted
+    """
+    expected = record.get("version") or 0
+    if stored is None:
+        if expected:
+            raise ConflictError(f"{kind} #{record['id']} was deleted by someone else")
+        return
+    actual = stored.get("version") or 0
+    if actual != expected:
+        raise ConflictError(
+            f"{kind} #{record['id']} was changed by someone else (version {actual}, you edited version {expected})"
+        )
+
+def check_new(stored, record, kind="Record"):
+    """Check that a record being inserted as new isn't stored yet (raises ConflictError)"""
+    if stored is not None:
+        raise ConflictError(f"{kind} #{record['id']} already exists")
+
+def check_unique_username(users, user):
+    """Check that no other user has the user's username, ignoring case (raises DuplicateUsernameError)"""
+    username = user["username"].lower()
+    if any(other["id"] != user["id"] and other["username"].lower() == username for other in users):
+        raise DuplicateUsernameError(f"The username '{user['username']}' is already taken")
+
+def next_version(record):
+    """Get a copy of a record with its version bumped, ready to be stored"""
+    return dict(record, version=(record.get("version") or 0) + 1)
+
+def next_lead_version(stored, lead, now=None):
+    """
+    Get a copy of a lead with its version bumped and its lifecycle stamped, ready to be stored
+
+    A new lead gets created_at (unless it has one). A status change is appended to
+    status_history as {"from", "to", "at"}, and sets status_changed_at and closed_at
+    (cleared again when a closed lead is reopened). The lifecycle fields of an edited
+    lead are carried over from the stored lead, not taken from the copy being saved.
+
+    Args:
+        stored (dict): The stored lead, or None for a new lead
+        lead (dict): The lead being saved
+        now (str): Time of the change, "YYYY-MM-DD HH:MM:SS" (default: now)
+    """
+    now = now or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    lead = next_version(lead)
+    if stored is None:
+        lead["created_at"] = lead.get("created_at") or now
+        previous_status = None
+        now = lead["created_at"]
+    else:
+        for field in LEAD_LIFECYCLE_FIELDS:
+            if field in stored:
+                lead[field] = stored[field]
+            else:
+                lead.pop(field, None)
+        previous_status = stored.get("status")
+
+    status = lead.get("status")
+    if status != previous_status:
+        lead["status_history"] = list(lead.get("status_history") or []) + [
+            {"from": previous_status, "to": status, "at": now}
+        ]
+        lead["status_changed_at"] = now
+        lead["closed_at"] = now if status in CLOSED_LEAD_STATUSES else None
+    return lead
+
+def _find_by_id(records, record_id):
+    return next((i for i, record in enumerate(records) if record["id"] == record_id), None)
+
+# Fallbacks for backends that only implement whole-collection load/save (e.g. firebase_db).
+# Not atomic: another client can write between the load and the save.
+def _fallback_upsert_lead(backend, lead):
+    leads = backend.load_leads()
+    i = _find_by_id(leads, lead["id"])
+    check_version(leads[i] if i is not None else None, lead, "Lead")
+    lead = next_lead_version(leads[i] if i is not None else None, lead)
+    if i is not None:
+        leads[i] = lead
+    else:
+        leads.append(lead)
+    backend.save_leads(leads)
+    return lead
+
+def _fallback_insert_leads(backend, leads):
+    stored = backend.load_leads()
+    existing = {lead["id"]: lead for lead in stored}
+    for lead in leads:
+        check_new(existing.get(lead["id"]), lead, "Lead")
+    leads = [next_lead_version(None, lead) for lead in leads]
+    backend.save_leads(stored + leads)
+    return leads
+
+def _fallback_update_leads(backend, lead_ids, changes, filters=None):
+    leads = backend.load_leads()
+    normalized = normalize_lead_filters(filters)
+    lead_ids = set(lead_ids)
+    updated = []
+    for i, lead in enumerate(leads):
+        if lead["id"] in lead_ids and lead_matches(lead, normalized):
+            leads[i] = next_lead_version(lead, dict(lead, **changes))
+            updated.append(leads[i])
+    if updated:
+        backend.save_leads(leads)
+    return updated
+
+def _fallback_delete_lead(backend, lead_id, version=None):
+    leads = backend.load_leads()
+    i = _find_by_id(leads, lead_id)
+    if version is not None:
+        check_version(leads[i] if i is not None else None, {"id": lead_id, "version": version}, "Lead")
+    if i is not None:
+        del leads[i]
+        backend.save_leads(leads)
+
+def _fallback_query_leads(backend, filters=None, order=None, limit=None, offset=0):
+    normalized = normalize_lead_filters(filters)
+    matches = [lead for lead in backend.load_leads() if lead_matches(lead, normalized)]
+    return sort_and_slice_leads(matches, order, limit, offset)
+
+def _fallback_page_leads(backend, filters=None, order=None, limit=50, after=None):
+    normalized = normalize_lead_filters(filters)
+    matches = (lead for lead in backend.load_leads() if lead_matches(lead, normalized))
+    return page_of_leads(matches, order, limit, after)
+
+def _fallback_iter_leads(backend, filters=None, order=None, chunk_size=1000):
+    # The other backends hold the leads in memory already, so this only slices them
+    leads = _fallback_query_leads(backend, filters, order)
+    for start in range(0, len(leads), chunk_size):
+        yield leads[start:start + chunk_size]
+
+def _fallback_count_leads(backend, filters=None):
+    normalized = normalize_lead_filters(filters)
+    return sum(1 for lead in backend.load_leads() if lead_matches(lead, normalized))
+
+def _fallback_peek_counter(backend, name):
+    # Derived from the data on every call; backends should provide persistent counters
+    leads = backend.load_leads()
+    if name == "lead_id":
+        return max((lead["id"] for lead in leads), default=0) + 1
+    if name == "customer_code":
+        numbers = (parse_customer_code(lead.get("customer_code")) for lead in leads)
+        return max((number for number in numbers if number is not None), default=0) + 1
+    raise ValueError(f"Unknown counter: {name}")
+
+def _fallback_allocate_counter(backend, name, count=1):
+    # Reserving values can't be done safely on top of the other functions
+    raise StorageError("backend must implement allocate_counter")
+
+def _fallback_upsert_user(backend, user):
+    users = backend.load_users()
+    i = _find_by_id(users, user["id"])
+    check_version(users[i] if i is not None else None, user, "User")
+    check_unique_username(users, user)
+    user = next_version(user)
+    if i is not None:
+        users[i] = user
+    else:
+        users.append(user)
+    backend.save_users(users)
+    return user
+
+def _fallback_delete_user(backend, user_id, version=None):
+    users = backend.load_users()
+    i = _find_by_id(users, user_id)
+    if version is not None:
+        check_version(users[i] if i is not None else None, {"id": user_id, "version": version}, "User")
+    if i is not None:
+        del users[i]
+        backend.save_users(users)
+
+def _fallback_update_users_last_login(backend, logins):
+    # One load/save of the whole user list per batch
+    by_name = {username.lower(): timestamp for username, timestamp in logins.items()}
+    users = backend.load_users()
+    for user in users:
+        timestamp = by_name.get(user["username"].lower())
+        if timestamp is not None:
+            user["last_login"] = timestamp
+    backend.save_users(users)
+
+def _fallback_data_version(backend, collection):
+    # No cheap change marker: caches fall back to a time-to-live
+    return None
+
+_FALLBACKS = {
+    "upsert_lead": _fallback_upsert_lead,
+    "insert_leads": _fallback_insert_leads,
+    "update_leads": _fallback_update_leads,
+    "delete_lead": _fallback_delete_lead,
+    "query_leads": _fallback_query_leads,
+    "page_leads": _fallback_page_leads,
+    "iter_leads": _fallback_iter_leads,
+    "count_leads": _fallback_count_leads,
+    "peek_counter": _fallback_peek_counter,
+    "allocate_counter": _fallback_allocate_counter,
+    "upsert_user": _fallback_upsert_user,
+    "delete_user": _fallback_delete_user,
+    "update_users_last_login": _fallback_update_users_last_login,
+    "data_version": _fallback_data_version,
+}
+
+def _call(name, *args):
+    """Call an interface function on the backend, using the generic fallback if it has none"""
+    backend = get_backend()
+    func = getattr(backend, name, None)
+    if func is not None:
+        return func(*args)
+    return _FALLBACKS[name](backend, *args)
+
+def data_version(collection):
+    """
+    Get a cheap marker that changes whenever the stored collection changes
+
+    Args:
+        collection (str): "leads" or "users"
+
+    Returns:
+        A comparable token (e.g. file mtimes and sizes), or None if the backend can't tell
+    """
+    return _call("data_version", collection)
+
+def load_leads():
+    """Load all leads"""
+    return _call("load_leads")
+
+def save_leads(leads):
+    """Replace the full list of leads (bulk loads and migrations; versions aren't checked)"""
+    _notify_before("save_leads")
+    _call("save_leads", leads)
+    _notify("save_leads", leads)
+
+def upsert_lead(lead):
+    """
+    Insert or replace a single lead by id
+
+    Args:
+        lead (dict): The lead, with the version it was read at (none for a new lead)
+
+    Returns:
+        dict: The stored lead, with its new version
+
+    Raises:
+        ConflictError: If the stored lead was changed or deleted since that version
+    """
+    _notify_before("upsert_lead")
+    lead = _call("upsert_lead", lead)
+    _notify("upsert_lead", lead)
+    return lead
+
+def insert_leads(leads):
+    """
+    Insert a batch of new leads in one write (bulk imports)
+
+    Args:
+        leads (list): New leads, with ids and customer codes already allocated
+
+    Returns:
+        list: The stored leads, with their versions
+
+    Raises:
+        ConflictError: If a lead with one of the ids already exists (nothing is stored)
+    """
+    _notify_before("insert_leads")
+    leads = _call("insert_leads", leads)
+    _notify("insert_leads", leads)
+    return leads
+
+def update_leads(lead_ids, changes, filters=None):
+    """
+    Set the same field values on a batch of leads in one write (bulk reassignment)
+
+    The leads are changed as stored at the time of the write, not from a copy, so no
+    versions are checked; instead a lead that no longer matches filters (e.g. was
+    reassigned by someone else since the preview) is left alone.
+
+    Args:
+        lead_ids (iterable): Ids of the leads to change
+        changes (dict): Field -> new value
+        filters (dict): Filters as accepted by query_leads the leads must still match
+
+    Returns:
+        list: The changed leads, with their new versions
+    """
+    _notify_before("update_leads")
+    leads = _call("update_leads", lead_ids, changes, filters)
+    _notify("update_leads", leads)
+    return leads
+
+def delete_lead(lead_id, version=None):
+    """Delete a single lead by id (only if it still has `version`, when given)"""
+    _notify_before("delete_lead")
+    _call("delete_lead", lead_id, version)
+    _notify("delete_lead", lead_id)
+
+def query_leads(filters=None, order=None, limit=None, offset=0):
+    """Query leads by field filters, with optional ordering and paging"""
+    return _call("query_leads", filters, order, limit, offset)
+
+def page_leads(filters=None, order=None, limit=50, after=None):
+    """
+    Get one page of the leads matching filters, by cursor (keyset pagination)
+
+    Args:
+        filters (dict): Field values to match, as for query_leads
+        order (str): Field to sort by, prefixed with '-' for descending (default "id")
+        limit (int): Page size
+        after: Cursor returned with the previous page (None for the first page)
+
+    Returns:
+        tuple: (leads on the page, cursor of the next page or None on the last page)
+    """
+    return _call("page_leads", filters, order, limit, after)
+
+def iter_leads(filters=None, order=None, chunk_size=1000):
+    """
+    Iterate over the leads matching filters in sort order, chunk_size leads at a time
+
+    Backends that can stream (SQLite) read one chunk at a time, so a long export
+    never holds every lead at once.
+
+    Yields:
+        list: The next chunk of matching leads
+    """
+    return _call("iter_leads", filters, order, chunk_size)
+
+def count_leads(filters=None):
+    """Count leads matching the given filters"""
+    return _call("count_leads", filters)
+
+def peek_counter(name):
+    """Get the next value of a persistent counter without reserving it"""
+    return _call("peek_counter", name)
+
+def allocate_counter(name, count=1):
+    """Atomically reserve `count` consecutive counter values and return the first"""
+    _notify_before("allocate_counter")
+    first = _call("allocate_counter", name, count)
+    _notify("allocate_counter", name)
+    return first
+
+def get_next_lead_id():
+    """Get the next lead ID (for display; use allocate_lead_id when saving)"""
+    return peek_counter("lead_id")
+
+def get_next_customer_code():
+    """Get the next customer code (for display; use allocate_customer_code when saving)"""
+    return format_customer_code(peek_counter("customer_code"))
+
+def allocate_lead_id():
+    """Reserve a lead ID that no other session can get"""
+    return allocate_counter("lead_id")
+
+def allocate_customer_code():
+    """Reserve a customer code that no other session can get"""
+    return format_customer_code(allocate_counter("customer_code"))
+
+def load_users():
+    """Load all users"""
+    return _call("load_users")
+
+def save_users(users):
+    """Replace the full list of users (seeding and migrations; versions aren't checked)"""
+    _notify_before("save_users")
+    _call("save_users", users)
+    _notify("save_users", users)
+
+def upsert_user(user):
+    """
+    Insert or replace a single user by id
+
+    Returns:
+        dict: The stored user, with its new version
+
+    Raises:
+        ConflictError: If the stored user was changed or deleted since the user's version
+    """
+    _notify_before("upsert_user")
+    user = _call("upsert_user", user)
+    _notify("upsert_user", user)
+    return user
+
+def delete_user(user_id, version=None):
+    """Delete a single user by id (only if it still has `version`, when given)"""
+    _notify_before("delete_user")
+    _call("delete_user", user_id, version)
+    _notify("delete_user", user_id)
+
+def update_users_last_login(logins):
+    """
+    Set the last login timestamp of several users in one write
+
+    Args:
+        logins (dict): username (case-insensitive) -> "YYYY-MM-DD HH:MM" timestamp
+    """
+    _notify_before("update_users_last_login")
+    _call("update_users_last_login", logins)
+    _notify("update_users_last_login", logins)
+
+def update_user_last_login(username):
+    """Update the last login timestamp for a user right away (logins go through login_tracker)"""
+    update_users_last_login({username: datetime.now().strftime("%Y-%m-%d %H:%M")})
@@ -0,0 +1,164 @@
+"""
+Multi-process stress test for concurrent writes through storage
+
+Usage:
+    python stress_concurrent_writes.py [processes] [increments] [backends]
+
+    Starts `processes` worker processes (default 8) against a fresh data directory.
+    Each one increments a counter field on the same lead and on the same user
+    `increments` times (default 50), the way an editing session does: read the
+    record, change it, save it with the version it was read at, and re-read and
+    retry on ConflictError. Each worker also reserves lead ids with
+    allocate_counter. Afterwards the counters must equal processes x increments
+    and no id may have been handed out twice.
+
+    For comparison, a second round increments another lead the old way, by saving
+    a whole (stale) copy of the leads with save_leads, which loses updates.
+
+    backends is a comma-separated list (default json,sqlite); the memory backend
+    keeps its data per process, so it can't be tested this way. Exits with status
+    1 if a versioned update was lost or an id was reserved twice.
+"""
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import time
+
+import local_db
+import sqlite_db
+import storage
+
+LEAD_ID = 1
+BLIND_LEAD_ID = 2  # only written with save_leads, which replaces every lead unchecked
+USER_ID = 1
+
+
+def use_directory(directory):
+    """Point the file-based backends at `directory`"""
+    local_db.LEADS_FILE = os.path.join(directory, "leads.json")
+    local_db.LEADS_LOG_FILE = os.path.join(directory, "leads.log")
+    local_db.COUNTERS_FILE = os.path.join(directory, "counters.json")
+    local_db.USERS_FILE = os.path.join(directory, "users.json")
+    local_db._leads = None
+    sqlite_db.DB_FILE = os.path.join(directory, "evergreen.db")
+
+
+def seed(directory, backend):
+    use_directory(directory)
+    storage.set_backend(backend)
+    storage.save_leads([
+        {"id": LEAD_ID, "name": "Stress Test", "status": "Open", "hits": 0},
+        {"id": BLIND_LEAD_ID, "name": "Stress Test (save_leads)", "status": "Open", "hits": 0},
+    ])
+    storage.save_users([{
+        "id": USER_ID, "username": "stress", "name": "Stress Test", "email": "",
+        "role": "sales", "status": "Active", "hits": 0
+    }])
+
+
+def increment(load, save):
+    """Read-modify-write one record until the save isn't refused; return the retries"""
+    retries = 0
+    while True:
+        record = load()
+        record["hits"] += 1
+        try:
+            save(record)
+            return retries
+        except storage.ConflictError:
+            retries += 1
+
+
+def worker(directory, backend, increments, versioned, results):
+    use_directory(directory)
+    storage.set_backend(backend)
+
+    conflicts = 0
+    reserved = []
+    for _ in range(increments):
+        if versioned:
+            conflicts += increment(lambda: storage.query_leads({"id": LEAD_ID})[0], storage.upsert_lead)
+            conflicts += increment(
+                lambda: next(user for user in storage.load_users() if user["id"] == USER_ID),
+                storage.upsert_user
+            )
+            reserved.append(storage.allocate_counter("lead_id"))
+        else:
+            # The old way: save this session's copy of every lead, stale or not
+            leads = storage.load_leads()
+            next(lead for lead in leads if lead["id"] == BLIND_LEAD_ID)["hits"] += 1
+            storage.save_leads(leads)
+
+    results.put((conflicts, reserved))
+
+
+def run_workers(directory, backend, processes, increments, versioned):
+    """Run the workers to completion and return their (conflicts, reserved ids) results"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [
+        context.Process(target=worker, args=(directory, backend, increments, versioned, results))
+        for _ in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    outcomes = []
+    while len(outcomes) < len(workers):
+        try:
+            outcomes.append(results.get(timeout=1))
+        except queue.Empty:
+            if any(process.exitcode not in (None, 0) for process in workers):
+                raise RuntimeError("A worker process failed")
+    for process in workers:
+        process.join()
+    return outcomes
+
+
+def run_backend(backend, processes, increments):
+    with tempfile.TemporaryDirectory() as directory:
+        seed(directory, backend)
+
+        start = time.perf_counter()
+        outcomes = run_workers(directory, backend, processes, increments, versioned=True)
+        elapsed = time.perf_counter() - start
+        run_workers(directory, backend, processes, increments, versioned=False)
+
+        use_directory(directory)
+        storage.set_backend(backend)
+        lead = storage.query_leads({"id": LEAD_ID})[0]
+        blind_lead = storage.query_leads({"id": BLIND_LEAD_ID})[0]
+        user = next(user for user in storage.load_users() if user["id"] == USER_ID)
+
+    expected = processes * increments
+    conflicts = sum(conflicts for conflicts, _ in outcomes)
+    reserved = [value for _, values in outcomes for value in values]
+    duplicates = len(reserved) - len(set(reserved))
+
+    print(f"{backend}: {processes} processes x {increments} increments in {elapsed:.1f} s")
+    print(f"  lead hits:      {lead['hits']}/{expected} (version {lead['version']}, {conflicts} conflicts retried)")
+    print(f"  user hits:      {user['hits']}/{expected} (version {user['version']})")
+    print(f"  reserved ids:   {len(reserved)}, {duplicates} duplicates")
+    print(f"  save_leads:     {blind_lead['hits']}/{expected} ({expected - blind_lead['hits']} lost updates)")
+    return lead["hits"] == expected and user["hits"] == expected and duplicates == 0
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    increments = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    backends = (sys.argv[3] if len(sys.argv) > 3 else "json,sqlite").split(",")
+    if "memory" in backends:
+        sys.exit("The memory backend keeps its data per process; test json or sqlite")
+
+    ok = True
+    for backend in backends:
+        ok = run_backend(backend, processes, increments) and ok
+
+    if not ok:
+        print("Lost updates or duplicate ids with versioned writes")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,160 @@
 import streamlit as st
-from admin_view import admin_view
-from sales_view import sales_rep_view
 from auth import logout_user
+import activity_log
 
-# This file serves as a wrapper to import the specific view modules
+# Helpers shared by the admin and sales rep views: remembering the version an edit
+# form started from (edit_base_version, forget_edit_base, conflict_notification) and
+# paging through or picking leads (lead_pager, lead_picker).
+# router() shows the view of the user's role. The view modules are imported inside it,
+# so their dependencies (pandas, charts, the sales data) load only once a user of that
+# role opens the dashboard, not for the login page.
+
+def edit_base_version(form_key, record, widget_keys=()):
+    """
+    Get the version a record had when its edit form was opened
+
+    Streamlit reruns the page on every click, so the record read while handling "Save"
+    already includes changes other people made meanwhile. The version the form started
+    from is kept in the session and sent with the save, so storage can refuse it
+    (ConflictError) instead of overwriting those changes. When another record is
+    opened, the form's widgets (widget_keys) are reset to show it.
+    """
+    state_key = f"{form_key}_base_version"
+    base = st.session_state.get(state_key)
+    if base is None or base[0] != record["id"]:
+        if base is not None:
+            for key in widget_keys:
+                st.session_state.pop(key, None)
+        base = (record["id"], record.get("version") or 0)
+        st.session_state[state_key] = base
+    return base[1]
+
+def forget_edit_base(form_key, widget_keys=()):
+    """
+    Forget the remembered version once the form was saved or refused
+
+    The form's widgets (widget_keys) are reset too, so after a refused save the form
+    shows the current record again instead of the edit based on the old one.
+    """
+    st.session_state.pop(f"{form_key}_base_version", None)
+    for key in widget_keys:
+        st.session_state.pop(key, None)
+
+def conflict_notification(error):
+    """Build the notification shown when a save was refused because of a concurrent edit"""
+    return {"type": "error", "message": f"{error}. Your changes were not saved; check the current values and try again."}
+
+# Sort orders and page sizes offered by lead_pager
+LEAD_SORT_OPTIONS = {
+    "Newest first": "-date_created",
+    "Oldest first": "date_created",
+    "Lead ID": "id",
+    "Customer code": "customer_code",
+    "Status": "status",
+}
+LEAD_PAGE_SIZES = [25, 50, 100, 200]
+
+# Number of matches lead_picker adds per "Show more matches"
+LEAD_PICKER_BATCH = 20
+
+def lead_pager(key, filters):
+    """
+    Show sort, page size and Previous/Next controls for the leads matching filters
+
+    Only the current page is read and sent to the browser, so a rerun costs the same
+    at any number of leads. Pages are addressed by cursor (the sort key of the last
+    lead of the previous page), kept in the session per key; changing the filters,
+    order or page size starts again from the first page.
+
+    Returns:
+        tuple: (read-only leads on the current page, number of matching leads)
+    """
+    import lead_index
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        sort_label = st.selectbox("Sort by", list(LEAD_SORT_OPTIONS), key=f"{key}_sort")
+    with col2:
+        page_size = st.selectbox("Rows per page", LEAD_PAGE_SIZES, index=1, key=f"{key}_page_size")
+    order = LEAD_SORT_OPTIONS[sort_label]
+    
+    signature = repr((sorted(filters.items()), order, page_size))
+    pages = st.session_state.get(f"{key}_pages")
+    if pages is None or pages["signature"] != signature:
+        pages = {"signature": signature, "cursors": [None]}
+        st.session_state[f"{key}_pages"] = pages
+    
+    total = lead_index.count_leads(filters)
+    leads, next_cursor = lead_index.page_leads(filters, order, page_size, pages["cursors"][-1])
+    # Step back if the leads of this page were deleted meanwhile
+    while not leads and len(pages["cursors"]) > 1:
+        pages["cursors"].pop()
+        leads, next_cursor = lead_index.page_leads(filters, order, page_size, pages["cursors"][-1])
+    
+    page = len(pages["cursors"])
+    page_count = max(1, -(-total // page_size))
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        if st.button("Previous", key=f"{key}_prev_page", disabled=page == 1):
+            pages["cursors"].pop()
+            st.rerun()
+    with col2:
+        if st.button("Next", key=f"{key}_next_page", disabled=next_cursor is None):
+            pages["cursors"].append(next_cursor)
+            st.rerun()
+    with col3:
+        st.caption(f"Page {page} of {page_count} · {total} leads")
+    
+    return leads, total
+
+def lead_picker(label, key, filters=None, default_leads=()):
+    """
+    Pick a lead by searching, instead of a selectbox of every lead
+
+    Until something is typed the choices are default_leads (e.g. the page on screen).
+    A search shows the best LEAD_PICKER_BATCH matches from search_index, and "Show
+    more matches" loads the next batch.
+
+    Returns:
+        int: The picked lead id, or None if there is nothing to pick
+    """
+    import search_index
+    
+    query = st.text_input(
+        "Search leads",
+        placeholder="Name, phone, customer code, remarks or #ID",
+        key=f"{key}_search"
+    ).strip()
+    
+    # Start again from one batch whenever the search changes
+    shown = st.session_state.get(f"{key}_limit")
+    if shown is None or shown[0] != query:
+        shown = (query, LEAD_PICKER_BATCH)
+        st.session_state[f"{key}_limit"] = shown
+    
+    if query:
+        leads, more = search_index.search_leads(query, filters, shown[1])
+    else:
+        leads, more = list(default_leads), False
+    
+    if not leads:
+        st.info("No leads match your search.")
+        return None
+    
+    options = {lead["id"]: f"Lead #{lead['id']} - {lead['name']}" for lead in leads}
+    selected_id = st.selectbox(label, list(options), format_func=options.get, key=key)
+    
+    if more and st.button("Show more matches", key=f"{key}_more"):
+        st.session_state[f"{key}_limit"] = (query, shown[1] + LEAD_PICKER_BATCH)
+        st.rerun()
+    
+    return selected_id
 
 def router():
     """Route users to the appropriate view based on their role"""
+    # Writes made in this run are logged as the user's
+    activity_log.set_actor(st.session_state.username)
+    
     # Add a logout button in the sidebar
     with st.sidebar:
         st.write(f"Logged in as: **{st.session_state.display_name}**")
@@ -18,8 +166,10 @@ def router():
     
     # Route to the appropriate view based on role
     if st.session_state.role == "admin":
+        from admin_view import admin_view
         admin_view()
     elif st.session_state.role == "sales":
+        from sales_view import sales_rep_view
         sales_rep_view(st.session_state.username)
     else:
         st.error("Unknown role. Please contact administrator.")